@@ -0,0 +1,59 @@
+import json
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional
+
+DEFAULT_ACCOUNT = "default"
+
+
+@dataclass(frozen=True)
+class Account:
+    """A Z.ai / Zhipu account polled by the service."""
+
+    name: str
+    base_url: str
+    auth_token: str
+    # Chats allowed to subscribe to and read this account; admins always may
+    chat_ids: FrozenSet[str] = frozenset()
+
+
+def parse_accounts(raw, base_url: str = "", auth_token: str = "") -> List[Account]:
+    """Accounts from a list of {"name", "base_url", "auth_token", optional "chat_ids"} dicts or its JSON text.
+
+    Without a list, base_url / auth_token form the "default" account.
+    """
+    if raw:
+        items = json.loads(raw) if isinstance(raw, str) else raw
+        return [
+            Account(
+                name=item["name"],
+                base_url=item["base_url"],
+                auth_token=item["auth_token"],
+                chat_ids=frozenset(str(chat_id) for chat_id in item.get("chat_ids", ())),
+            )
+            for item in items
+        ]
+
+    if not base_url:
+        return []
+    return [Account(name=DEFAULT_ACCOUNT, base_url=base_url, auth_token=auth_token)]
+
+
+def load_accounts() -> List[Account]:
+    """Load configured accounts.
+
+    ACCOUNTS may hold a JSON list like
+    [{"name": "team", "base_url": "https://api.z.ai/api/anthropic", "auth_token": "...", "chat_ids": ["123456"]}].
+    Without it, ANTHROPIC_BASE_URL / ANTHROPIC_AUTH_TOKEN form the "default" account.
+    An `accounts` list in CONFIG_FILE replaces both and can change at runtime.
+    """
+    from config import config
+
+    return list(config.current.accounts)
+
+
+def get_account(name: str) -> Optional[Account]:
+    """Find a configured account by name."""
+    for account in load_accounts():
+        if account.name == name:
+            return account
+    return None
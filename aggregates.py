@@ -0,0 +1,243 @@
+"""Cross-account aggregates over the latest state of every account.
+
+persist_snapshots() calls apply_snapshot() for each snapshot it stores, in
+the same transaction, so account_summary, model_code_usage and
+quota_headroom always describe each account's newest snapshot. The JSON
+breakdowns are decoded once here, at write time. Fleet-wide answers then
+come from one small grouped query over one row per account (or per account
+and model code), however many snapshots are stored.
+"""
+import html
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import case, delete, func, select
+
+from db_models import AccountSummary, ModelCodeUsage, QuotaHeadroom, async_session, dialect_insert
+
+TOP_ACCOUNTS = 10
+
+
+@dataclass
+class ModelCodeTotal:
+    model_code: str
+    source: str
+    usage: int
+    accounts: int
+
+
+@dataclass
+class AccountBurn:
+    account: str
+    tokens_24h: int
+    calls_24h: int
+    total_tokens_usage: int
+
+
+@dataclass
+class FleetHeadroom:
+    type: str
+    accounts: int
+    avg_percentage: float
+    max_percentage: float
+    tightest_account: str
+    remaining: Optional[int]
+    total: Optional[int]
+
+
+def _model_code_usage(snapshot: dict) -> dict:
+    """{(source, model_code): usage} from a build_snapshot() record."""
+    usage = {}
+    for quota in snapshot["quotas"]:
+        for detail in json.loads(quota.get("usage_details_json") or "[]"):
+            key = (quota["type"], detail["model_code"])
+            usage[key] = usage.get(key, 0) + detail["usage"]
+    for detail in json.loads(snapshot["tool"]["tool_details_json"] or "[]"):
+        key = ("tool", detail["model_name"])
+        usage[key] = usage.get(key, 0) + detail["total_usage_count"]
+    return usage
+
+
+async def apply_snapshot(session, snapshot: dict) -> bool:
+    """Fold a stored snapshot into the aggregates; False if a newer one is already there."""
+    account = snapshot["account"]
+    created_at = datetime.fromisoformat(snapshot["created_at"])
+    window = created_at - timedelta(hours=24)
+    recent = [p for p in snapshot["series"] if datetime.fromisoformat(p["time"]) >= window]
+    summary = {
+        "account": account,
+        "created_at": created_at,
+        **snapshot["model"],
+        "calls_24h": sum(p["call_count"] or 0 for p in recent),
+        "tokens_24h": sum(p["tokens_usage"] or 0 for p in recent),
+    }
+    stmt = dialect_insert(AccountSummary).values(**summary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["account"],
+        set_={k: v for k, v in summary.items() if k != "account"},
+        where=AccountSummary.created_at < stmt.excluded.created_at,
+    ).returning(AccountSummary.id)
+    if (await session.execute(stmt)).scalar_one_or_none() is None:
+        return False
+
+    usage = _model_code_usage(snapshot)
+    if usage:
+        stmt = dialect_insert(ModelCodeUsage)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["account", "source", "model_code"],
+                set_={"usage": stmt.excluded.usage, "created_at": stmt.excluded.created_at},
+            ),
+            [
+                {"account": account, "source": source, "model_code": code, "usage": value, "created_at": created_at}
+                for (source, code), value in usage.items()
+            ],
+        )
+    # Codes missing from the newest snapshot no longer count
+    await session.execute(
+        delete(ModelCodeUsage).where(ModelCodeUsage.account == account, ModelCodeUsage.created_at < created_at)
+    )
+
+    if snapshot["quotas"]:
+        stmt = dialect_insert(QuotaHeadroom)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["account", "type"],
+                set_={
+                    "percentage": stmt.excluded.percentage,
+                    "current_usage": stmt.excluded.current_usage,
+                    "total": stmt.excluded.total,
+                    "created_at": stmt.excluded.created_at,
+                },
+            ),
+            [
+                {
+                    "account": account,
+                    "type": q["type"],
+                    "percentage": q["percentage"],
+                    "current_usage": q["current_usage"],
+                    "total": q["total"],
+                    "created_at": created_at,
+                }
+                for q in snapshot["quotas"]
+            ],
+        )
+    await session.execute(
+        delete(QuotaHeadroom).where(QuotaHeadroom.account == account, QuotaHeadroom.created_at < created_at)
+    )
+    return True
+
+
+async def model_code_totals(source: str = None) -> List[ModelCodeTotal]:
+    """Usage per model code summed over every account's latest snapshot."""
+    stmt = (
+        select(
+            ModelCodeUsage.model_code,
+            ModelCodeUsage.source,
+            func.sum(ModelCodeUsage.usage),
+            func.count(ModelCodeUsage.account),
+        )
+        .group_by(ModelCodeUsage.model_code, ModelCodeUsage.source)
+        .order_by(func.sum(ModelCodeUsage.usage).desc())
+    )
+    if source:
+        stmt = stmt.where(ModelCodeUsage.source == source)
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return [ModelCodeTotal(code, src, int(usage), accounts) for code, src, usage, accounts in result]
+
+
+async def token_burn_ranking(limit: int = TOP_ACCOUNTS) -> List[AccountBurn]:
+    """Accounts with the most tokens over the 24 hours before their latest snapshot."""
+    stmt = (
+        select(
+            AccountSummary.account,
+            AccountSummary.tokens_24h,
+            AccountSummary.calls_24h,
+            AccountSummary.total_tokens_usage,
+        )
+        .order_by(AccountSummary.tokens_24h.desc(), AccountSummary.account)
+        .limit(limit)
+    )
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return [AccountBurn(*row) for row in result]
+
+
+async def quota_headroom() -> List[FleetHeadroom]:
+    """Per quota type: how close the fleet is to its limits, and the tightest account."""
+    # Limits reported without counts only contribute percentages
+    known = QuotaHeadroom.total.is_not(None) & QuotaHeadroom.current_usage.is_not(None)
+    remaining = case((known, QuotaHeadroom.total - QuotaHeadroom.current_usage))
+    capacity = case((known, QuotaHeadroom.total))
+    ranked = select(
+        QuotaHeadroom.type,
+        QuotaHeadroom.account,
+        QuotaHeadroom.percentage,
+        func.row_number().over(
+            partition_by=QuotaHeadroom.type,
+            order_by=(QuotaHeadroom.percentage.desc(), QuotaHeadroom.account),
+        ).label("rank"),
+    ).subquery()
+    tightest = select(ranked.c.type, ranked.c.account).where(ranked.c.rank == 1).subquery()
+    stmt = (
+        select(
+            QuotaHeadroom.type,
+            func.count(),
+            func.avg(QuotaHeadroom.percentage),
+            func.max(QuotaHeadroom.percentage),
+            tightest.c.account,
+            func.sum(remaining),
+            func.sum(capacity),
+        )
+        .join(tightest, tightest.c.type == QuotaHeadroom.type)
+        .group_by(QuotaHeadroom.type, tightest.c.account)
+        .order_by(func.max(QuotaHeadroom.percentage).desc())
+    )
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return [
+            FleetHeadroom(
+                type, accounts, float(avg), float(peak), account,
+                int(left) if left is not None else None,
+                int(total) if total is not None else None,
+            )
+            for type, accounts, avg, peak, account, left, total in result
+        ]
+
+
+def format_model_totals(totals: List[ModelCodeTotal]) -> str:
+    lines = ["<b>🧮 Usage per model, all accounts</b>\n"]
+    if not totals:
+        lines.append("No per-model usage recorded yet.")
+    for total in totals:
+        lines.append(
+            f"• {html.escape(total.model_code)} ({total.source}): {total.usage:,} across {total.accounts} accounts"
+        )
+    return "\n".join(lines)
+
+
+def format_burn_ranking(ranking: List[AccountBurn]) -> str:
+    lines = ["<b>🔥 Token burn, last 24 hours</b>\n"]
+    if not ranking:
+        lines.append("No accounts recorded yet.")
+    for place, row in enumerate(ranking, 1):
+        lines.append(f"{place}. {html.escape(row.account)}: {row.tokens_24h:,} tokens, {row.calls_24h:,} calls")
+    return "\n".join(lines)
+
+
+def format_headroom(headroom: List[FleetHeadroom]) -> str:
+    lines = ["<b>📊 Fleet quota headroom</b>\n"]
+    if not headroom:
+        lines.append("No quota limits recorded yet.")
+    for row in headroom:
+        line = (
+            f"• {row.type}: avg {row.avg_percentage:.1f}% used over {row.accounts} accounts, "
+            f"tightest {html.escape(row.tightest_account)} at {row.max_percentage:.1f}%"
+        )
+        if row.remaining is not None and row.total:
+            line += f", {row.remaining:,} of {row.total:,} left"
+        lines.append(line)
+    return "\n".join(lines)
@@ -14,9 +14,16 @@ from db_models import ModelUsage, ToolUsage, QuotaLimit
 # access to the values within the .ini file in use.
 config = context.config
 
-# Use DATABASE_URL from environment if available
+# Use DATABASE_URL from environment if available; migrations run on the
+# sync drivers, so async driver suffixes are dropped
 database_url = os.getenv("DATABASE_URL")
 if database_url:
+    for async_prefix, sync_prefix in (
+        ("postgresql+asyncpg://", "postgresql://"),
+        ("sqlite+aiosqlite://", "sqlite://"),
+    ):
+        if database_url.startswith(async_prefix):
+            database_url = database_url.replace(async_prefix, sync_prefix)
     config.set_main_option("sqlalchemy.url", database_url)
 
 # Interpret the config file for Python logging.
@@ -73,9 +80,22 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite cannot ALTER most things in place; batch ops copy the table
+            render_as_batch=connection.dialect.name == "sqlite",
         )
 
+        if connection.dialect.name == "sqlite" and not connection.dialect.has_table(
+            connection, "alembic_version"
+        ):
+            # The revision history is Postgres-specific (partitioning etc.), so a
+            # fresh SQLite database is created from the models and stamped at head.
+            target_metadata.create_all(connection)
+            context.get_context().stamp(context.script, "head")
+            connection.commit()
+            return
+
         with context.begin_transaction():
             context.run_migrations()
 
@@ -0,0 +1,50 @@
+"""Add account columns to usage tables and subscription table
+
+Revision ID: 5b1e7c2a9d40
+Revises: 2267c9dcb21c
+Create Date: 2026-10-19 10:12:41.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7c2a9d40'
+down_revision: Union[str, Sequence[str], None] = '2267c9dcb21c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+USAGE_TABLES = ('model_usage', 'model_usage_time_series', 'tool_usage', 'quota_limit')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows belong to the single account configured so far
+    for table in USAGE_TABLES:
+        op.add_column(table, sa.Column('account', sa.String(), nullable=False, server_default='default'))
+        op.create_index(op.f(f'ix_{table}_account'), table, ['account'], unique=False)
+
+    op.create_table('subscription',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('chat_id', sa.String(), nullable=False),
+    sa.Column('account', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chat_id', 'account', name='uq_subscription_chat_account')
+    )
+    op.create_index(op.f('ix_subscription_chat_id'), 'subscription', ['chat_id'], unique=False)
+    op.create_index(op.f('ix_subscription_account'), 'subscription', ['account'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_subscription_account'), table_name='subscription')
+    op.drop_index(op.f('ix_subscription_chat_id'), table_name='subscription')
+    op.drop_table('subscription')
+
+    for table in reversed(USAGE_TABLES):
+        op.drop_index(op.f(f'ix_{table}_account'), table_name=table)
+        op.drop_column(table, 'account')
@@ -0,0 +1,30 @@
+"""Track late rows and raw-row compaction in usage_archive
+
+Revision ID: 6d3b9f0c2e71
+Revises: 4e7a91c3d2b8
+Create Date: 2026-10-19 23:02:17.418530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d3b9f0c2e71'
+down_revision: Union[str, Sequence[str], None] = '4e7a91c3d2b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('usage_archive', sa.Column('through_id', sa.Integer(), nullable=True))
+    op.add_column('usage_archive', sa.Column('compacted', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('usage_archive', 'compacted')
+    op.drop_column('usage_archive', 'through_id')
@@ -10,7 +10,14 @@ import json
 
 from alembic import op
 import sqlalchemy as sa
-from datetime import timedelta
+
+from migration_helpers import (
+    JSONB_ARRAY_FUNCTION,
+    batched_backfill,
+    batched_rewrite,
+    create_jsonb_array_function,
+    has_column,
+)
 
 
 # revision identifiers, used by Alembic.
@@ -19,45 +26,65 @@ down_revision: Union[str, Sequence[str], None] = 'e43c4c7bd8c2'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
+# "2026-01-05 20:00" -> {"time": "2026-01-05 20:00+08:00", "call_count": null} (Beijing, UTC+8).
+# Malformed JSON becomes '[]' like in the per-row fallback.
+MERGE_SQL = f"""
+    UPDATE model_usage m
+    SET time_series_json = COALESCE((
+        SELECT json_agg(json_build_object('time', x.t || '+08:00', 'call_count', NULL) ORDER BY x.ord)::text
+        FROM jsonb_array_elements_text({JSONB_ARRAY_FUNCTION}(m.x_time_json)) WITH ORDINALITY AS x(t, ord)
+    ), '[]')
+    WHERE m.id > :lo AND m.id <= :hi
+"""
+
+SPLIT_SQL = f"""
+    UPDATE model_usage m
+    SET x_time_json = COALESCE((
+        SELECT json_agg(split_part(p.value->>'time', '+', 1) ORDER BY p.ord)::text
+        FROM jsonb_array_elements({JSONB_ARRAY_FUNCTION}(m.time_series_json)) WITH ORDINALITY AS p(value, ord)
+    ), '[]')
+    WHERE m.id > :lo AND m.id <= :hi
+"""
+
+
+def _merge_rows(rows):
+    for row_id, x_time_json in rows:
+        try:
+            x_times = json.loads(x_time_json) if x_time_json else []
+        except ValueError:
+            x_times = []
+        time_series = [{"time": f"{time_str}+08:00", "call_count": None} for time_str in x_times]
+        yield {"id": row_id, "value": json.dumps(time_series)}
+
+
+def _split_rows(rows):
+    for row_id, ts_json in rows:
+        try:
+            time_series = json.loads(ts_json) if ts_json else []
+        except ValueError:
+            time_series = []
+        x_times = [str(t["time"]).split("+")[0] for t in time_series]
+        yield {"id": row_id, "value": json.dumps(x_times)}
+
 
 def upgrade() -> None:
     """Upgrade schema."""
-    # Add new column as nullable first
-    op.add_column('model_usage', sa.Column('time_series_json', sa.String(), nullable=True))
+    # Add new column as nullable first (guarded so a resumed run skips it)
+    if not has_column('model_usage', 'time_series_json'):
+        op.add_column('model_usage', sa.Column('time_series_json', sa.String(), nullable=True))
 
     # Migrate existing data from x_time_json to time_series_json
-    connection = op.get_bind()
-    result = connection.execute(sa.text("SELECT id, x_time_json FROM model_usage"))
-
-    for row in result:
-        row_id, x_time_json = row
-        if x_time_json:
-            try:
-                x_times = json.loads(x_time_json)
-                # Create time series with Beijing timezone (UTC+8)
-                time_series = []
-                for time_str in x_times:
-                    # Parse "2026-01-05 20:00" and add Beijing timezone (+08:00)
-                    time_series.append({
-                        "time": f"{time_str}+08:00",
-                        "call_count": None
-                    })
-                connection.execute(
-                    sa.text("UPDATE model_usage SET time_series_json = :ts WHERE id = :id"),
-                    {"ts": json.dumps(time_series), "id": row_id}
-                )
-            except Exception:
-                # If parsing fails, set empty JSON array
-                connection.execute(
-                    sa.text("UPDATE model_usage SET time_series_json = '[]' WHERE id = :id"),
-                    {"id": row_id}
-                )
-        else:
-            # Set empty JSON array if no existing data
-            connection.execute(
-                sa.text("UPDATE model_usage SET time_series_json = '[]' WHERE id = :id"),
-                {"id": row_id}
-            )
+    if op.get_bind().dialect.name == 'postgresql':
+        create_jsonb_array_function()
+        batched_backfill('8abcfd647a0a_merge_x_time', 'model_usage', MERGE_SQL)
+    else:
+        batched_rewrite(
+            '8abcfd647a0a_merge_x_time',
+            'model_usage',
+            "SELECT id, x_time_json FROM model_usage WHERE id > :lo AND id <= :hi",
+            _merge_rows,
+            "UPDATE model_usage SET time_series_json = :value WHERE id = :id",
+        )
 
     # Now make the column non-nullable and drop the old one
     op.alter_column('model_usage', 'time_series_json', nullable=False)
@@ -67,25 +94,21 @@ def upgrade() -> None:
 def downgrade() -> None:
     """Downgrade schema."""
     # Add back x_time_json column (nullable for migration)
-    op.add_column('model_usage', sa.Column('x_time_json', sa.VARCHAR(), autoincrement=False, nullable=True))
-
-    # Migrate data back (extract times from time_series_json)
-    connection = op.get_bind()
-    result = connection.execute(sa.text("SELECT id, time_series_json FROM model_usage"))
-
-    for row in result:
-        row_id, ts_json = row
-        if ts_json:
-            try:
-                time_series = json.loads(ts_json)
-                # Extract just the times (remove timezone part for storage)
-                x_times = [t["time"].split("+")[0] if "+" in str(t["time"]) else str(t["time"]) for t in time_series]
-                connection.execute(
-                    sa.text("UPDATE model_usage SET x_time_json = :xt WHERE id = :id"),
-                    {"xt": json.dumps(x_times), "id": row_id}
-                )
-            except Exception:
-                pass
+    if not has_column('model_usage', 'x_time_json'):
+        op.add_column('model_usage', sa.Column('x_time_json', sa.VARCHAR(), autoincrement=False, nullable=True))
+
+    # Migrate data back (extract times from time_series_json, dropping the offset)
+    if op.get_bind().dialect.name == 'postgresql':
+        create_jsonb_array_function()
+        batched_backfill('8abcfd647a0a_split_time_series', 'model_usage', SPLIT_SQL)
+    else:
+        batched_rewrite(
+            '8abcfd647a0a_split_time_series',
+            'model_usage',
+            "SELECT id, time_series_json FROM model_usage WHERE id > :lo AND id <= :hi",
+            _split_rows,
+            "UPDATE model_usage SET x_time_json = :value WHERE id = :id",
+        )
 
     # Make x_time_json non-nullable and drop time_series_json
     op.alter_column('model_usage', 'x_time_json', nullable=False)
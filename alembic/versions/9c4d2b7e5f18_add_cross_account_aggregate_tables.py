@@ -0,0 +1,156 @@
+"""Add account_summary, model_code_usage and quota_headroom aggregate tables
+
+Revision ID: 9c4d2b7e5f18
+Revises: b8e1f4a27c63
+Create Date: 2026-10-19 19:42:55.018364
+
+"""
+import json
+from datetime import timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4d2b7e5f18'
+down_revision: Union[str, Sequence[str], None] = 'b8e1f4a27c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+account_summary = sa.table(
+    'account_summary',
+    sa.column('account', sa.String), sa.column('created_at', sa.DateTime(timezone=True)),
+    sa.column('total_model_call_count', sa.Integer), sa.column('total_tokens_usage', sa.Integer),
+    sa.column('calls_24h', sa.Integer), sa.column('tokens_24h', sa.Integer),
+)
+model_code_usage = sa.table(
+    'model_code_usage',
+    sa.column('account', sa.String), sa.column('source', sa.String), sa.column('model_code', sa.String),
+    sa.column('usage', sa.Integer), sa.column('created_at', sa.DateTime(timezone=True)),
+)
+quota_headroom = sa.table(
+    'quota_headroom',
+    sa.column('account', sa.String), sa.column('type', sa.String), sa.column('percentage', sa.Float),
+    sa.column('current_usage', sa.Integer), sa.column('total', sa.Integer),
+    sa.column('created_at', sa.DateTime(timezone=True)),
+)
+
+
+def _utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def backfill() -> None:
+    """Fill the aggregates from each account's latest snapshot (one row per account)."""
+    bind = op.get_bind()
+    latest = bind.execute(
+        sa.text("SELECT account, max(created_at) AS created_at FROM model_usage GROUP BY account")
+        .columns(account=sa.String, created_at=sa.DateTime(timezone=True))
+    ).all()
+    summaries, codes, quotas = [], [], []
+    for account, created_at in latest:
+        params = {"account": account, "created_at": created_at}
+        model = bind.execute(sa.text(
+            "SELECT total_model_call_count, total_tokens_usage FROM model_usage"
+            " WHERE account = :account AND created_at = :created_at"
+        ), params).first()
+        window = _utc(created_at) - timedelta(hours=24)
+        series = bind.execute(
+            sa.text(
+                "SELECT time, call_count, tokens_usage FROM model_usage_time_series"
+                " WHERE account = :account AND created_at = :created_at"
+            ).columns(time=sa.DateTime(timezone=True), call_count=sa.Integer, tokens_usage=sa.Integer),
+            params,
+        ).all()
+        recent = [p for p in series if _utc(p.time) >= window]
+        summaries.append({
+            "account": account, "created_at": created_at,
+            "total_model_call_count": model.total_model_call_count,
+            "total_tokens_usage": model.total_tokens_usage,
+            "calls_24h": sum(p.call_count or 0 for p in recent),
+            "tokens_24h": sum(p.tokens_usage or 0 for p in recent),
+        })
+
+        usage = {}
+        tool = bind.execute(sa.text(
+            "SELECT tool_details_json FROM tool_usage WHERE account = :account AND created_at = :created_at"
+        ), params).first()
+        for detail in json.loads(tool.tool_details_json or "[]") if tool else []:
+            key = ("tool", detail["model_name"])
+            usage[key] = usage.get(key, 0) + detail["total_usage_count"]
+        limits = bind.execute(sa.text(
+            "SELECT type, percentage, current_usage, total, usage_details_json FROM quota_limit"
+            " WHERE account = :account AND created_at = :created_at"
+        ), params).all()
+        for limit in limits:
+            quotas.append({
+                "account": account, "type": limit.type, "percentage": limit.percentage,
+                "current_usage": limit.current_usage, "total": limit.total, "created_at": created_at,
+            })
+            for detail in json.loads(limit.usage_details_json or "[]"):
+                key = (limit.type, detail["model_code"])
+                usage[key] = usage.get(key, 0) + detail["usage"]
+        codes.extend(
+            {"account": account, "source": source, "model_code": code, "usage": value, "created_at": created_at}
+            for (source, code), value in usage.items()
+        )
+
+    if summaries:
+        op.bulk_insert(account_summary, summaries)
+    if codes:
+        op.bulk_insert(model_code_usage, codes)
+    if quotas:
+        op.bulk_insert(quota_headroom, quotas)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('account_summary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('total_model_call_count', sa.Integer(), nullable=False),
+    sa.Column('total_tokens_usage', sa.Integer(), nullable=False),
+    sa.Column('calls_24h', sa.Integer(), nullable=False),
+    sa.Column('tokens_24h', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account')
+    )
+    op.create_index(op.f('ix_account_summary_tokens_24h'), 'account_summary', ['tokens_24h'], unique=False)
+    op.create_table('model_code_usage',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account', sa.String(), nullable=False),
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('model_code', sa.String(), nullable=False),
+    sa.Column('usage', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account', 'source', 'model_code', name='uq_model_code_usage_account_source_code')
+    )
+    op.create_index(op.f('ix_model_code_usage_model_code'), 'model_code_usage', ['model_code'], unique=False)
+    op.create_table('quota_headroom',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account', sa.String(), nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('percentage', sa.Float(), nullable=False),
+    sa.Column('current_usage', sa.Integer(), nullable=True),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account', 'type', name='uq_quota_headroom_account_type')
+    )
+    op.create_index(op.f('ix_quota_headroom_type'), 'quota_headroom', ['type'], unique=False)
+    backfill()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_quota_headroom_type'), table_name='quota_headroom')
+    op.drop_table('quota_headroom')
+    op.drop_index(op.f('ix_model_code_usage_model_code'), table_name='model_code_usage')
+    op.drop_table('model_code_usage')
+    op.drop_index(op.f('ix_account_summary_tokens_24h'), table_name='account_summary')
+    op.drop_table('account_summary')
@@ -0,0 +1,42 @@
+"""Add anomaly_state table for persisted spike-detection baselines
+
+Revision ID: a3f08d6b71c2
+Revises: 5b1e7c2a9d40
+Create Date: 2026-10-19 11:02:17.540916
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f08d6b71c2'
+down_revision: Union[str, Sequence[str], None] = '5b1e7c2a9d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('anomaly_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('account', sa.String(), nullable=False),
+    sa.Column('metric', sa.String(), nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('variance', sa.Float(), nullable=False),
+    sa.Column('samples', sa.Integer(), nullable=False),
+    sa.Column('last_time', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_alert_time', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account', 'metric', name='uq_anomaly_state_account_metric')
+    )
+    op.create_index(op.f('ix_anomaly_state_account'), 'anomaly_state', ['account'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_anomaly_state_account'), table_name='anomaly_state')
+    op.drop_table('anomaly_state')
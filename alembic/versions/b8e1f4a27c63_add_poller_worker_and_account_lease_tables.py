@@ -0,0 +1,45 @@
+"""Add poller_worker and account_lease tables for sharded polling
+
+Revision ID: b8e1f4a27c63
+Revises: f5c83a1d9e07
+Create Date: 2026-10-19 18:20:07.401835
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e1f4a27c63'
+down_revision: Union[str, Sequence[str], None] = 'f5c83a1d9e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('poller_worker',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('worker_id', sa.String(), nullable=False),
+    sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('worker_id')
+    )
+    op.create_table('account_lease',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account', sa.String(), nullable=False),
+    sa.Column('owner', sa.String(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account')
+    )
+    op.create_index(op.f('ix_account_lease_owner'), 'account_lease', ['owner'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_account_lease_owner'), table_name='account_lease')
+    op.drop_table('account_lease')
+    op.drop_table('poller_worker')
@@ -0,0 +1,233 @@
+"""Partition snapshot and series tables by month on created_at
+
+Revision ID: c7d2e49f1a68
+Revises: a3f08d6b71c2
+Create Date: 2026-10-19 13:41:05.772310
+
+Each usage table is rebuilt as a table partitioned by RANGE (created_at)
+with one partition per month (<table>_pYYYYMM). Rows are copied in batches
+outside the migration transaction while the service keeps writing (the
+tables are append-only). Each pass copies the ids handed out before it
+began, once the transactions that took them have finished; passes repeat
+until little is left. The final catch-up then holds a write lock on one
+table at a time, in its own transaction: it adds partitions for months
+reached during the copy and copies the rows of the last pass and after
+that the partitioned table still lacks. Postgres 13+ only; other dialects
+are left untouched.
+
+The foreign key from model_usage_time_series to model_usage is dropped: a
+partitioned model_usage can only be referenced together with its
+partition key.
+"""
+import time
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2e49f1a68'
+down_revision: Union[str, Sequence[str], None] = 'a3f08d6b71c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Table -> secondary indexes (name, columns) recreated on the new table
+TABLES = {
+    'model_usage': [
+        ('ix_model_usage_total_model_call_count', 'total_model_call_count'),
+        ('ix_model_usage_total_tokens_usage', 'total_tokens_usage'),
+        ('ix_model_usage_account', 'account'),
+        ('ix_model_usage_account_created_at', 'account, created_at'),
+    ],
+    'model_usage_time_series': [
+        ('ix_model_usage_time_series_model_usage_id', 'model_usage_id'),
+        ('ix_model_usage_time_series_time', 'time'),
+        ('ix_model_usage_time_series_account', 'account'),
+        ('ix_model_usage_time_series_account_created_at', 'account, created_at'),
+    ],
+    'tool_usage': [
+        ('ix_tool_usage_account', 'account'),
+        ('ix_tool_usage_account_created_at', 'account, created_at'),
+    ],
+    'quota_limit': [
+        ('ix_quota_limit_percentage', 'percentage'),
+        ('ix_quota_limit_type', 'type'),
+        ('ix_quota_limit_account', 'account'),
+        ('ix_quota_limit_account_created_at', 'account, created_at'),
+    ],
+}
+
+MONTHS_AHEAD = 3
+BATCH_SIZE = 50_000
+# Seconds between checks for transactions that started before a copy pass
+WRITER_POLL_SECONDS = 0.2
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _months(conn, table: str, ahead: int):
+    """Months from the oldest row to `ahead` months past the current month (or the newest row)."""
+    oldest, newest = conn.execute(sa.text(f"SELECT MIN(created_at), MAX(created_at) FROM {table}")).one()
+    now = datetime.now(timezone.utc)
+    month = date((oldest or now).year, (oldest or now).month, 1)
+    latest = max(newest or now, now)
+    last = _add_months(date(latest.year, latest.month, 1), ahead)
+    while month <= last:
+        yield month
+        month = _add_months(month, 1)
+
+
+def _create_partitions(conn, table: str, new: str, ahead: int) -> None:
+    for month in _months(conn, table, ahead):
+        conn.execute(sa.text(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{month.year}{month.month:02d} PARTITION OF {new} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        ))
+
+
+def _allocated_id(conn, table: str) -> int:
+    """The highest id handed out by the table's sequence, committed or not."""
+    return conn.execute(sa.text(
+        f"SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM {table}_id_seq"
+    )).scalar()
+
+
+def _wait_for_writers(conn) -> None:
+    """Wait until every transaction running now has committed or rolled back."""
+    xmax = conn.execute(sa.text("SELECT pg_snapshot_xmax(pg_current_snapshot())::text")).scalar()
+    while not conn.execute(
+        sa.text("SELECT pg_snapshot_xmin(pg_current_snapshot()) >= CAST(:xmax AS xid8)"), {"xmax": xmax}
+    ).scalar():
+        time.sleep(WRITER_POLL_SECONDS)
+
+
+def _copy_range(conn, source: str, target: str, after: int, upto: int) -> None:
+    """Copy rows with after < id <= upto, BATCH_SIZE ids at a time."""
+    last_id = after
+    while last_id < upto:
+        upper = min(last_id + BATCH_SIZE, upto)
+        conn.execute(
+            sa.text(f"INSERT INTO {target} SELECT * FROM {source} WHERE id > :lo AND id <= :hi"),
+            {"lo": last_id, "hi": upper},
+        )
+        last_id = upper
+        print(f"  {source}: copied up to id {last_id}/{upto}")
+
+
+def _copy_batches(conn, source: str, target: str) -> int:
+    """Copy source into target while it keeps receiving rows; returns the low-water mark for _swap().
+
+    Each pass copies up to the id the sequence had handed out when the pass
+    began, after waiting for the transactions that might still commit ids
+    below it. Passes repeat until the rows written meanwhile fit in one
+    batch. Rows above the returned id may still be missing from target.
+    """
+    copied = 0
+    while True:
+        upto = _allocated_id(conn, source)
+        _wait_for_writers(conn)
+        _copy_range(conn, source, target, copied, upto)
+        low, copied = copied, upto
+        if _allocated_id(conn, source) - copied <= BATCH_SIZE:
+            return low
+
+
+def _catch_up(conn, source: str, target: str, since: int) -> int:
+    """Copy the rows with id > `since` that target lacks.
+
+    `since` is the start of the last pass of _copy_batches(), so the
+    anti-join only covers that pass and the rows written after it,
+    including any whose transaction took an id before committing late.
+    """
+    result = conn.execute(
+        sa.text(
+            f"INSERT INTO {target} SELECT * FROM {source} o WHERE o.id > :since "
+            f"AND NOT EXISTS (SELECT 1 FROM {target} n WHERE n.id = o.id)"
+        ),
+        {"since": since},
+    )
+    return result.rowcount
+
+
+def _swap(conn, table: str, new: str, indexes, pk_name: str, since: int, partitioned: bool) -> None:
+    """Catch up and replace `table` with `new` in a transaction of its own, under a short write lock.
+
+    Runs inside an autocommit block, so each table's lock is released as
+    soon as that table is swapped.
+    """
+    conn.exec_driver_sql("BEGIN")
+    try:
+        conn.execute(sa.text(f"LOCK TABLE {table} IN EXCLUSIVE MODE"))
+        if partitioned:
+            # The copy may have run into a month the partitions did not cover yet
+            _create_partitions(conn, table, new, 1)
+        print(f"  {table}: caught up {_catch_up(conn, table, new, since)} rows")
+        conn.execute(sa.text(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE"))
+        conn.execute(sa.text(f"DROP TABLE {table}"))
+        conn.execute(sa.text(f"ALTER TABLE {new} RENAME TO {table}"))
+        conn.execute(sa.text(f"ALTER TABLE {table} RENAME CONSTRAINT {new}_pkey TO {pk_name}"))
+        conn.execute(sa.text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+        for name, _ in indexes:
+            conn.execute(sa.text(f"ALTER INDEX IF EXISTS {name}_new RENAME TO {name}"))
+    except Exception:
+        conn.exec_driver_sql("ROLLBACK")
+        raise
+    conn.exec_driver_sql("COMMIT")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    op.drop_constraint('fk_model_usage_time_series_model_usage', 'model_usage_time_series', type_='foreignkey')
+
+    for table, indexes in TABLES.items():
+        new = f'{table}_partitioned'
+        conn.execute(sa.text(
+            f"CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(sa.text(f"ALTER TABLE {new} ADD PRIMARY KEY (id, created_at)"))
+        _create_partitions(conn, table, new, MONTHS_AHEAD)
+        for name, columns in indexes:
+            conn.execute(sa.text(f"CREATE INDEX {name}_new ON {new} ({columns})"))
+
+    # Bulk copy while the service keeps running: each batch commits on its own
+    with op.get_context().autocommit_block():
+        for table, indexes in TABLES.items():
+            print(f"Copying {table} into monthly partitions...")
+            since = _copy_batches(conn, table, f'{table}_partitioned')
+            _swap(conn, table, f'{table}_partitioned', indexes, f'{table}_pkey', since, partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    for table, indexes in TABLES.items():
+        new = f'{table}_plain'
+        conn.execute(sa.text(f"CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS)"))
+        conn.execute(sa.text(f"ALTER TABLE {new} ADD PRIMARY KEY (id)"))
+        for name, columns in indexes:
+            if not name.endswith('_account_created_at'):
+                conn.execute(sa.text(f"CREATE INDEX {name}_new ON {new} ({columns})"))
+
+    with op.get_context().autocommit_block():
+        for table, indexes in TABLES.items():
+            since = _copy_batches(conn, table, f'{table}_plain')
+            # Partitions are dropped along with their parent
+            _swap(conn, table, f'{table}_plain', indexes, f'{table}_pkey', since, partitioned=False)
+
+    op.create_foreign_key(
+        'fk_model_usage_time_series_model_usage',
+        'model_usage_time_series', 'model_usage',
+        ['model_usage_id'], ['id'],
+    )
@@ -0,0 +1,33 @@
+"""Make (account, created_at) the unique snapshot key of model_usage
+
+Revision ID: d41a7e9c3b25
+Revises: c7d2e49f1a68
+Create Date: 2026-10-19 15:12:44.208117
+
+Spooled snapshots are replayed with INSERT ... ON CONFLICT DO NOTHING on
+this key. Each snapshot is written with its own timestamp, so existing rows
+already satisfy it. On Postgres the key includes the partition column, as
+unique indexes on partitioned tables require.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a7e9c3b25'
+down_revision: Union[str, Sequence[str], None] = 'c7d2e49f1a68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index('ix_model_usage_account_created_at', table_name='model_usage')
+    op.create_index('ix_model_usage_account_created_at', 'model_usage', ['account', 'created_at'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_model_usage_account_created_at', table_name='model_usage')
+    op.create_index('ix_model_usage_account_created_at', 'model_usage', ['account', 'created_at'])
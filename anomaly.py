@@ -0,0 +1,173 @@
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from db_models import AnomalyState, async_session, dialect_insert, write_session
+from models import ModelUsagePoint
+
+load_dotenv()
+
+METRICS = ("call_count", "tokens_usage")
+
+# EWMA span in hours; alpha = 2 / (span + 1)
+ANOMALY_SPAN_HOURS = int(os.getenv("ANOMALY_SPAN_HOURS", "24"))
+# Standard deviations above the baseline that count as a spike
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4"))
+# Completed hours needed before alerts are raised
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "6"))
+
+
+@dataclass
+class Alert:
+    account: str
+    metric: str
+    time: datetime
+    value: int
+    baseline: float
+    z_score: float
+
+    def format(self) -> str:
+        return (
+            f"<b>⚠️ Usage spike on {self.account}</b>\n"
+            f"• {self.metric} at {self.time.strftime('%m-%d %H:%M')}: {self.value:,}\n"
+            f"• Baseline: {self.baseline:,.0f} (z={self.z_score:.1f})"
+        )
+
+
+class EwmaBaseline:
+    """Exponentially weighted mean/variance updated one observation at a time."""
+
+    def __init__(self, state: AnomalyState, span_hours: int = ANOMALY_SPAN_HOURS):
+        self.state = state
+        self.alpha = 2 / (span_hours + 1)
+
+    def update(self, value: float) -> None:
+        s = self.state
+        if s.samples == 0:
+            s.mean = float(value)
+            s.variance = 0.0
+        else:
+            diff = value - s.mean
+            incr = self.alpha * diff
+            s.mean += incr
+            s.variance = (1 - self.alpha) * (s.variance + diff * incr)
+        s.samples += 1
+
+    def z_score(self, value: float) -> float:
+        s = self.state
+        # Floor the deviation so a flat history does not turn any change into a spike
+        std = max(math.sqrt(s.variance), 0.1 * s.mean, 1.0)
+        return (value - s.mean) / std
+
+
+class AnomalyDetector:
+    """Per-account spike detector over the hourly call and token series.
+
+    Completed hours are folded into an EWMA baseline as they arrive; the
+    latest (in-progress) hour is compared against it. Baselines live in the
+    anomaly_state table, so a restart continues where it left off.
+    """
+
+    def __init__(
+        self,
+        z_threshold: float = ANOMALY_Z_THRESHOLD,
+        min_samples: int = ANOMALY_MIN_SAMPLES,
+        span_hours: int = ANOMALY_SPAN_HOURS,
+    ):
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.span_hours = span_hours
+        self._states: Dict[Tuple[str, str], AnomalyState] = {}
+
+    async def _load(self, account: str) -> None:
+        if all((account, m) in self._states for m in METRICS):
+            return
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(AnomalyState).where(AnomalyState.account == account)
+            )
+            for state in result.scalars():
+                self._states[(account, state.metric)] = state
+
+        for metric in METRICS:
+            self._states.setdefault((account, metric), AnomalyState(account=account, metric=metric))
+
+    async def _save(self, account: str) -> None:
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                "account": account,
+                "metric": metric,
+                "updated_at": now,
+                "mean": state.mean,
+                "variance": state.variance,
+                "samples": state.samples,
+                "last_time": state.last_time,
+                "last_alert_time": state.last_alert_time,
+            }
+            for metric in METRICS
+            for state in [self._states[(account, metric)]]
+        ]
+        stmt = dialect_insert(AnomalyState)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["account", "metric"],
+            set_={
+                column: stmt.excluded[column]
+                for column in ("updated_at", "mean", "variance", "samples", "last_time", "last_alert_time")
+            },
+        )
+        async with write_session() as session:
+            await session.execute(stmt, rows)
+            await session.commit()
+
+    def _observe(self, account: str, metric: str, series: List[ModelUsagePoint]) -> Optional[Alert]:
+        state = self._states[(account, metric)]
+        baseline = EwmaBaseline(state, self.span_hours)
+        points = [p for p in series if getattr(p, metric) is not None]
+        if not points:
+            return None
+
+        *completed, latest = points
+        for point in completed:
+            if state.last_time is None or point.time > state.last_time:
+                baseline.update(getattr(point, metric))
+                state.last_time = point.time
+
+        value = getattr(latest, metric)
+        if state.samples < self.min_samples or state.last_alert_time == latest.time:
+            return None
+
+        z = baseline.z_score(value)
+        if z < self.z_threshold:
+            return None
+
+        state.last_alert_time = latest.time
+        return Alert(
+            account=account,
+            metric=metric,
+            time=latest.time,
+            value=value,
+            baseline=state.mean,
+            z_score=z,
+        )
+
+    async def observe(self, account: str, series: List[ModelUsagePoint]) -> List[Alert]:
+        """Fold a freshly fetched hourly series into the baselines and return any alerts."""
+        await self._load(account)
+        series = sorted(series, key=lambda p: p.time)
+        alerts = [
+            alert
+            for metric in METRICS
+            if (alert := self._observe(account, metric, series)) is not None
+        ]
+        await self._save(account)
+        return alerts
+
+
+detector = AnomalyDetector()
@@ -0,0 +1,99 @@
+"""Read-only JSON API over the cross-account aggregates and job health.
+
+In webhook mode the routes are served by the webhook's aiohttp app; with
+long polling they get their own server when API_PORT is set. Requests need
+"Authorization: Bearer <API_TOKEN>"; without API_TOKEN the routes are not
+served at all, since the webhook port faces the internet.
+"""
+import asyncio
+import hmac
+import os
+from dataclasses import asdict
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from aggregates import TOP_ACCOUNTS, model_code_totals, quota_headroom, token_burn_ranking
+from supervisor import supervisor
+
+load_dotenv()
+
+API_TOKEN = os.getenv("API_TOKEN", "")
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+# Port of the standalone API server in polling mode; unset disables it
+API_PORT = int(os.getenv("API_PORT", "0"))
+
+
+@web.middleware
+async def require_token(request: web.Request, handler):
+    if request.path.startswith("/api/"):
+        expected = f"Bearer {API_TOKEN}"
+        if not API_TOKEN or not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+            raise web.HTTPUnauthorized()
+    return await handler(request)
+
+
+async def fleet_models(request: web.Request) -> web.Response:
+    totals = await model_code_totals(request.query.get("source"))
+    return web.json_response([asdict(t) for t in totals])
+
+
+async def fleet_ranking(request: web.Request) -> web.Response:
+    try:
+        limit = min(int(request.query.get("limit", TOP_ACCOUNTS)), 100)
+    except ValueError:
+        raise web.HTTPBadRequest(text="limit must be an integer")
+    return web.json_response([asdict(r) for r in await token_burn_ranking(limit)])
+
+
+async def fleet_headroom(request: web.Request) -> web.Response:
+    return web.json_response([asdict(h) for h in await quota_headroom()])
+
+
+async def jobs(request: web.Request) -> web.Response:
+    """Health of this process's background jobs; 503 while any of them is failing."""
+    rows = []
+    for job in supervisor.health():
+        row = asdict(job)
+        for key in ("last_started_at", "last_finished_at"):
+            row[key] = row[key].isoformat() if row[key] else None
+        row["healthy"] = job.healthy
+        rows.append(row)
+    status = 200 if all(row["healthy"] for row in rows) else 503
+    return web.json_response({"pid": os.getpid(), "jobs": rows}, status=status)
+
+
+def register_api(app: web.Application) -> bool:
+    """Add the API routes to `app`; False (nothing added) without API_TOKEN."""
+    if not API_TOKEN:
+        print("API_TOKEN not set, the JSON API is disabled")
+        return False
+    app.middlewares.append(require_token)
+    app.router.add_get("/api/fleet/models", fleet_models)
+    app.router.add_get("/api/fleet/ranking", fleet_ranking)
+    app.router.add_get("/api/fleet/headroom", fleet_headroom)
+    app.router.add_get("/api/jobs", jobs)
+    return True
+
+
+def create_api_app() -> web.Application:
+    app = web.Application()
+    register_api(app)
+    return app
+
+
+async def serve_api() -> None:
+    """Standalone API server until cancelled; returns at once without API_PORT or API_TOKEN."""
+    if not API_PORT:
+        return
+    app = web.Application()
+    if not register_api(app):
+        return
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, API_HOST, API_PORT).start()
+    print(f"Serving API on {API_HOST}:{API_PORT}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
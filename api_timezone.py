@@ -0,0 +1,95 @@
+"""Per-platform timezone of the usage API's hourly times.
+
+The API reports hours like "2026-01-05 20:00" without an offset. The offset
+is inferred from a response (its latest hour is the hour of the request in
+the API's timezone), cached per platform, and revalidated against a fresh
+response every API_TZ_REVALIDATE_SECONDS. Offsets are stored in the
+api_timezone table so a restart starts from the known value.
+"""
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Set
+
+from dotenv import load_dotenv
+
+from models import detect_timezone_from_latest_hour
+
+load_dotenv()
+
+API_TZ_REVALIDATE_SECONDS = int(os.getenv("API_TZ_REVALIDATE_SECONDS", "21600"))
+
+
+@dataclass
+class CachedTimezone:
+    tz: timezone
+    checked_at: datetime
+
+
+class ApiTimezones:
+    """Resolved API timezone per platform.
+
+    Database access is best effort: without a database the offset is still
+    detected and cached in memory.
+    """
+
+    def __init__(self, revalidate_seconds: int = API_TZ_REVALIDATE_SECONDS):
+        self.revalidate_seconds = revalidate_seconds
+        self._cache: Dict[str, CachedTimezone] = {}
+        self._loaded: Set[str] = set()
+
+    async def _load(self, platform: str) -> None:
+        # Imported here so fetch_usage stays light to import
+        from sqlalchemy import select
+
+        from db_models import ApiTimezone, async_session
+
+        self._loaded.add(platform)
+        try:
+            async with async_session() as session:
+                result = await session.execute(select(ApiTimezone).where(ApiTimezone.platform == platform))
+                row = result.scalar_one_or_none()
+        except Exception as e:
+            print(f"Could not load API timezone of {platform}: {e}")
+            return
+        if row is not None:
+            tz = timezone(timedelta(minutes=row.utc_offset_minutes))
+            self._cache[platform] = CachedTimezone(tz, row.checked_at)
+
+    async def _save(self, platform: str, cached: CachedTimezone) -> None:
+        from db_models import ApiTimezone, dialect_insert, write_session
+
+        values = {
+            "platform": platform,
+            "utc_offset_minutes": int(cached.tz.utcoffset(None).total_seconds() // 60),
+            "checked_at": cached.checked_at,
+        }
+        stmt = dialect_insert(ApiTimezone).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=["platform"], set_=values)
+        try:
+            async with write_session() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except Exception as e:
+            print(f"Could not save API timezone of {platform}: {e}")
+
+    async def resolve(self, platform: str, x_time: List[str], requested_at: datetime) -> timezone:
+        """Timezone for parsing a response of `platform` requested at `requested_at`."""
+        if platform not in self._loaded:
+            await self._load(platform)
+
+        cached = self._cache.get(platform)
+        if cached is not None and (requested_at - cached.checked_at).total_seconds() < self.revalidate_seconds:
+            return cached.tz
+        if not x_time or not x_time[-1]:
+            return cached.tz if cached is not None else timezone.utc
+
+        detected = detect_timezone_from_latest_hour(x_time[-1], requested_at)
+        if cached is not None and cached.tz != detected:
+            print(f"API timezone of {platform} changed from {cached.tz} to {detected}")
+        self._cache[platform] = CachedTimezone(detected, requested_at)
+        await self._save(platform, self._cache[platform])
+        return detected
+
+
+api_timezones = ApiTimezones()
@@ -0,0 +1,542 @@
+"""Delta-encoded archive of snapshot counters, one blob per account per day.
+
+Every poll stores the cumulative model totals, the four tool counters and
+each quota limit as fresh rows, although consecutive snapshots barely
+differ. Once a UTC day is complete, archive_completed_days() packs its
+snapshots into usage_archive: a keyframe every ARCHIVE_KEYFRAME_INTERVAL
+frames carries full values, and the frames in between carry only
+zigzag-varint differences, typically a byte per counter. usage_at()
+answers point-in-time questions from the archive for archived days.
+
+Snapshots replayed from the spool can land in a day that is already
+archived. Each archive row remembers the highest model_usage id it had
+seen, so later runs find rows above it and merge them into their day.
+
+Once a day is ARCHIVE_COMPACT_AFTER_DAYS old, compact_archived_days()
+thins its raw rows on every dialect: one snapshot per hour is kept for
+the latest-usage and chart queries, and the hourly series, which every
+snapshot repeats for the trailing 24 hours, keeps one row per hour with
+its highest counts, all that /history and /chart read. Partition
+retention (Postgres) then drops the remaining snapshot rows, never a
+month holding a day that is not archived yet, and never the series.
+
+Blob layout (all integers unsigned LEB128 varints, signed ones zigzagged):
+    version, frame count, keyframe count,
+    per keyframe: ms since midnight, byte offset into the frames
+    frames: kind (0 delta, 1 key), ms since previous frame (key: since midnight)
+        key:   quota type count, per type: length + UTF-8 name; null mask; values
+        delta: value differences against the previous frame
+Values: model calls, model tokens, the four tool counters, then per quota
+type its percentage (x10000), current usage and total. A frame whose quota
+types or missing values differ from the previous one is written as a key.
+"""
+import html
+import os
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, delete, func, select, update
+
+from db_models import (
+    ModelUsage,
+    ModelUsageTimeSeries,
+    QuotaLimit,
+    ToolUsage,
+    UsageArchive,
+    async_session,
+    dialect_insert,
+    write_session,
+)
+
+load_dotenv()
+
+ARCHIVE_VERSION = 1
+ARCHIVE_KEYFRAME_INTERVAL = int(os.getenv("ARCHIVE_KEYFRAME_INTERVAL", "60"))
+# Days archived per account in one maintenance run, so a first run over a long history stays bounded
+ARCHIVE_DAYS_PER_RUN = int(os.getenv("ARCHIVE_DAYS_PER_RUN", "31"))
+# Archived days older than this have their raw rows thinned to one snapshot per hour;
+# keep it above the longest chart range (7d), which plots every snapshot's quotas
+ARCHIVE_COMPACT_AFTER_DAYS = int(os.getenv("ARCHIVE_COMPACT_AFTER_DAYS", "8"))
+# Rows per DELETE statement while compacting
+COMPACT_BATCH_SIZE = 500
+
+TOOL_COUNTERS = (
+    "total_network_search_count",
+    "total_web_read_mcp_count",
+    "total_zread_mcp_count",
+    "total_search_mcp_count",
+)
+PERCENT_SCALE = 10000
+
+
+@dataclass
+class Frame:
+    """Counters of one snapshot."""
+
+    created_at: datetime
+    total_model_call_count: int
+    total_tokens_usage: int
+    # Tool counters in TOOL_COUNTERS order; None where the snapshot had no tool row
+    tools: Tuple[Optional[int], ...] = (None, None, None, None)
+    # Quota type -> (percentage, current_usage, total)
+    quotas: Dict[str, Tuple[float, Optional[int], Optional[int]]] = field(default_factory=dict)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value // 2 if not value & 1 else -(value + 1) // 2
+
+
+def _values(frame: Frame, types: Tuple[str, ...]) -> List[Optional[int]]:
+    values = [frame.total_model_call_count, frame.total_tokens_usage, *frame.tools]
+    for quota_type in types:
+        percentage, current_usage, total = frame.quotas[quota_type]
+        values.extend((round(percentage * PERCENT_SCALE), current_usage, total))
+    return values
+
+
+def _frame(created_at: datetime, values: List[Optional[int]], types: Tuple[str, ...]) -> Frame:
+    quotas = {}
+    for i, quota_type in enumerate(types):
+        percentage, current_usage, total = values[6 + 3 * i:9 + 3 * i]
+        quotas[quota_type] = (percentage / PERCENT_SCALE, current_usage, total)
+    return Frame(created_at, values[0], values[1], tuple(values[2:6]), quotas)
+
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, time(), tzinfo=timezone.utc)
+
+
+def _ms(delta: timedelta) -> int:
+    return delta // timedelta(milliseconds=1)
+
+
+def encode_day(day: date, frames: List[Frame], keyframe_interval: int = ARCHIVE_KEYFRAME_INTERVAL) -> bytes:
+    """Pack one day's frames, sorted by created_at, into a blob."""
+    body = bytearray()
+    keys: List[Tuple[int, int]] = []
+    previous_ms, previous_types, previous_values = 0, None, None
+    since_key = 0
+
+    for frame in frames:
+        ms = _ms(frame.created_at - _midnight(day))
+        types = tuple(sorted(frame.quotas))
+        values = _values(frame, types)
+        mask = sum(1 << i for i, v in enumerate(values) if v is None)
+        previous_mask = None if previous_values is None else sum(1 << i for i, v in enumerate(previous_values) if v is None)
+
+        if types != previous_types or mask != previous_mask or since_key >= keyframe_interval:
+            keys.append((ms, len(body)))
+            body.append(1)
+            _write_varint(body, ms)
+            _write_varint(body, len(types))
+            for quota_type in types:
+                name = quota_type.encode()
+                _write_varint(body, len(name))
+                body.extend(name)
+            _write_varint(body, mask)
+            for value in values:
+                _write_varint(body, _zigzag(value or 0))
+            since_key = 1
+        else:
+            body.append(0)
+            _write_varint(body, ms - previous_ms)
+            for value, previous in zip(values, previous_values):
+                _write_varint(body, _zigzag((value or 0) - (previous or 0)))
+            since_key += 1
+        previous_ms, previous_types, previous_values = ms, types, values
+
+    out = bytearray()
+    _write_varint(out, ARCHIVE_VERSION)
+    _write_varint(out, len(frames))
+    _write_varint(out, len(keys))
+    for ms, offset in keys:
+        _write_varint(out, ms)
+        _write_varint(out, offset)
+    return bytes(out + body)
+
+
+def _read_header(data: bytes) -> Tuple[int, List[Tuple[int, int]], int]:
+    version, pos = _read_varint(data, 0)
+    if version != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive version {version}")
+    count, pos = _read_varint(data, pos)
+    key_count, pos = _read_varint(data, pos)
+    keys = []
+    for _ in range(key_count):
+        ms, pos = _read_varint(data, pos)
+        offset, pos = _read_varint(data, pos)
+        keys.append((ms, offset))
+    return count, keys, pos
+
+
+def decode_day(day: date, data: bytes, until: datetime = None) -> List[Frame]:
+    """Frames of a blob, optionally only those up to `until`.
+
+    With `until`, decoding starts at the last keyframe at or before it, so
+    at most one keyframe interval is decoded.
+    """
+    _, keys, start = _read_header(data)
+    midnight = _midnight(day)
+    limit = None if until is None else _ms(until - midnight)
+    if limit is not None:
+        # Keyframe to start from; frames before it are not needed
+        index = bisect_right([ms for ms, _ in keys], limit) - 1
+        if index < 0:
+            return []
+        keys = keys[index:]
+    pos = start + (keys[0][1] if keys else 0)
+
+    frames: List[Frame] = []
+    ms, types, mask, values = 0, (), 0, []
+    while pos < len(data):
+        kind = data[pos]
+        pos += 1
+        step, pos = _read_varint(data, pos)
+        if kind == 1:
+            ms = step
+            type_count, pos = _read_varint(data, pos)
+            names = []
+            for _ in range(type_count):
+                length, pos = _read_varint(data, pos)
+                names.append(data[pos:pos + length].decode())
+                pos += length
+            types = tuple(names)
+            mask, pos = _read_varint(data, pos)
+            values = []
+            for _ in range(6 + 3 * len(types)):
+                value, pos = _read_varint(data, pos)
+                values.append(_unzigzag(value))
+        else:
+            ms += step
+            for i in range(len(values)):
+                value, pos = _read_varint(data, pos)
+                values[i] += _unzigzag(value)
+        if limit is not None and ms > limit:
+            break
+        restored = [None if mask >> i & 1 else v for i, v in enumerate(values)]
+        frames.append(_frame(midnight + timedelta(milliseconds=ms), restored, types))
+    return frames
+
+
+async def load_day_frames(account: str, day: date) -> List[Frame]:
+    """Frames of a day from the raw snapshot tables."""
+    start, end = _midnight(day), _midnight(day + timedelta(days=1))
+    async with async_session() as session:
+        models = await session.execute(
+            select(ModelUsage.created_at, ModelUsage.total_model_call_count, ModelUsage.total_tokens_usage)
+            .where(ModelUsage.account == account, ModelUsage.created_at >= start, ModelUsage.created_at < end)
+            .order_by(ModelUsage.created_at)
+        )
+        tools = await session.execute(
+            select(ToolUsage.created_at, *(getattr(ToolUsage, c) for c in TOOL_COUNTERS))
+            .where(ToolUsage.account == account, ToolUsage.created_at >= start, ToolUsage.created_at < end)
+        )
+        quotas = await session.execute(
+            select(QuotaLimit.created_at, QuotaLimit.type, QuotaLimit.percentage, QuotaLimit.current_usage, QuotaLimit.total)
+            .where(QuotaLimit.account == account, QuotaLimit.created_at >= start, QuotaLimit.created_at < end)
+        )
+        tool_by_time = {row[0]: tuple(row[1:]) for row in tools}
+        quotas_by_time: Dict[datetime, dict] = {}
+        for created_at, quota_type, percentage, current_usage, total in quotas:
+            quotas_by_time.setdefault(created_at, {})[quota_type] = (percentage, current_usage, total)
+        return [
+            Frame(
+                created_at, calls, tokens,
+                tool_by_time.get(created_at, (None, None, None, None)),
+                quotas_by_time.get(created_at, {}),
+            )
+            for created_at, calls, tokens in models
+        ]
+
+
+async def archive_day(account: str, day: date, through_id: int = None) -> Optional[int]:
+    """Encode and store one day; returns the blob size, or None if the day had no snapshots.
+
+    Frames already archived for the day are kept, so late rows can be merged
+    in after the raw rows were compacted or dropped by retention.
+    """
+    async with async_session() as session:
+        existing = (await session.execute(
+            select(UsageArchive.data).where(UsageArchive.account == account, UsageArchive.day == day)
+        )).scalar_one_or_none()
+    frames = {}
+    if existing is not None:
+        frames = {_ms(f.created_at - _midnight(day)): f for f in decode_day(day, existing)}
+    # Raw rows win; the archive only holds their values at millisecond precision
+    frames.update((_ms(f.created_at - _midnight(day)), f) for f in await load_day_frames(account, day))
+    if not frames:
+        return None
+    frames = [frames[ms] for ms in sorted(frames)]
+    data = encode_day(day, frames)
+    values = {
+        "account": account,
+        "day": day,
+        "first_at": frames[0].created_at,
+        "last_at": frames[-1].created_at,
+        "frames": len(frames),
+        "data": data,
+        "through_id": through_id,
+        # New rows may need thinning again
+        "compacted": False,
+    }
+    stmt = dialect_insert(UsageArchive).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["account", "day"], set_={k: v for k, v in values.items() if k not in ("account", "day")}
+    )
+    async with write_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+    return len(data)
+
+
+async def archive_completed_days(
+    now: datetime = None, days_per_run: int = ARCHIVE_DAYS_PER_RUN
+) -> Tuple[int, Optional[date]]:
+    """Archive every account's complete UTC days not archived yet, and re-archive days that got late rows.
+
+    Returns the days written and the oldest day still unarchived across all
+    accounts (None without snapshots); raw rows from that day on must be kept.
+    """
+    today = (now or datetime.now(timezone.utc)).date()
+    async with async_session() as session:
+        # Read first: rows committed after this are picked up by the next run
+        through_id = (await session.execute(select(func.max(ModelUsage.id)))).scalar()
+        seen_id = (await session.execute(select(func.max(UsageArchive.through_id)))).scalar()
+        firsts = dict((await session.execute(
+            select(ModelUsage.account, func.min(ModelUsage.created_at)).group_by(ModelUsage.account)
+        )).all())
+        archived = dict((await session.execute(
+            select(UsageArchive.account, func.max(UsageArchive.day)).group_by(UsageArchive.account)
+        )).all())
+        late = set()
+        if seen_id is not None:
+            rows = await session.execute(
+                select(ModelUsage.account, ModelUsage.created_at)
+                .where(ModelUsage.id > seen_id, ModelUsage.created_at < _midnight(today))
+            )
+            late = {
+                (account, created_at.date()) for account, created_at in rows
+                if account in archived and created_at.date() <= archived[account]
+            }
+
+    written = 0
+    for account, day in sorted(late):
+        if await archive_day(account, day, through_id) is not None:
+            written += 1
+    if late:
+        print(f"Re-archived {len(late)} account-days that received late snapshots")
+
+    pending: Optional[date] = None
+    for account, first in firsts.items():
+        day = archived[account] + timedelta(days=1) if account in archived else first.date()
+        for _ in range(days_per_run):
+            if day >= today:
+                break
+            if await archive_day(account, day, through_id) is not None:
+                written += 1
+            day += timedelta(days=1)
+        pending = day if pending is None else min(pending, day)
+    return written, pending
+
+
+def _hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+async def compact_day(account: str, day: date, archived_ms: Set[int]) -> int:
+    """Thin one archived day's raw rows; returns the rows deleted.
+
+    Only snapshots present in the archive (`archived_ms`, milliseconds since
+    midnight) are dropped, keeping the last one of each hour. Series rows
+    created that day collapse to one per hour with the highest counts.
+    """
+    start, end = _midnight(day), _midnight(day + timedelta(days=1))
+    deleted = 0
+    async with write_session() as session:
+        snapshots = (await session.execute(
+            select(ModelUsage.id, ModelUsage.created_at)
+            .where(ModelUsage.account == account, ModelUsage.created_at >= start, ModelUsage.created_at < end)
+            .order_by(ModelUsage.created_at)
+        )).all()
+        archived = [(id, created_at) for id, created_at in snapshots if _ms(created_at - start) in archived_ms]
+        last_of_hour = {_hour(created_at): id for id, created_at in archived}
+        drop = [(id, created_at) for id, created_at in archived if last_of_hour[_hour(created_at)] != id]
+        for i in range(0, len(drop), COMPACT_BATCH_SIZE):
+            ids = [id for id, _ in drop[i:i + COMPACT_BATCH_SIZE]]
+            times = [created_at for _, created_at in drop[i:i + COMPACT_BATCH_SIZE]]
+            # created_at bounds let Postgres prune to the day's partition
+            for table, condition in (
+                (ModelUsage, ModelUsage.id.in_(ids)),
+                (ToolUsage, ToolUsage.created_at.in_(times)),
+                (QuotaLimit, QuotaLimit.created_at.in_(times)),
+            ):
+                result = await session.execute(
+                    delete(table).where(
+                        table.account == account, table.created_at >= start, table.created_at < end, condition
+                    )
+                )
+                deleted += result.rowcount
+
+        series = ModelUsageTimeSeries
+        points: Dict[datetime, list] = {}
+        rows = await session.execute(
+            select(series.id, series.time, series.call_count, series.tokens_usage)
+            .where(series.account == account, series.created_at >= start, series.created_at < end)
+            .order_by(series.created_at)
+        )
+        for id, point_time, calls, tokens in rows:
+            points.setdefault(point_time, []).append((id, calls, tokens))
+        updates, extra = [], []
+        for group in points.values():
+            # Keep the latest row, raised to the highest counts any snapshot saw
+            keep, calls, tokens = group[-1]
+            top_calls = max((c for _, c, _ in group if c is not None), default=None)
+            top_tokens = max((t for _, _, t in group if t is not None), default=None)
+            if (top_calls, top_tokens) != (calls, tokens):
+                updates.append({"row_id": keep, "calls": top_calls, "tokens": top_tokens})
+            extra.extend(id for id, _, _ in group[:-1])
+        if updates:
+            await session.execute(
+                update(series.__table__)
+                .where(series.__table__.c.id == bindparam("row_id"))
+                .values(call_count=bindparam("calls"), tokens_usage=bindparam("tokens")),
+                updates,
+            )
+        for i in range(0, len(extra), COMPACT_BATCH_SIZE):
+            result = await session.execute(
+                delete(series).where(
+                    series.account == account, series.created_at >= start, series.created_at < end,
+                    series.id.in_(extra[i:i + COMPACT_BATCH_SIZE]),
+                )
+            )
+            deleted += result.rowcount
+        await session.commit()
+    return deleted
+
+
+async def compact_archived_days(
+    now: datetime = None, after_days: int = ARCHIVE_COMPACT_AFTER_DAYS, limit: int = ARCHIVE_DAYS_PER_RUN
+) -> int:
+    """Thin the raw rows of up to `limit` archived days older than `after_days`; returns the days compacted."""
+    cutoff = (now or datetime.now(timezone.utc)).date() - timedelta(days=after_days)
+    async with async_session() as session:
+        days = (await session.execute(
+            select(UsageArchive.account, UsageArchive.day, UsageArchive.data)
+            .where(UsageArchive.compacted.is_(False), UsageArchive.day < cutoff)
+            .order_by(UsageArchive.day)
+            .limit(limit)
+        )).all()
+
+    deleted = 0
+    for account, day, data in days:
+        archived_ms = {_ms(f.created_at - _midnight(day)) for f in decode_day(day, data)}
+        deleted += await compact_day(account, day, archived_ms)
+        async with write_session() as session:
+            # Unless late rows were merged in meanwhile; they are thinned next run
+            await session.execute(
+                update(UsageArchive)
+                .where(UsageArchive.account == account, UsageArchive.day == day, UsageArchive.data == data)
+                .values(compacted=True)
+            )
+            await session.commit()
+    if days:
+        print(f"Compacted {len(days)} archived account-days, {deleted} raw rows deleted")
+    return len(days)
+
+
+async def load_frame_before(account: str, at: datetime) -> Optional[Frame]:
+    """The account's last raw snapshot at or before `at`, as a Frame."""
+    async with async_session() as session:
+        model = (await session.execute(
+            select(ModelUsage.created_at, ModelUsage.total_model_call_count, ModelUsage.total_tokens_usage)
+            .where(ModelUsage.account == account, ModelUsage.created_at <= at)
+            .order_by(ModelUsage.created_at.desc())
+            .limit(1)
+        )).first()
+        if model is None:
+            return None
+        created_at, calls, tokens = model
+        tool = (await session.execute(
+            select(*(getattr(ToolUsage, c) for c in TOOL_COUNTERS))
+            .where(ToolUsage.account == account, ToolUsage.created_at == created_at)
+            .limit(1)
+        )).first()
+        quotas = await session.execute(
+            select(QuotaLimit.type, QuotaLimit.percentage, QuotaLimit.current_usage, QuotaLimit.total)
+            .where(QuotaLimit.account == account, QuotaLimit.created_at == created_at)
+        )
+        return Frame(
+            created_at, calls, tokens,
+            tuple(tool) if tool is not None else (None, None, None, None),
+            {quota_type: (percentage, current, total) for quota_type, percentage, current, total in quotas},
+        )
+
+
+def format_frame(account: str, frame: Frame) -> str:
+    lines = [f"<b>🕰 {html.escape(account)} at {frame.created_at.strftime('%Y-%m-%d %H:%M')} UTC</b>\n"]
+    lines.append("<b>Model Usage:</b>")
+    lines.append(f"• Total Calls: {frame.total_model_call_count}")
+    lines.append(f"• Total Tokens: {frame.total_tokens_usage:,}")
+    network_search, web_read, zread, search = frame.tools
+    if search is not None:
+        lines.append("\n<b>Tool Usage:</b>")
+        lines.append(f"• Total Search: {search}")
+        lines.append(f"• Network Search: {network_search}, Web Read: {web_read}, ZRead: {zread}")
+    if frame.quotas:
+        lines.append("\n<b>Quota Limits:</b>")
+        for quota_type, (percentage, current_usage, total) in sorted(frame.quotas.items()):
+            lines.append(f"• {quota_type}: {percentage:g}%")
+            if current_usage is not None and total is not None:
+                lines.append(f"  - Current: {current_usage}/{total}")
+    return "\n".join(lines)
+
+
+async def usage_at(account: str, at: datetime) -> Optional[Frame]:
+    """Counters of the account's last snapshot at or before `at`.
+
+    Archived days are answered from the archive, decoding at most one
+    keyframe interval, since compaction and retention thin their raw rows;
+    raw rows answer for the days since.
+    """
+    async with async_session() as session:
+        archived = (await session.execute(
+            select(UsageArchive.day, UsageArchive.data)
+            .where(UsageArchive.account == account, UsageArchive.day <= at.date(), UsageArchive.first_at <= at)
+            .order_by(UsageArchive.day.desc())
+            .limit(1)
+        )).first()
+    frames = decode_day(archived.day, archived.data, until=at) if archived is not None else []
+    frame = frames[-1] if frames else None
+    raw = await load_frame_before(account, at)
+    if raw is not None and (frame is None or _ms(raw.created_at - frame.created_at) > 0):
+        return raw
+    return frame
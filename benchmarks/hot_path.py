@@ -0,0 +1,333 @@
+"""Benchmarks for the poll -> parse -> persist -> render hot path.
+
+    python -m benchmarks.hot_path                      # compare with baseline.json
+    python -m benchmarks.hot_path --update-baseline    # record a new baseline
+    python -m benchmarks.hot_path --profile large      # tens of millions of series rows
+
+Cases run across payload sizes (series points) and database sizes (series
+rows already stored). Each case reports the fastest of --repeat samples, in
+seconds per call; a case slower than baseline * (1 + threshold) is a
+regression and fails the run.
+
+Profiles pick the sizes: "default" seeds up to 100k rows and runs in about
+a minute; "large" seeds up to 30 million, the size of a long-running
+multi-account deployment, and takes a long while (use Postgres through
+BENCH_DATABASE_URL). Each profile has its own baseline file, which records
+the machine and database it was measured on. Timings only compare on the
+same machine: against a baseline from elsewhere the run reports ratios but
+does not fail, so re-record the baseline (--update-baseline) wherever the
+benchmark gates changes.
+
+The database comes from BENCH_DATABASE_URL (never DATABASE_URL, the tables
+are dropped and recreated) and defaults to a temporary SQLite file, which
+needs aiosqlite installed.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'zquota_bench.db')}",
+)
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+import sqlalchemy as sa
+import sqlmodel as sqlm
+
+from db_models import ModelUsage, ModelUsageTimeSeries, get_engine, dispose_engine
+from db_usage import persist_usage
+from fetch_usage import process_quota_limit
+from reports import format_usage_from_db, get_latest_usage_from_db
+from models import ModelUsageResponse, QuotaLimitResponse, ToolUsageResponse
+
+# Profile -> (payload sizes, seeded series rows, baseline file)
+PROFILES = {
+    "default": ("24,240,2400,10000", "0,100000", "baseline.json"),
+    "large": ("24,2400", "0,1000000,10000000,30000000", "baseline-large.json"),
+}
+DEFAULT_THRESHOLD = 0.25
+# Fast cases are called repeatedly per sample, so timer and scheduler noise stays small
+MIN_SAMPLE_SECONDS = 0.05
+SEED_BATCH = 10_000
+
+
+def make_raw_model(points: int) -> dict:
+    start = datetime(2026, 1, 1)
+    return {
+        "x_time": [(start + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M") for i in range(points)],
+        "modelCallCount": [i % 97 for i in range(points)],
+        "tokensUsage": [(i % 97) * 1500 for i in range(points)],
+        "totalUsage": {"totalModelCallCount": points * 48, "totalTokensUsage": points * 72000},
+    }
+
+
+def make_raw_tool(points: int) -> dict:
+    return {
+        "x_time": make_raw_model(points)["x_time"],
+        "networkSearchCount": [1] * points,
+        "webReadMcpCount": [1] * points,
+        "zreadMcpCount": [0] * points,
+        "totalUsage": {
+            "totalNetworkSearchCount": points,
+            "totalWebReadMcpCount": points,
+            "totalZreadMcpCount": 0,
+            "totalSearchMcpCount": points * 2,
+            "toolDetails": [{"modelName": "search-prime", "totalUsageCount": points}],
+        },
+    }
+
+
+def make_raw_quota(limits: int) -> dict:
+    items = []
+    for i in range(limits):
+        if i % 2:
+            items.append({
+                "type": "TIME_LIMIT",
+                "percentage": i % 100,
+                "currentValue": i,
+                "usage": 1000,
+                "usageDetails": [{"modelCode": "search-prime", "usage": i}],
+            })
+        else:
+            items.append({"type": "TOKENS_LIMIT", "percentage": i % 100})
+    return {"limits": items}
+
+
+def make_fetch_result(points: int) -> dict:
+    return {
+        "model": ModelUsageResponse.model_validate(make_raw_model(points)),
+        "tool": ToolUsageResponse.model_validate(make_raw_tool(points)),
+        "quota": QuotaLimitResponse.model_validate(process_quota_limit(make_raw_quota(2))),
+    }
+
+
+def timed(fn, repeat: int) -> float:
+    """Fastest seconds per call over `repeat` samples of at least MIN_SAMPLE_SECONDS each."""
+    number, samples = 1, []
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            break
+        number *= 10
+    samples.append(elapsed / number)
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return min(samples)
+
+
+async def timed_async(fn, repeat: int) -> float:
+    """timed() for coroutine functions."""
+    number, samples = 1, []
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            break
+        number *= 10
+    samples.append(elapsed / number)
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        samples.append((time.perf_counter() - start) / number)
+    return min(samples)
+
+
+async def reset_db() -> None:
+    async with get_engine().begin() as conn:
+        await conn.run_sync(sqlm.SQLModel.metadata.drop_all)
+        await conn.run_sync(sqlm.SQLModel.metadata.create_all)
+
+
+async def seed_db(rows: int, points_per_snapshot: int = 24) -> None:
+    """Fill the series table with `rows` rows spread over snapshots of 24 points."""
+    snapshots = max(rows // points_per_snapshot, 1) if rows else 0
+    # One snapshot a minute, ending before now, so the snapshots saved by the cases are the latest
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=snapshots + 1)
+    model_table = ModelUsage.__table__
+    series_table = ModelUsageTimeSeries.__table__
+
+    for first in range(0, snapshots, SEED_BATCH):
+        last = min(first + SEED_BATCH, snapshots)
+        async with get_engine().begin() as conn:
+            await conn.execute(model_table.insert(), [
+                {
+                    "id": i + 1,
+                    "account": "default",
+                    "created_at": start + timedelta(minutes=i),
+                    "total_model_call_count": i,
+                    "total_tokens_usage": i * 1000,
+                }
+                for i in range(first, last)
+            ])
+            series = [
+                {
+                    "account": "default",
+                    "model_usage_id": i + 1,
+                    "created_at": start + timedelta(minutes=i),
+                    "time": start + timedelta(minutes=i) - timedelta(hours=h),
+                    "call_count": h,
+                    "tokens_usage": h * 1000,
+                }
+                for i in range(first, last)
+                for h in range(points_per_snapshot)
+            ]
+            for offset in range(0, len(series), SEED_BATCH):
+                await conn.execute(series_table.insert(), series[offset:offset + SEED_BATCH])
+
+    if BENCH_DATABASE_URL.startswith("postgresql"):
+        # Keep the id sequence ahead of the explicit IDs used for seeding
+        async with get_engine().begin() as conn:
+            await conn.execute(sa.text(
+                "SELECT setval(pg_get_serial_sequence('model_usage', 'id'), "
+                "(SELECT COALESCE(MAX(id), 1) FROM model_usage))"
+            ))
+
+
+def run_parse_cases(sizes, repeat, results) -> None:
+    for size in sizes:
+        raw_quota = make_raw_quota(size)
+        results[f"process_quota_limit[n={size}]"] = timed(lambda: process_quota_limit(raw_quota), repeat)
+
+        raw_model = make_raw_model(size)
+        results[f"model_usage_validate[n={size}]"] = timed(
+            lambda: ModelUsageResponse.model_validate(raw_model).parsed_time_series, repeat
+        )
+
+
+async def run_db_cases(sizes, db_rows, repeat, results) -> None:
+    for rows in db_rows:
+        await reset_db()
+        await seed_db(rows)
+        for size in sizes:
+            data = make_fetch_result(size)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[f"save_usage_to_db[n={size},rows={rows}]"] = await timed_async(
+                    lambda: persist_usage("default", data), repeat
+                )
+
+            # The latest snapshot now carries `size` series points
+            results[f"get_latest_usage_from_db[n={size},rows={rows}]"] = await timed_async(
+                lambda: get_latest_usage_from_db("default"), repeat
+            )
+
+            model, tool, quotas = await get_latest_usage_from_db("default")
+            results[f"format_usage_from_db[n={size},rows={rows}]"] = timed(
+                lambda: format_usage_from_db(model, tool, quotas), repeat
+            )
+
+
+def cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def environment(profile: str) -> dict:
+    """What the timings depend on besides the code; stored with the baseline."""
+    return {
+        "profile": profile,
+        "cpu": cpu_model(),
+        "cpus": os.cpu_count(),
+        "system": f"{platform.system()} {platform.machine()}",
+        "python": platform.python_version(),
+        "database": sa.engine.make_url(BENCH_DATABASE_URL).get_backend_name(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    print(f"{'case':60} {'seconds':>12} {'baseline':>12} {'ratio':>7}")
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        ratio = seconds / base if base else None
+        flag = ""
+        if ratio is not None and ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        base_str = f"{base:12.6f}" if base else f"{'-':>12}"
+        ratio_str = f"{ratio:7.2f}" if ratio is not None else f"{'-':>7}"
+        print(f"{name:60} {seconds:12.6f} {base_str} {ratio_str}{flag}")
+    return regressions
+
+
+async def run(args) -> int:
+    default_sizes, default_db_rows, baseline_name = PROFILES[args.profile]
+    sizes = [int(s) for s in (args.sizes or default_sizes).split(",")]
+    db_rows = [int(r) for r in (args.db_rows or default_db_rows).split(",")]
+    baseline_path = args.baseline or os.path.join(os.path.dirname(__file__), baseline_name)
+    current = environment(args.profile)
+    results = {}
+
+    run_parse_cases(sizes, args.repeat, results)
+    if not args.skip_db:
+        await run_db_cases(sizes, db_rows, args.repeat, results)
+    await dispose_engine()
+
+    if args.update_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(
+                {"threshold": args.threshold, "environment": current, "cases": results}, f, indent=2, sort_keys=True
+            )
+            f.write("\n")
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    baseline, recorded = {}, None
+    threshold = args.threshold
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            stored = json.load(f)
+        baseline = stored.get("cases", {})
+        threshold = stored.get("threshold", threshold)
+        recorded = stored.get("environment")
+
+    regressions = compare(results, baseline, threshold)
+    if recorded != current:
+        print(f"Baseline was recorded on {recorded or 'an unknown machine'}, this is {current}")
+        print("Ratios are not comparable; re-record with --update-baseline on this machine")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than baseline by more than {threshold:.0%}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="default")
+    parser.add_argument("--sizes", help="series points per payload (default: the profile's)")
+    parser.add_argument("--db-rows", help="series rows seeded before DB cases (default: the profile's)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--baseline", help="baseline file (default: the profile's)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--skip-db", action="store_true", help="only run the parse cases")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Load test: bot commands and multi-account polling in one process.
+
+    python -m benchmarks.load
+    python -m benchmarks.load --accounts 10,100,500 --rates 20,100,400 --duration 20
+    python -m benchmarks.load --commands usage,fleet --api-latency-ms 150 --send-latency-ms 40
+
+For every number of accounts the database is reset and the accounts are
+served by stub_api. Then, for every command rate, synthetic Telegram
+updates are fed straight into the dispatcher at that rate (open loop, so a
+slow handler cannot slow the arrivals down) while the poller runs back to
+back cycles over all accounts. Bot API calls never leave the process; they
+take --send-latency-ms each.
+
+Per step the report shows command latency percentiles (from the moment the
+update was due), the throughput achieved, the poll cycle time and snapshots
+per second, connection pool waits and peak occupancy, and event-loop lag.
+Latency that climbs with the rate while throughput stops following it marks
+the capacity of one instance.
+
+The database comes from BENCH_DATABASE_URL (never DATABASE_URL, the tables
+are dropped and recreated) and defaults to a temporary SQLite file.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'zquota_load.db')}",
+)
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+os.environ["SPOOL_DIR"] = tempfile.mkdtemp(prefix="zquota_load_spool_")
+
+import sqlmodel as sqlm
+from aiogram import Bot, types
+from aiogram.client.session.base import BaseSession
+from aiohttp.test_utils import TestServer
+
+import main as service
+from accounts import load_accounts
+from config import config
+from db_metrics import _percentile, pool_metrics
+from db_models import dispose_engine, get_engine
+from diagnostics import LoopLagMonitor
+from recent import recent_usage
+from stub_api import STATS_KEY, StubConfig, create_app
+
+DEFAULT_ACCOUNTS = "1,10,50"
+DEFAULT_RATES = "10,50,200"
+DEFAULT_COMMANDS = "usage"
+# Seconds between occupancy samples of the connection pool
+POOL_SAMPLE_INTERVAL = 0.05
+# Chats the synthetic updates come from; all admins, so /fleet and /pool answer
+LOAD_CHATS = 1000
+
+
+class LoadSession(BaseSession):
+    """Bot API session that answers every method locally after a fixed delay."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def command_update(update_id: int, text: str) -> types.Update:
+    chat_id = 1_000_000 + update_id % LOAD_CHATS
+    return types.Update(
+        update_id=update_id,
+        message=types.Message(
+            message_id=update_id,
+            date=datetime.now(timezone.utc),
+            chat=types.Chat(id=chat_id, type="private"),
+            from_user=types.User(id=chat_id, is_bot=False, first_name="load"),
+            text=text,
+        ),
+    )
+
+
+def command_texts(commands, accounts):
+    """Endless random command lines over the configured accounts."""
+    rng = random.Random(0)
+    while True:
+        command = rng.choice(commands)
+        if command in ("usage", "history", "chart"):
+            yield f"/{command} {rng.choice(accounts).name}"
+        else:
+            yield f"/{command}"
+
+
+async def reset_db() -> None:
+    async with get_engine().begin() as conn:
+        await conn.run_sync(sqlm.SQLModel.metadata.drop_all)
+        await conn.run_sync(sqlm.SQLModel.metadata.create_all)
+
+
+async def drive_commands(dp, bot, texts, rate: float, duration: float, latencies: list, errors: list) -> None:
+    """Feed updates at `rate` per second for `duration` seconds and wait for them all."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    pending = set()
+
+    async def handle(update, due):
+        try:
+            await dp.feed_update(bot, update)
+            latencies.append(loop.time() - due)
+        except Exception as e:
+            errors.append(e)
+
+    for i in itertools.count():
+        due = start + i / rate
+        if due >= start + duration:
+            break
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(handle(command_update(i + 1, next(texts)), due))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+
+async def drive_poller(accounts, cycles: list) -> None:
+    """Poll every account back to back until cancelled."""
+    while True:
+        start = time.perf_counter()
+        await service.send_periodic_report(accounts)
+        cycles.append(time.perf_counter() - start)
+
+
+async def sample_pool(peak: dict) -> None:
+    while True:
+        pool = pool_metrics.pool
+        if pool is not None:
+            peak["checked_out"] = max(peak["checked_out"], pool.checkedout())
+            peak["capacity"] = pool.size() + pool._max_overflow
+        await asyncio.sleep(POOL_SAMPLE_INTERVAL)
+
+
+async def run_step(dp, bot, accounts, commands, rate: float, duration: float) -> dict:
+    latencies, errors, cycles = [], [], []
+    peak = {"checked_out": 0, "capacity": None}
+    lag = LoopLagMonitor(interval=0.05, warn_ms=float("inf"), window=100_000)
+    pool_metrics.reset()
+
+    background = [
+        asyncio.create_task(drive_poller(accounts, cycles)),
+        asyncio.create_task(lag.run()),
+        asyncio.create_task(sample_pool(peak)),
+    ]
+    started = time.perf_counter()
+    try:
+        await drive_commands(dp, bot, command_texts(commands, accounts), rate, duration, latencies, errors)
+    finally:
+        elapsed = time.perf_counter() - started
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+
+    pool = pool_metrics.snapshot()
+    lags = lag.snapshot()
+    return {
+        "accounts": len(accounts),
+        "rate": rate,
+        "commands": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "cycles": len(cycles),
+        "cycle_p50_s": _percentile(cycles, 0.50),
+        "snapshots_per_s": len(cycles) * len(accounts) / sum(cycles) if cycles else 0.0,
+        "pool_wait_p95_ms": pool["wait_p95_ms"],
+        "pool_wait_max_ms": pool["wait_max_ms"],
+        "pool_timeouts": pool["timeouts"],
+        "pool_peak": peak["checked_out"],
+        "pool_capacity": peak["capacity"],
+        "lag_p95_ms": lags.get("p95_ms", 0.0),
+        "lag_max_ms": lags.get("max_ms", 0.0),
+    }
+
+
+def format_row(row: dict) -> str:
+    pool = f"{row['pool_peak']}/{row['pool_capacity']}" if row["pool_capacity"] else "-"
+    return (
+        f"{row['accounts']:>8} {row['rate']:>7g} {row['throughput']:>8.1f} {row['errors']:>5} "
+        f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+        f"{row['cycle_p50_s']:>8.2f} {row['snapshots_per_s']:>8.1f} "
+        f"{row['pool_wait_p95_ms']:>8.1f} {row['pool_timeouts']:>5} {pool:>7} "
+        f"{row['lag_p95_ms']:>8.1f} {row['lag_max_ms']:>8.1f}"
+    )
+
+
+HEADER = (
+    f"{'accounts':>8} {'rate/s':>7} {'done/s':>8} {'errs':>5} "
+    f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+    f"{'cycle s':>8} {'snap/s':>8} "
+    f"{'pool p95':>8} {'tmo':>5} {'conns':>7} "
+    f"{'lag p95':>8} {'lag max':>8}"
+)
+
+
+async def run(args) -> int:
+    account_counts = [int(n) for n in args.accounts.split(",")]
+    rates = [float(r) for r in args.rates.split(",")]
+    commands = args.commands.split(",")
+
+    stub = TestServer(
+        create_app(StubConfig(latency_ms=args.api_latency_ms, jitter_ms=args.api_jitter_ms)), host="127.0.0.1"
+    )
+    await stub.start_server()
+    base_url = f"http://127.0.0.1:{stub.port}/api/anthropic"
+
+    os.environ["ADMIN_CHAT_IDS"] = ",".join(str(1_000_000 + i) for i in range(LOAD_CHATS))
+    session = LoadSession(args.send_latency_ms)
+    bot = Bot(token="42:LOAD", session=session)
+    # send_periodic_report() and the handlers use the process-wide bot
+    service._bot = bot
+    dp = service.create_dispatcher()
+
+    rows = []
+    print(HEADER)
+    try:
+        for count in account_counts:
+            os.environ["ACCOUNTS"] = json.dumps([
+                {"name": f"acc-{i}", "base_url": base_url, "auth_token": f"acc-{i}"} for i in range(count)
+            ])
+            config.reload()
+            accounts = load_accounts()
+            await reset_db()
+            recent_usage.retain([])
+            # Every account has a snapshot before the first command arrives
+            with contextlib.redirect_stdout(io.StringIO()):
+                await service.send_periodic_report(accounts)
+
+            for rate in rates:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    row = await run_step(dp, bot, accounts, commands, rate, args.duration)
+                rows.append(row)
+                print(format_row(row))
+    finally:
+        await stub.close()
+        await dispose_engine()
+
+    print(f"\nStub API requests: {stub.app[STATS_KEY]['requests']}, Bot API calls: {session.calls}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+        print(f"Results written to {args.json}")
+    return 1 if any(row["errors"] for row in rows) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", default=DEFAULT_ACCOUNTS, help="account counts to step through")
+    parser.add_argument("--rates", default=DEFAULT_RATES, help="commands per second to step through")
+    parser.add_argument("--commands", default=DEFAULT_COMMANDS, help="commands to mix, e.g. usage,fleet,history")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="stub API response delay")
+    parser.add_argument("--api-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--send-latency-ms", type=float, default=0.0, help="delay of every Bot API call")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
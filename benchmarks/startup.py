@@ -0,0 +1,62 @@
+"""Import-time budget for the service modules.
+
+    python -m benchmarks.startup
+
+Each module is imported in a fresh interpreter with DATABASE_URL unset and
+its cumulative `-X importtime` cost is compared with its budget. Anything
+over budget fails the run, so heavy imports creeping back to module level
+(aiogram, the async DB driver, aiohttp) get noticed.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Milliseconds of cumulative import time allowed per module
+BUDGETS_MS = {
+    "models": 400,
+    "fetch_usage": 450,
+    "db_models": 1200,
+    "db_usage": 1300,
+    "reports": 1300,
+    "main": 8000,
+}
+
+
+def import_time_ms(module: str) -> float:
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    pattern = re.compile(rf"import time:\s+\d+ \|\s+(\d+) \| {re.escape(module)}$")
+    for line in proc.stderr.splitlines():
+        match = pattern.match(line)
+        if match:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs per module")
+    args = parser.parse_args()
+
+    over = []
+    print(f"{'module':15} {'ms':>10} {'budget':>10}")
+    for module, budget in BUDGETS_MS.items():
+        ms = min(import_time_ms(module) for _ in range(args.repeat))
+        flag = "  OVER BUDGET" if ms > budget else ""
+        if flag:
+            over.append(module)
+        print(f"{module:15} {ms:10.1f} {budget:10d}{flag}")
+
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
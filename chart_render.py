@@ -0,0 +1,62 @@
+"""PNG rendering of usage charts.
+
+Kept free of database and bot imports so process-pool workers start quickly.
+"""
+import io
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class ChartData:
+    """Plain data handed to a render worker."""
+
+    account: str
+    range_label: str
+    times: List[datetime] = field(default_factory=list)
+    calls: List[Optional[int]] = field(default_factory=list)
+    tokens: List[Optional[int]] = field(default_factory=list)
+    # Quota type -> [(time, percentage)]
+    quotas: Dict[str, List[Tuple[datetime, float]]] = field(default_factory=dict)
+
+
+def render_chart_png(data: ChartData) -> bytes:
+    """Render calls, tokens and quota percentage as a three-panel PNG."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+
+    fig, (ax_calls, ax_tokens, ax_quota) = plt.subplots(
+        3, 1, figsize=(8, 7), sharex=True, constrained_layout=True
+    )
+    fig.suptitle(f"{data.account} usage, last {data.range_label}")
+
+    calls = [c if c is not None else 0 for c in data.calls]
+    tokens = [t if t is not None else 0 for t in data.tokens]
+    bar_width = 1 / 24 * 0.8  # hourly bars, in days
+
+    ax_calls.bar(data.times, calls, width=bar_width, color="#4c72b0")
+    ax_calls.set_ylabel("Calls / hour")
+
+    ax_tokens.bar(data.times, tokens, width=bar_width, color="#dd8452")
+    ax_tokens.set_ylabel("Tokens / hour")
+
+    for quota_type, points in data.quotas.items():
+        if points:
+            xs, ys = zip(*points)
+            ax_quota.plot(xs, ys, label=quota_type)
+    ax_quota.set_ylabel("Quota %")
+    ax_quota.set_ylim(0, 100)
+    if data.quotas:
+        ax_quota.legend(loc="upper left", fontsize="small")
+
+    ax_quota.xaxis.set_major_formatter(mdates.DateFormatter("%m-%d %H:%M"))
+    fig.autofmt_xdate()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=100)
+    plt.close(fig)
+    return buf.getvalue()
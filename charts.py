@@ -0,0 +1,100 @@
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Hashable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from chart_render import ChartData, render_chart_png
+from db_models import ModelUsage, async_session
+from offload import run_cpu
+from recent import recent_usage
+from reports import load_hourly_quotas_from_db, load_hourly_series_from_db
+
+load_dotenv()
+
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "256"))
+
+# Range argument of /chart -> hours covered
+CHART_RANGES = {"6h": 6, "12h": 12, "24h": 24, "3d": 72, "7d": 168}
+DEFAULT_CHART_RANGE = "24h"
+
+class ChartCache:
+    """LRU of rendered charts keyed by (account, range, data version).
+
+    Values are Telegram file_ids once a chart has been uploaded, so repeat
+    requests resend the photo without rendering or uploading it again.
+    """
+
+    def __init__(self, max_size: int = CHART_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, str]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        file_id = self._items.get(key)
+        if file_id is not None:
+            self._items.move_to_end(key)
+        return file_id
+
+    def put(self, key: Hashable, file_id: str) -> None:
+        self._items[key] = file_id
+        self._items.move_to_end(key)
+        self._evict()
+
+    def resize(self, max_size: int) -> None:
+        """Change the capacity, keeping the most recently used entries."""
+        self.max_size = max_size
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate_account(self, account: str) -> None:
+        for key in [k for k in self._items if k[0] == account]:
+            del self._items[key]
+
+
+chart_cache = ChartCache()
+
+
+async def get_data_version(account: str) -> Hashable:
+    """Identifies the latest snapshot of an account; changes whenever new data is ingested."""
+    buffer = recent_usage.get(account)
+    if buffer is not None and buffer.model is not None:
+        return buffer.model.created_at
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(func.max(ModelUsage.id)).where(ModelUsage.account == account)
+        )
+        return result.scalar() or 0
+
+
+async def load_chart_data(account: str, range_label: str) -> ChartData:
+    """Load hourly series and hourly quota percentages for a chart range.
+
+    Ranges held by the in-memory buffer are served from it; longer ones query the database.
+    """
+    since = datetime.now(timezone.utc) - timedelta(hours=CHART_RANGES[range_label])
+    data = ChartData(account=account, range_label=range_label)
+
+    buffer = recent_usage.get(account)
+    if buffer is not None and buffer.covers(since):
+        series = buffer.series_since(since)
+        data.quotas = buffer.quotas_since(since)
+    else:
+        series = await load_hourly_series_from_db(account, since)
+        data.quotas = await load_hourly_quotas_from_db(account, since)
+
+    for time, calls, tokens in series:
+        data.times.append(time)
+        data.calls.append(calls)
+        data.tokens.append(tokens)
+    return data
+
+
+async def render_chart(data: ChartData) -> bytes:
+    """Render a chart in the offload pool without blocking the event loop."""
+    return await run_cpu(render_chart_png, data)
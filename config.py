@@ -0,0 +1,176 @@
+"""Typed runtime settings that can change without a restart.
+
+The environment (and .env) gives the starting values under the usual
+variable names. CONFIG_FILE, an optional TOML file with the same settings
+in lower case, overrides them:
+
+    poll_interval = 30
+    admin_chat_ids = ["123456"]
+    anomaly_z_threshold = 5
+
+    [[accounts]]
+    name = "team"
+    base_url = "https://api.z.ai/api/anthropic"
+    auth_token = "..."
+    chat_ids = ["123456"]  # chats allowed to read it, besides admins
+
+config.reload() re-reads both. It runs when the file changes (watched
+every CONFIG_WATCH_SECONDS), on SIGHUP and on /reload. Listeners apply
+only the settings that changed to the live objects, so caches, buffers and
+baselines stay warm. A file that fails to parse or validate leaves the
+current settings in place.
+
+The database, the bot token, BOT_MODE, the webhook and pool settings are
+read once at startup and still need a restart.
+"""
+import os
+import tomllib
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from accounts import Account, parse_accounts
+from anomaly import ANOMALY_MIN_SAMPLES, ANOMALY_SPAN_HOURS, ANOMALY_Z_THRESHOLD
+from charts import CHART_CACHE_SIZE
+from diagnostics import LOOP_LAG_WARN_MS
+from recent import RECENT_HOURS
+
+load_dotenv()
+
+CONFIG_FILE = os.getenv("CONFIG_FILE", "config.toml")
+# Seconds between checks of CONFIG_FILE for changes
+CONFIG_WATCH_SECONDS = float(os.getenv("CONFIG_WATCH_SECONDS", "10"))
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "60"))
+
+
+def _chat_ids(value) -> FrozenSet[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    return frozenset(str(v).strip() for v in value if str(v).strip())
+
+
+@dataclass(frozen=True)
+class Settings:
+    accounts: Tuple[Account, ...] = ()
+    poll_interval: float = POLL_INTERVAL
+    # Chats allowed to use diagnostic commands and to read every account
+    admin_chat_ids: FrozenSet[str] = frozenset()
+    # Legacy chat subscribed to every account, and allowed to read them
+    chat_id: Optional[str] = None
+    anomaly_z_threshold: float = ANOMALY_Z_THRESHOLD
+    anomaly_min_samples: int = ANOMALY_MIN_SAMPLES
+    anomaly_span_hours: int = ANOMALY_SPAN_HOURS
+    chart_cache_size: int = CHART_CACHE_SIZE
+    recent_hours: int = RECENT_HOURS
+    loop_lag_warn_ms: float = LOOP_LAG_WARN_MS
+
+    def __post_init__(self):
+        if self.poll_interval < 1:
+            raise ValueError("poll_interval must be at least 1 second")
+        for name in ("anomaly_span_hours", "chart_cache_size", "recent_hours"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{name} must be positive")
+        if self.anomaly_min_samples < 0 or self.anomaly_z_threshold <= 0 or self.loop_lag_warn_ms <= 0:
+            raise ValueError("anomaly and lag thresholds must be positive")
+        names = [a.name for a in self.accounts]
+        if len(set(names)) != len(names):
+            raise ValueError("account names must be unique")
+
+    @classmethod
+    def load(cls, environ: Mapping[str, str], overrides: Mapping[str, Any]) -> "Settings":
+        """Settings from environment variables, with `overrides` (CONFIG_FILE keys) on top."""
+        unknown = set(overrides) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+
+        def pick(name: str):
+            return overrides[name] if name in overrides else environ.get(name.upper())
+
+        values: Dict[str, Any] = {}
+        for name, convert in (
+            ("poll_interval", float),
+            ("anomaly_z_threshold", float),
+            ("anomaly_min_samples", int),
+            ("anomaly_span_hours", int),
+            ("chart_cache_size", int),
+            ("recent_hours", int),
+            ("loop_lag_warn_ms", float),
+        ):
+            value = pick(name)
+            if value not in (None, ""):
+                values[name] = convert(value)
+        if pick("admin_chat_ids") is not None:
+            values["admin_chat_ids"] = _chat_ids(pick("admin_chat_ids"))
+        if pick("chat_id"):
+            values["chat_id"] = str(pick("chat_id"))
+
+        if "accounts" in overrides:
+            accounts = parse_accounts(overrides["accounts"])
+        else:
+            accounts = parse_accounts(
+                environ.get("ACCOUNTS"), environ.get("ANTHROPIC_BASE_URL", ""), environ.get("ANTHROPIC_AUTH_TOKEN", "")
+            )
+        return cls(accounts=tuple(accounts), **values)
+
+
+Listener = Callable[[Settings, List[str]], None]
+
+
+class Config:
+    """The current Settings and the listeners applying them."""
+
+    def __init__(self, path: str = CONFIG_FILE):
+        self.path = path
+        self._current: Optional[Settings] = None
+        self._listeners: List[Listener] = []
+        self._mtime: Optional[float] = None
+
+    @property
+    def current(self) -> Settings:
+        if self._current is None:
+            self._current = self._read()
+        return self._current
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _read(self) -> Settings:
+        self._mtime = self._file_mtime()
+        overrides = {}
+        if self._mtime is not None:
+            with open(self.path, "rb") as f:
+                overrides = tomllib.load(f)
+        return Settings.load(os.environ, overrides)
+
+    def on_change(self, listener: Listener) -> None:
+        """Call `listener(settings, changed_names)` after every reload that changed something."""
+        self._listeners.append(listener)
+
+    def reload(self) -> List[str]:
+        """Re-read the settings and apply them; returns the names that changed.
+
+        Raises (keeping the current settings) if the file is invalid.
+        """
+        previous = self.current
+        settings = self._read()
+        changed = [f.name for f in fields(Settings) if getattr(settings, f.name) != getattr(previous, f.name)]
+        self._current = settings
+        if changed:
+            print(f"Configuration reloaded: {', '.join(changed)} changed")
+            for listener in self._listeners:
+                listener(settings, changed)
+        return changed
+
+    async def watch(self) -> None:
+        """Reload when CONFIG_FILE was created, changed or removed since the last read."""
+        if self._current is None:
+            self._current = self._read()
+        elif self._file_mtime() != self._mtime:
+            self.reload()
+
+
+config = Config()
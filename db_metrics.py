@@ -0,0 +1,111 @@
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Recent samples kept for percentiles
+SAMPLE_SIZE = 1000
+
+
+def _percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class PoolMetrics:
+    """Connection pool wait and checkout statistics."""
+
+    def __init__(self):
+        self.pool: Optional[AsyncAdaptedQueuePool] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Zero the counters; the pool being watched stays."""
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_held = 0.0
+        self.waits: deque = deque(maxlen=SAMPLE_SIZE)
+        self.held: deque = deque(maxlen=SAMPLE_SIZE)
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self.waits.append(seconds)
+
+    def record_held(self, seconds: float) -> None:
+        self.total_held += seconds
+        self.held.append(seconds)
+
+    def snapshot(self) -> dict:
+        """Current counters, wait/hold percentiles (ms) and pool occupancy."""
+        stats = {
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+            "wait_p95_ms": _percentile(self.waits, 0.95) * 1000,
+            "wait_max_ms": self.max_wait * 1000,
+            "held_p95_ms": _percentile(self.held, 0.95) * 1000,
+        }
+        if self.pool is not None:
+            stats.update(
+                size=self.pool.size(),
+                checked_out=self.pool.checkedout(),
+                overflow=self.pool.overflow(),
+                idle=self.pool.checkedin(),
+            )
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_metrics.pool = self
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool_metrics.pool = pool
+        return pool
+
+
+def install_pool_listeners(engine) -> None:
+    """Track connection creation and how long connections are held."""
+    pool = engine.sync_engine.pool
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        pool_metrics.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            pool_metrics.record_held(time.perf_counter() - started)
@@ -1,27 +1,202 @@
+import asyncio
 import os
-from datetime import datetime, timezone, timedelta
-from typing import Optional, List
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone, timedelta
+from typing import TYPE_CHECKING, AsyncIterator, Optional, List
 from enum import Enum
 
 import sqlmodel as sqlm
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy import ForeignKey, DateTime
+from sqlalchemy import ForeignKey, DateTime, Index, LargeBinary, UniqueConstraint, event
+from sqlalchemy.types import TypeDecorator
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+# Created on first use so importing the models (scripts, tests, Alembic) does
+# not need DATABASE_URL or load the async driver stack.
+_engine: Optional["AsyncEngine"] = None
+_session_factory = None
+_write_lock: Optional[asyncio.Lock] = None
+
+# Applied to every SQLite connection: WAL lets readers run alongside the single
+# writer, and NORMAL sync is durable enough under WAL.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-20000"),  # negative = KiB
+}
+
+
+def get_async_database_url() -> str:
+    """DATABASE_URL with the async driver selected.
+
+    postgresql:// becomes postgresql+asyncpg:// and sqlite:// becomes sqlite+aiosqlite://.
+    """
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise RuntimeError("DATABASE_URL is not set")
+    if database_url.startswith("postgresql://"):
+        return database_url.replace("postgresql://", "postgresql+asyncpg://")
+    if database_url.startswith("sqlite://"):
+        return database_url.replace("sqlite://", "sqlite+aiosqlite://")
+    return database_url
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_engine_options(url: str) -> dict:
+    """Pool and statement-cache settings for create_async_engine, from the environment.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT: QueuePool sizing.
+    DB_POOL_PRE_PING, DB_POOL_RECYCLE: connection liveness checks / max age (seconds).
+    DB_STATEMENT_CACHE_SIZE: asyncpg prepared statements cached per connection.
+    DB_QUERY_CACHE_SIZE: SQLAlchemy compiled-statement cache entries.
+    """
+    options = {
+        "echo": False,
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "query_cache_size": int(os.getenv("DB_QUERY_CACHE_SIZE", "500")),
+    }
+    if url.startswith("postgresql+asyncpg"):
+        from db_metrics import MeteredQueuePool
+
+        options.update(
+            poolclass=MeteredQueuePool,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            connect_args={
+                "prepared_statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+            },
+        )
+    elif url.startswith("sqlite") and (":memory:" in url or url.endswith("://")):
+        from sqlalchemy.pool import StaticPool
+
+        # Every connection to :memory: is a new database; share a single one
+        options.update(poolclass=StaticPool, connect_args={"check_same_thread": False})
+    return options
+
+
+def get_engine() -> "AsyncEngine":
+    """The process-wide async engine, created on first use."""
+    global _engine
+    if _engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        from db_metrics import install_pool_listeners
+
+        url = get_async_database_url()
+        _engine = create_async_engine(url, **get_engine_options(url))
+        install_pool_listeners(_engine)
+        if _engine.dialect.name == "sqlite":
+            event.listen(_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return _engine
+
+
+def is_sqlite() -> bool:
+    return get_engine().dialect.name == "sqlite"
+
+
+def get_session_factory():
+    """Session factory bound to the engine, created on first use."""
+    global _session_factory
+    if _session_factory is None:
+        from sqlalchemy.ext.asyncio import AsyncSession
+        from sqlalchemy.orm import sessionmaker
+
+        _session_factory = sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
+    return _session_factory
+
+
+def async_session() -> "AsyncSession":
+    """Open a new session: `async with async_session() as session: ...`."""
+    return get_session_factory()()
+
+
+@asynccontextmanager
+async def write_session() -> AsyncIterator["AsyncSession"]:
+    """Session for writes.
+
+    SQLite allows one writer at a time, so writers queue on a FIFO lock instead
+    of failing with "database is locked"; other backends write concurrently.
+    """
+    global _write_lock
+    if not is_sqlite():
+        async with async_session() as session:
+            yield session
+        return
+
+    if _write_lock is None:
+        _write_lock = asyncio.Lock()
+    async with _write_lock:
+        async with async_session() as session:
+            yield session
+
+
+def dialect_insert(model):
+    """INSERT for the configured backend, with on_conflict_do_nothing/do_update."""
+    if is_sqlite():
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(model)
+
+
+async def dispose_engine() -> None:
+    """Close pooled connections and forget the engine (e.g. on shutdown)."""
+    global _engine, _session_factory, _write_lock
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _session_factory = None
+    _write_lock = None
+
+
+def __getattr__(name):
+    # Backwards compatible `from db_models import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class UTCDateTime(TypeDecorator):
+    """Timezone-aware datetime stored as UTC.
 
-# Convert postgresql:// to postgresql+asyncpg:// for async connection
-if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
-    ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
-else:
-    ASYNC_DATABASE_URL = DATABASE_URL
+    Postgres keeps the offset itself; SQLite stores naive text, so values are
+    normalised to UTC on the way in and marked as UTC on the way out.
+    """
 
+    impl = DateTime(timezone=True)
+    cache_ok = True
 
-engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
-async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None and dialect.name == "sqlite":
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
 
 
 # Beijing timezone (UTC+8)
@@ -32,37 +207,51 @@ class ModelUsage(sqlm.SQLModel, table=True):
     """Model usage statistics snapshot (parent)."""
 
     __tablename__ = "model_usage"
+    # Also the snapshot's upsert key: spooled snapshots are replayed idempotently
+    __table_args__ = (Index("ix_model_usage_account_created_at", "account", "created_at", unique=True),)
 
     id: Optional[int] = sqlm.Field(default=None, primary_key=True)
     created_at: datetime = sqlm.Field(
         default_factory=lambda: datetime.now(timezone.utc),
-        sa_type=DateTime(timezone=True)
+        sa_type=UTCDateTime
     )
 
+    account: str = sqlm.Field(default="default", index=True)
+
     total_model_call_count: int = sqlm.Field(index=True)
     total_tokens_usage: int = sqlm.Field(index=True)
 
     # Relationship to child time series records
-    time_series: List["ModelUsageTimeSeries"] = sqlm.Relationship(back_populates="model_usage")
+    time_series: List["ModelUsageTimeSeries"] = sqlm.Relationship(
+        back_populates="model_usage",
+        sa_relationship_kwargs={"primaryjoin": "ModelUsage.id == foreign(ModelUsageTimeSeries.model_usage_id)"},
+    )
 
 
 class ModelUsageTimeSeries(sqlm.SQLModel, table=True):
     """Individual time series data point for model usage (child)."""
 
     __tablename__ = "model_usage_time_series"
+    __table_args__ = (Index("ix_model_usage_time_series_account_created_at", "account", "created_at"),)
 
     id: Optional[int] = sqlm.Field(default=None, primary_key=True)
     created_at: datetime = sqlm.Field(
         default_factory=lambda: datetime.now(timezone.utc),
-        sa_type=DateTime(timezone=True)
+        sa_type=UTCDateTime
     )
 
-    # Foreign key to parent
-    model_usage_id: int = sqlm.Field(foreign_key="model_usage.id")
-    model_usage: ModelUsage = sqlm.Relationship(back_populates="time_series")
+    account: str = sqlm.Field(default="default", index=True)
+
+    # Parent snapshot; not a database foreign key, since a partitioned
+    # model_usage can only be referenced together with created_at (c7d2e49f1a68)
+    model_usage_id: int = sqlm.Field(index=True)
+    model_usage: ModelUsage = sqlm.Relationship(
+        back_populates="time_series",
+        sa_relationship_kwargs={"primaryjoin": "ModelUsage.id == foreign(ModelUsageTimeSeries.model_usage_id)"},
+    )
 
     # Time series data - Beijing timezone (converted from API string like "2026-01-05 20:00")
-    time: datetime = sqlm.Field(sa_type=DateTime(timezone=True))
+    time: datetime = sqlm.Field(sa_type=UTCDateTime)
     call_count: Optional[int] = None
     tokens_usage: Optional[int] = None
 
@@ -71,13 +260,16 @@ class ToolUsage(sqlm.SQLModel, table=True):
     """Tool usage statistics snapshot."""
 
     __tablename__ = "tool_usage"
+    __table_args__ = (Index("ix_tool_usage_account_created_at", "account", "created_at"),)
 
     id: Optional[int] = sqlm.Field(default=None, primary_key=True)
     created_at: datetime = sqlm.Field(
         default_factory=lambda: datetime.now(timezone.utc),
-        sa_type=DateTime(timezone=True)
+        sa_type=UTCDateTime
     )
 
+    account: str = sqlm.Field(default="default", index=True)
+
     total_network_search_count: int
     total_web_read_mcp_count: int
     total_zread_mcp_count: int
@@ -91,13 +283,16 @@ class QuotaLimit(sqlm.SQLModel, table=True):
     """Quota limit snapshot."""
 
     __tablename__ = "quota_limit"
+    __table_args__ = (Index("ix_quota_limit_account_created_at", "account", "created_at"),)
 
     id: Optional[int] = sqlm.Field(default=None, primary_key=True)
     created_at: datetime = sqlm.Field(
         default_factory=lambda: datetime.now(timezone.utc),
-        sa_type=DateTime(timezone=True)
+        sa_type=UTCDateTime
     )
 
+    account: str = sqlm.Field(default="default", index=True)
+
     type: str = sqlm.Field(index=True)
     percentage: float = sqlm.Field(index=True)
     current_usage: Optional[int] = None
@@ -106,12 +301,154 @@ class QuotaLimit(sqlm.SQLModel, table=True):
     usage_details_json: Optional[str] = None  # JSON list of QuotaUsageDetail
 
 
-async def get_session() -> AsyncSession:
+class Subscription(sqlm.SQLModel, table=True):
+    """Telegram chat subscribed to periodic reports of an account."""
+
+    __tablename__ = "subscription"
+    __table_args__ = (UniqueConstraint("chat_id", "account", name="uq_subscription_chat_account"),)
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    created_at: datetime = sqlm.Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=UTCDateTime
+    )
+
+    chat_id: str = sqlm.Field(index=True)
+    account: str = sqlm.Field(index=True)
+
+
+class AnomalyState(sqlm.SQLModel, table=True):
+    """Persisted EWMA baseline of an hourly usage metric for an account."""
+
+    __tablename__ = "anomaly_state"
+    __table_args__ = (UniqueConstraint("account", "metric", name="uq_anomaly_state_account_metric"),)
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    updated_at: datetime = sqlm.Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=UTCDateTime
+    )
+
+    account: str = sqlm.Field(index=True)
+    metric: str  # "call_count" or "tokens_usage"
+    mean: float = 0.0
+    variance: float = 0.0
+    samples: int = 0
+
+    # Latest completed hour folded into the baseline
+    last_time: Optional[datetime] = sqlm.Field(default=None, sa_type=UTCDateTime)
+    # Hour we last alerted on, to avoid repeating the alert every poll
+    last_alert_time: Optional[datetime] = sqlm.Field(default=None, sa_type=UTCDateTime)
+
+
+class ApiTimezone(sqlm.SQLModel, table=True):
+    """UTC offset the usage API of a platform reports its hourly times in."""
+
+    __tablename__ = "api_timezone"
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    platform: str = sqlm.Field(unique=True)  # "ZAI", "ZHIPU", "LOCAL"
+    utc_offset_minutes: int
+    # When the offset was last confirmed against a response
+    checked_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+
+
+# Cross-account aggregates: the latest state of every account, kept current
+# as snapshots are stored (see aggregates.py)
+
+
+class AccountSummary(sqlm.SQLModel, table=True):
+    """Latest totals and trailing-24h burn of an account."""
+
+    __tablename__ = "account_summary"
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    account: str = sqlm.Field(unique=True)
+    # Snapshot the row reflects; older snapshots never overwrite it
+    created_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+    total_model_call_count: int
+    total_tokens_usage: int
+    calls_24h: int
+    tokens_24h: int = sqlm.Field(index=True)
+
+
+class ModelCodeUsage(sqlm.SQLModel, table=True):
+    """Latest per-model usage of an account, decoded from the snapshot's JSON breakdowns."""
+
+    __tablename__ = "model_code_usage"
+    __table_args__ = (
+        UniqueConstraint("account", "source", "model_code", name="uq_model_code_usage_account_source_code"),
+    )
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    account: str
+    source: str  # quota type for usage_details_json, "tool" for tool_details_json
+    model_code: str = sqlm.Field(index=True)
+    usage: int
+    created_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+
+
+class QuotaHeadroom(sqlm.SQLModel, table=True):
+    """Latest state of each quota limit of an account."""
+
+    __tablename__ = "quota_headroom"
+    __table_args__ = (UniqueConstraint("account", "type", name="uq_quota_headroom_account_type"),)
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    account: str
+    type: str = sqlm.Field(index=True)
+    percentage: float
+    current_usage: Optional[int] = None
+    total: Optional[int] = None
+    created_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+
+
+class UsageArchive(sqlm.SQLModel, table=True):
+    """A day of an account's snapshot counters, delta-encoded (see archive.py)."""
+
+    __tablename__ = "usage_archive"
+    __table_args__ = (UniqueConstraint("account", "day", name="uq_usage_archive_account_day"),)
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    account: str
+    day: date  # UTC
+    first_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+    last_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+    frames: int
+    data: bytes = sqlm.Field(sa_type=LargeBinary)
+    # Highest model_usage id when the day was written; rows of the day above it arrived late
+    through_id: Optional[int] = None
+    # Raw rows of the day thinned to one snapshot per hour (compact_archived_days)
+    compacted: bool = False
+
+
+class PollerWorker(sqlm.SQLModel, table=True):
+    """A live polling process; accounts are sharded across recent heartbeats."""
+
+    __tablename__ = "poller_worker"
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    worker_id: str = sqlm.Field(unique=True)
+    heartbeat_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+
+
+class AccountLease(sqlm.SQLModel, table=True):
+    """Exclusive right of one worker to poll an account until expires_at."""
+
+    __tablename__ = "account_lease"
+
+    id: Optional[int] = sqlm.Field(default=None, primary_key=True)
+    account: str = sqlm.Field(unique=True)
+    owner: str = sqlm.Field(index=True)
+    expires_at: datetime = sqlm.Field(sa_type=UTCDateTime)
+
+
+async def get_session() -> "AsyncSession":
     async with async_session() as session:
         yield session
 
 
 async def init_db():
     """Initialize database tables."""
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(sqlm.SQLModel.metadata.create_all)
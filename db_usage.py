@@ -1,10 +1,12 @@
 import asyncio
 import json
 from datetime import datetime, timezone, timedelta
+from typing import List
 
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import exc, insert, select
 
+from accounts import Account, DEFAULT_ACCOUNT
+from aggregates import apply_snapshot
 from fetch_usage import UsageFetcher
 from db_models import (
     ModelUsage,
@@ -12,63 +14,150 @@ from db_models import (
     ToolUsage,
     QuotaLimit,
     async_session,
+    dialect_insert,
+    get_engine,
+    write_session,
 )
+from diagnostics import stage
 from models import ModelUsageResponse
-
-
-async def save_usage_to_db():
-    """Fetch usage data and save to database."""
-    fetcher = UsageFetcher()
-
-    async with async_session() as session:
+from notify import notify_snapshot
+from recent import recent_usage
+from spool import Spool, is_transient
+
+
+async def save_usage_to_db(account: Account = None):
+    """Fetch usage data for an account, save it to database and return the fetched data.
+
+    Without an account, the ANTHROPIC_* environment is used as the default account.
+    The snapshot goes to the spool first; if the database is unreachable it is
+    written later by the background flusher instead of being lost.
+    """
+    if account is None:
+        fetcher = UsageFetcher()
+        account_name = DEFAULT_ACCOUNT
+    else:
+        fetcher = UsageFetcher(base_url=account.base_url, auth_token=account.auth_token)
+        account_name = account.name
+
+    with stage(f"{account_name}.fetch"):
+        data = await fetcher.fetch_all()
+    snapshot = build_snapshot(account_name, data)
+    with stage(f"{account_name}.spool"):
+        await usage_spool.append(snapshot)
+    recent_usage.ingest(snapshot)
+    try:
+        with stage(f"{account_name}.db_write"):
+            await usage_spool.flush()
+    except Exception as e:
+        print(f"Error saving to database, snapshot kept in spool: {e}")
+    return data
+
+
+def build_snapshot(account_name: str, data: dict, created_at: datetime = None) -> dict:
+    """Flatten one fetch_all() result into JSON-safe rows for the spool.
+
+    (account, created_at) is the snapshot's upsert key, so it is fixed here,
+    at fetch time, and travels with the record.
+    """
+    created_at = created_at or datetime.now(timezone.utc)
+    model_response = data["model"]
+    tool_usage = data["tool"].total_usage
+    return {
+        "account": account_name,
+        "created_at": created_at.isoformat(),
+        "model": {
+            "total_model_call_count": model_response.total_usage.total_model_call_count,
+            "total_tokens_usage": model_response.total_usage.total_tokens_usage,
+        },
+        "series": [
+            {
+                "time": point.time.isoformat(),
+                "call_count": point.call_count,
+                "tokens_usage": point.tokens_usage,
+            }
+            for point in model_response.parsed_time_series
+        ],
+        "tool": {
+            "total_network_search_count": tool_usage.total_network_search_count,
+            "total_web_read_mcp_count": tool_usage.total_web_read_mcp_count,
+            "total_zread_mcp_count": tool_usage.total_zread_mcp_count,
+            "total_search_mcp_count": tool_usage.total_search_mcp_count,
+            "tool_details_json": json.dumps([detail.model_dump() for detail in tool_usage.tool_details]),
+            "x_time_json": json.dumps(data["tool"].x_time),
+        },
+        "quotas": [
+            {
+                "type": limit.type,
+                "percentage": float(limit.percentage),
+                "current_usage": limit.current_usage,
+                "total": limit.total,
+                "usage_details_json": json.dumps([ud.model_dump() for ud in limit.usage_details]) if limit.usage_details else None,
+            }
+            for limit in data["quota"].limits
+        ],
+    }
+
+
+# Hot write statements, built once so SQLAlchemy reuses their compiled form.
+# Core inserts skip the ORM unit of work; child rows go out as one executemany.
+INSERT_TIME_SERIES = insert(ModelUsageTimeSeries.__table__)
+INSERT_TOOL_USAGE = insert(ToolUsage.__table__)
+INSERT_QUOTA_LIMIT = insert(QuotaLimit.__table__)
+
+
+def insert_model_usage():
+    """Snapshot parent insert; returns no id when (account, created_at) already exists."""
+    table = ModelUsage.__table__
+    return (
+        dialect_insert(table)
+        .on_conflict_do_nothing(index_elements=["account", "created_at"])
+        .returning(table.c.id)
+    )
+
+
+async def persist_snapshots(snapshots: List[dict]) -> None:
+    """Save build_snapshot() records in one transaction.
+
+    Snapshots already in the database are skipped, so replaying records is safe.
+    Stored snapshots also update the cross-account aggregates (aggregates.py)
+    and, on Postgres, are announced with NOTIFY (notify.py).
+    """
+    insert_model = insert_model_usage()
+    series, tools, quotas = [], [], []
+    # Other processes refresh their caches when the transaction commits
+    notify = get_engine().dialect.name == "postgresql"
+
+    async with write_session() as session:
         try:
-            data = await fetcher.fetch_all()
-
-            # Save model usage (parent)
-            model_response = data["model"]  # This is ModelUsageResponse
-            model = ModelUsage(
-                total_model_call_count=model_response.total_usage.total_model_call_count,
-                total_tokens_usage=model_response.total_usage.total_tokens_usage,
-            )
-            session.add(model)
-            await session.flush()  # Get the ID
-
-            # Save time series data (child records) - using Pydantic's parsed data
-            for point in model_response.parsed_time_series:
-                time_series = ModelUsageTimeSeries(
-                    model_usage_id=model.id,
-                    time=point.time,
-                    call_count=point.call_count,
-                    tokens_usage=point.tokens_usage,
-                )
-                session.add(time_series)
-
-            # Save tool usage
-            tool = ToolUsage(
-                total_network_search_count=data["tool"].total_usage.total_network_search_count,
-                total_web_read_mcp_count=data["tool"].total_usage.total_web_read_mcp_count,
-                total_zread_mcp_count=data["tool"].total_usage.total_zread_mcp_count,
-                total_search_mcp_count=data["tool"].total_usage.total_search_mcp_count,
-                tool_details_json=json.dumps(
-                    [detail.model_dump() for detail in data["tool"].total_usage.tool_details]
-                ),
-                x_time_json=json.dumps(data["tool"].x_time),
-            )
-            session.add(tool)
-
-            # Save quota limits
-            for limit in data["quota"].limits:
-                quota = QuotaLimit(
-                    type=limit.type,
-                    percentage=float(limit.percentage),
-                    current_usage=limit.current_usage,
-                    total=limit.total,
-                    usage_details_json=json.dumps([ud.model_dump() for ud in limit.usage_details]) if limit.usage_details else None,
+            for snapshot in snapshots:
+                common = {
+                    "account": snapshot["account"],
+                    "created_at": datetime.fromisoformat(snapshot["created_at"]),
+                }
+                result = await session.execute(insert_model, {**common, **snapshot["model"]})
+                model_id = result.scalar_one_or_none()
+                if model_id is None:
+                    continue
+                if notify:
+                    await notify_snapshot(session, common["account"], common["created_at"])
+                await apply_snapshot(session, snapshot)
+
+                series.extend(
+                    {**common, **point, "model_usage_id": model_id, "time": datetime.fromisoformat(point["time"])}
+                    for point in snapshot["series"]
                 )
-                session.add(quota)
+                tools.append({**common, **snapshot["tool"]})
+                quotas.extend({**common, **limit} for limit in snapshot["quotas"])
+
+            if series:
+                await session.execute(INSERT_TIME_SERIES, series)
+            if tools:
+                await session.execute(INSERT_TOOL_USAGE, tools)
+            if quotas:
+                await session.execute(INSERT_QUOTA_LIMIT, quotas)
 
             await session.commit()
-            print(f"Saved usage data at {model.created_at}")
+            print(f"Saved {len(tools)} usage snapshots ({len(snapshots) - len(tools)} already stored)")
 
         except Exception as e:
             await session.rollback()
@@ -76,6 +165,21 @@ async def save_usage_to_db():
             raise
 
 
+async def persist_usage(account_name: str, data: dict) -> None:
+    """Save one fetch_all() result for an account as a snapshot, bypassing the spool."""
+    await persist_snapshots([build_snapshot(account_name, data)])
+
+
+def is_transient_db_error(error: Exception) -> bool:
+    """Connection loss, pool timeouts and server-side operational errors; not bad data."""
+    if isinstance(error, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError)):
+        return True
+    return is_transient(error) or getattr(error, "connection_invalidated", False)
+
+
+usage_spool = Spool(persist_snapshots, transient=is_transient_db_error)
+
+
 async def get_latest_usage() -> dict:
     """Get the latest usage data from database."""
     async with async_session() as session:
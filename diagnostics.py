@@ -0,0 +1,226 @@
+"""Runtime diagnostics: event-loop lag, per-stage timings, slow callbacks, profiling.
+
+Everything here can be switched at runtime (see the /debug admin command):
+stage timings are always recorded, the slow-callback sampler and the
+cycle profiler only when turned on.
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import statistics
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds between lag probes, and the lag that gets logged
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "250"))
+# Callbacks running longer than this are sampled while the sampler is on
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "100"))
+# Recent traces kept per operation
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "20"))
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task.
+
+    Anything blocking the loop (CPU-bound work, sync I/O) delays every other
+    coroutine, including bot updates, by about this much.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, warn_ms: float = LOOP_LAG_WARN_MS, window: int = 240):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples: deque = deque(maxlen=window)
+
+    def record(self, lag_ms: float) -> None:
+        self.samples.append(lag_ms)
+        if lag_ms > self.warn_ms:
+            print(f"Event loop blocked for {lag_ms:.0f}ms")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max((loop.time() - start - self.interval) * 1000, 0.0))
+
+    def snapshot(self) -> dict:
+        samples = list(self.samples)
+        if not samples:
+            return {"samples": 0}
+        return {
+            "samples": len(samples),
+            "last_ms": samples[-1],
+            "p50_ms": statistics.median(samples),
+            "p95_ms": statistics.quantiles(samples, n=20, method="inclusive")[-1] if len(samples) > 1 else samples[0],
+            "max_ms": max(samples),
+        }
+
+
+loop_lag = LoopLagMonitor()
+
+
+@dataclass
+class Trace:
+    """Timings of one run of an operation, split into named stages."""
+
+    name: str
+    started_at: datetime
+    stages: List[Tuple[str, float]] = field(default_factory=list)
+    total_ms: float = 0.0
+    error: Optional[str] = None
+
+    def format(self) -> str:
+        lines = [f"{self.name} at {self.started_at.strftime('%H:%M:%S')}: {self.total_ms:.0f}ms"]
+        lines.extend(f"  {name}: {ms:.0f}ms" for name, ms in self.stages)
+        if self.error:
+            lines.append(f"  error: {self.error}")
+        return "\n".join(lines)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class Traces:
+    """Recent traces per operation name."""
+
+    def __init__(self, history: int = TRACE_HISTORY):
+        self._recent: Dict[str, Deque[Trace]] = defaultdict(lambda: deque(maxlen=history))
+
+    @contextmanager
+    def trace(self, name: str) -> Iterator[Trace]:
+        current = Trace(name=name, started_at=datetime.now(timezone.utc))
+        token = _current_trace.set(current)
+        start = time.perf_counter()
+        try:
+            yield current
+        except Exception as e:
+            current.error = repr(e)
+            raise
+        finally:
+            current.total_ms = (time.perf_counter() - start) * 1000
+            _current_trace.reset(token)
+            self._recent[name].append(current)
+
+    def recent(self, name: str) -> List[Trace]:
+        return list(self._recent.get(name, ()))
+
+    def names(self) -> List[str]:
+        return sorted(self._recent)
+
+
+traces = Traces()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current trace; a no-op outside of one."""
+    current = _current_trace.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.stages.append((name, (time.perf_counter() - start) * 1000))
+
+
+def describe_callback(callback) -> str:
+    # Task steps are bound to their Task; name the coroutine instead
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        return f"task {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+class SlowCallbackSampler:
+    """Records event-loop callbacks that run longer than a threshold.
+
+    Wraps asyncio's Handle._run while enabled, which adds two clock reads
+    per callback; disable() restores the original.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_CALLBACK_MS, window: int = 50):
+        self.threshold_ms = threshold_ms
+        self.samples: Deque[Tuple[datetime, str, float]] = deque(maxlen=window)
+        self._original = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._original is not None
+
+    def enable(self, threshold_ms: Optional[float] = None) -> None:
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if self.enabled:
+            return
+        original = self._original = asyncio.events.Handle._run
+        sampler = self
+
+        def _run(handle):
+            start = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if elapsed_ms >= sampler.threshold_ms:
+                    sampler.samples.append(
+                        (datetime.now(timezone.utc), describe_callback(handle._callback), elapsed_ms)
+                    )
+
+        asyncio.events.Handle._run = _run
+
+    def disable(self) -> None:
+        if self.enabled:
+            asyncio.events.Handle._run = self._original
+            self._original = None
+
+
+slow_callbacks = SlowCallbackSampler()
+
+
+class CycleProfiler:
+    """cProfile capture of one poll cycle, requested at runtime."""
+
+    def __init__(self, top: int = 30):
+        self.top = top
+        self._pending: Optional[asyncio.Future] = None
+
+    def request(self) -> asyncio.Future:
+        """Profile the next cycle; the future resolves to the pstats report."""
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.get_running_loop().create_future()
+        return self._pending
+
+    async def run(self, cycle: Callable[[], Awaitable[None]]) -> None:
+        pending = self._pending
+        if pending is None or pending.done():
+            await cycle()
+            return
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await cycle()
+        finally:
+            profile.disable()
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+            if not pending.done():
+                pending.set_result(out.getvalue())
+
+
+cycle_profiler = CycleProfiler()
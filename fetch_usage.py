@@ -4,35 +4,48 @@ import json
 import asyncio
 import urllib.parse
 from datetime import datetime, timezone, timedelta
-import aiohttp
 from dotenv import load_dotenv
+from api_timezone import api_timezones
+from offload import validate_model_usage
 from models import (
-    ModelUsageResponse,
     ToolUsageResponse,
     QuotaLimitResponse,
-    set_api_timezone,
-    detect_timezone_from_latest_hour,
 )
 
 # Load environment variables
 load_dotenv()
 
-ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "")
-ANTHROPIC_AUTH_TOKEN = os.getenv("ANTHROPIC_AUTH_TOKEN", "")
+# Hosts served by the local stand-in (stub_api.py)
+LOCAL_HOSTS = ("localhost", "127.0.0.1")
 
 
-def get_urls():
-    parsed_url = urllib.parse.urlparse(ANTHROPIC_BASE_URL)
+def get_urls(base_url=None):
+    base_url = base_url or os.getenv("ANTHROPIC_BASE_URL", "")
+    parsed_url = urllib.parse.urlparse(base_url)
     base_domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
 
-    if "api.z.ai" in ANTHROPIC_BASE_URL or "bigmodel.cn" in ANTHROPIC_BASE_URL:
-        return {
-            "model": f"{base_domain}/api/monitor/usage/model-usage",
-            "tool": f"{base_domain}/api/monitor/usage/tool-usage",
-            "quota": f"{base_domain}/api/monitor/usage/quota/limit",
-            "platform": "ZAI" if "api.z.ai" in ANTHROPIC_BASE_URL else "ZHIPU",
-        }
-    return None
+    if "api.z.ai" in base_url or "bigmodel.cn" in base_url:
+        platform = "ZAI" if "api.z.ai" in base_url else "ZHIPU"
+    elif parsed_url.hostname in LOCAL_HOSTS:
+        platform = "LOCAL"
+    else:
+        return None
+
+    return {
+        "model": f"{base_domain}/api/monitor/usage/model-usage",
+        "tool": f"{base_domain}/api/monitor/usage/tool-usage",
+        "quota": f"{base_domain}/api/monitor/usage/quota/limit",
+        "platform": platform,
+    }
+
+
+def record_response(record_dir, name, data):
+    """Save a raw API response as <name>-<timestamp>.json for replay."""
+    os.makedirs(record_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(record_dir, f"{name}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(data, f)
 
 
 def process_quota_limit(data):
@@ -62,10 +75,12 @@ def process_quota_limit(data):
 
 
 class UsageFetcher:
-    def __init__(self, base_url=None, auth_token=None):
-        self.base_url = base_url or ANTHROPIC_BASE_URL
-        self.auth_token = auth_token or ANTHROPIC_AUTH_TOKEN
-        self.urls = get_urls()
+    def __init__(self, base_url=None, auth_token=None, record_dir=None):
+        self.base_url = base_url or os.getenv("ANTHROPIC_BASE_URL", "")
+        self.auth_token = auth_token or os.getenv("ANTHROPIC_AUTH_TOKEN", "")
+        # Directory where raw API responses are recorded for later replay by stub_api.py
+        self.record_dir = record_dir or os.getenv("ZQUOTA_RECORD_DIR", "")
+        self.urls = get_urls(self.base_url)
         self.headers = {
             "Authorization": self.auth_token,
             "Accept-Language": "en-US,en",
@@ -73,6 +88,8 @@ class UsageFetcher:
         }
 
     async def fetch_all(self):
+        import aiohttp
+
         if not self.urls:
             raise ValueError("Unsupported or missing ANTHROPIC_BASE_URL")
 
@@ -87,29 +104,35 @@ class UsageFetcher:
             "endTime": end_date.strftime(fmt),
         }
 
+        requested_at = datetime.now(timezone.utc)
         async with aiohttp.ClientSession(headers=self.headers) as session:
 
-            async def get_json(url, p=None):
-                async with session.get(url, params=p) as resp:
+            async def get_json(name, p=None):
+                async with session.get(self.urls[name], params=p) as resp:
                     if resp.status != 200:
                         text = await resp.text()
                         raise Exception(f"HTTP {resp.status}: {text}")
-                    return await resp.json()
-
-            model_data = await get_json(self.urls["model"], params)
-            tool_data = await get_json(self.urls["tool"], params)
-            quota_data = await get_json(self.urls["quota"])
-
-            # Detect and set API timezone based on model data
+                    data = await resp.json()
+                if self.record_dir:
+                    # Keep the file write off the event loop
+                    await asyncio.to_thread(record_response, self.record_dir, name, data)
+                return data
+
+            model_data = await get_json("model", params)
+            tool_data = await get_json("tool", params)
+            quota_data = await get_json("quota")
+
+            # Times are parsed in this platform's API timezone, passed explicitly
+            # so concurrent fetches for different platforms cannot mix them up
             raw_model_data = model_data.get("data", model_data)
-            latest_time = raw_model_data.get("x_time", [""])[-1]
-            detected_tz = detect_timezone_from_latest_hour(latest_time)
-            set_api_timezone(detected_tz)
+            api_tz = await api_timezones.resolve(
+                self.urls["platform"], raw_model_data.get("x_time", []), requested_at
+            )
 
             processed_quota = process_quota_limit(quota_data.get("data", quota_data))
 
             return {
-                "model": ModelUsageResponse.model_validate(raw_model_data),
+                "model": await validate_model_usage(raw_model_data, api_tz),
                 "tool": ToolUsageResponse.model_validate(
                     tool_data.get("data", tool_data)
                 ),
@@ -0,0 +1,139 @@
+"""Usage history aggregated per hour, day or week, one page at a time.
+
+Aggregation happens in the database: hourly points are deduplicated with
+max() (every snapshot repeats the trailing hours), then summed per bucket.
+Pages are keyset windows on time: a page covers at most HISTORY_PAGE_SIZE
+buckets ending before a cursor, so each query reads a bounded slice of the
+(account, created_at) index however long the history is.
+"""
+import html
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from db_models import ModelUsageTimeSeries, async_session, get_engine
+
+load_dotenv()
+
+HISTORY_UNITS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+DEFAULT_HISTORY_RANGE = "7d"
+DEFAULT_HISTORY_UNIT = "day"
+# Buckets per page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "12"))
+# Snapshots repeat the trailing 24 hours, so a point may be recorded up to this late
+SERIES_RECORDING_LAG = timedelta(hours=25)
+
+_RANGE = re.compile(r"^(\d+)([hdw])$")
+_RANGE_UNITS = {"h": "hours", "d": "days", "w": "weeks"}
+
+
+@dataclass
+class HistoryRow:
+    bucket: datetime
+    calls: int
+    tokens: int
+    hours: int
+
+
+def parse_range(value: str) -> Optional[timedelta]:
+    """'12h', '7d' or '4w' -> timedelta; None if not a range."""
+    match = _RANGE.match(value)
+    if not match:
+        return None
+    return timedelta(**{_RANGE_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def truncate(dt: datetime, unit: str) -> datetime:
+    """Start of the UTC hour, day or ISO week (Monday) containing dt."""
+    dt = dt.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if unit in ("day", "week"):
+        dt = dt.replace(hour=0)
+    if unit == "week":
+        dt -= timedelta(days=dt.weekday())
+    return dt
+
+
+def bucket_expression(column, unit: str, dialect: str):
+    """SQL truncating a timestamp column to UTC buckets of `unit`."""
+    if dialect == "sqlite":
+        # Timestamps are stored as naive UTC text
+        if unit == "hour":
+            return func.strftime("%Y-%m-%d %H:00:00", column)
+        if unit == "day":
+            return func.date(column)
+        return func.date(column, "-6 days", "weekday 1")
+    return func.date_trunc(unit, func.timezone("UTC", column))
+
+
+def page_window(since: datetime, before: datetime, unit: str, page_size: int = HISTORY_PAGE_SIZE) -> Tuple[datetime, datetime]:
+    """[start, before) of the page ending at `before`, clipped to the range start."""
+    start = before - HISTORY_UNITS[unit] * page_size
+    return max(start, truncate(since, unit)), before
+
+
+async def load_history_page(
+    account: str, unit: str, since: datetime, before: datetime, page_size: int = HISTORY_PAGE_SIZE
+) -> List[HistoryRow]:
+    """Buckets in the page ending at `before`, newest first."""
+    start, end = page_window(since, before, unit, page_size)
+    series = ModelUsageTimeSeries
+    hourly = (
+        select(
+            series.time.label("time"),
+            func.max(series.call_count).label("calls"),
+            func.max(series.tokens_usage).label("tokens"),
+        )
+        .where(
+            series.account == account,
+            series.time >= start,
+            series.time < end,
+            series.created_at >= start,
+            series.created_at < end + SERIES_RECORDING_LAG,
+        )
+        .group_by(series.time)
+        .subquery()
+    )
+    bucket = bucket_expression(hourly.c.time, unit, get_engine().dialect.name).label("bucket")
+    stmt = (
+        select(
+            bucket,
+            func.coalesce(func.sum(hourly.c.calls), 0),
+            func.coalesce(func.sum(hourly.c.tokens), 0),
+            func.count(),
+        )
+        .group_by(bucket)
+        .order_by(bucket.desc())
+    )
+
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        rows = []
+        for value, calls, tokens, hours in result:
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            rows.append(HistoryRow(value.replace(tzinfo=timezone.utc), int(calls), int(tokens), hours))
+        return rows
+
+
+def format_history_page(account: str, unit: str, since: datetime, before: datetime, rows: List[HistoryRow]) -> str:
+    start, end = page_window(since, before, unit)
+    fmt = "%m-%d %H:00" if unit == "hour" else "%Y-%m-%d"
+    lines = [
+        f"<b>📈 Usage history: {html.escape(account)}</b>",
+        f"Per {unit}, {start.strftime(fmt)} to {end.strftime(fmt)} UTC\n",
+    ]
+    if not rows:
+        lines.append("No usage recorded in this period.")
+    for row in rows:
+        prefix = "week of " if unit == "week" else ""
+        lines.append(f"• {prefix}{row.bucket.strftime(fmt)}: {row.calls:,} calls, {row.tokens:,} tokens")
+    return "\n".join(lines)
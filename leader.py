@@ -0,0 +1,116 @@
+"""Leader election for singleton background jobs.
+
+When several processes serve the bot (webhook workers or replicas), only
+one of them runs partition maintenance and the background spool flusher;
+polling itself is sharded across all of them (see shards.py). On
+Postgres the leader holds a session-level advisory lock on a dedicated
+connection, so leadership ends when that connection or process dies. On
+SQLite, whose database lives on one host, an exclusive lock on a file next
+to it (<database>.leader.lock, or LEADER_LOCK_FILE) plays the same role.
+"""
+import asyncio
+import fcntl
+import os
+import zlib
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from db_models import get_engine, is_sqlite
+
+load_dotenv()
+
+LEADER_LOCK_NAME = os.getenv("LEADER_LOCK_NAME", "z-quota-poller")
+# Lock file on SQLite; empty puts it next to the database file
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", "")
+# Seconds between attempts to become leader, and between checks that the lock is still held
+LEADER_RETRY_SECONDS = float(os.getenv("LEADER_RETRY_SECONDS", "15"))
+
+
+def lock_file_path() -> str:
+    """LEADER_LOCK_FILE, else a file beside the SQLite database so every process sharing it agrees."""
+    if LEADER_LOCK_FILE:
+        return LEADER_LOCK_FILE
+    database = get_engine().url.database
+    if not database or database == ":memory:":
+        return "leader.lock"
+    return f"{os.path.abspath(database)}.leader.lock"
+
+
+class LeaderLock:
+    """Cluster-wide lock held by the process that runs the singleton jobs."""
+
+    def __init__(self, name: str = LEADER_LOCK_NAME, retry_seconds: float = LEADER_RETRY_SECONDS):
+        self.name = name
+        self.retry_seconds = retry_seconds
+        # Advisory lock keys are bigints; a stable hash of the name fits
+        self.key = zlib.crc32(name.encode())
+        self._conn = None
+        self._file: Optional[int] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._conn is not None or self._file is not None
+
+    async def try_acquire(self) -> bool:
+        if self.is_leader:
+            return True
+        if is_sqlite():
+            fd = os.open(lock_file_path(), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._file = fd
+            return True
+
+        conn = await get_engine().connect()
+        try:
+            result = await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            acquired = result.scalar()
+            # End the implicit transaction; the lock belongs to the session
+            await conn.commit()
+        except BaseException:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    async def acquire(self) -> None:
+        """Wait until this process is the leader."""
+        while True:
+            try:
+                if await self.try_acquire():
+                    return
+            except Exception as e:
+                print(f"Leader election failed, retrying: {e}")
+            await asyncio.sleep(self.retry_seconds)
+
+    async def hold(self) -> None:
+        """Return once leadership is lost; raises if the lock connection fails."""
+        while self.is_leader:
+            await asyncio.sleep(self.retry_seconds)
+            if self._conn is not None:
+                await self._conn.execute(text("SELECT 1"))
+                await self._conn.commit()
+
+    async def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            os.close(self._file)
+            self._file = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+                await conn.commit()
+            except Exception as e:
+                # Dropping the session releases the lock; don't return it to the pool
+                print(f"Could not release leader lock: {e}")
+                await conn.invalidate()
+            await conn.close()
@@ -1,174 +1,762 @@
 import asyncio
-import json
+import html
 import os
+import signal
 import sys
-
-import sqlalchemy as sa
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from dataclasses import fields
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher, Router, types
+from aiogram.filters import Command, CommandObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 from dotenv import load_dotenv
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
-from db_models import ModelUsage, ToolUsage, QuotaLimit, ModelUsageTimeSeries, async_session
-from db_usage import save_usage_to_db
+from accounts import DEFAULT_ACCOUNT, Account, load_accounts
+from aggregates import (
+    TOP_ACCOUNTS,
+    format_burn_ranking,
+    format_headroom,
+    format_model_totals,
+    model_code_totals,
+    quota_headroom,
+    token_burn_ranking,
+)
+from anomaly import detector
+from api import serve_api
+from archive import archive_completed_days, compact_archived_days, format_frame, usage_at
+from charts import CHART_RANGES, DEFAULT_CHART_RANGE, chart_cache, get_data_version, load_chart_data, render_chart
+from config import CONFIG_WATCH_SECONDS, Settings, config
+from db_models import dispose_engine
+from db_usage import save_usage_to_db, usage_spool
+from diagnostics import cycle_profiler, loop_lag, slow_callbacks, stage, traces
+from history import (
+    DEFAULT_HISTORY_RANGE,
+    DEFAULT_HISTORY_UNIT,
+    HISTORY_PAGE_SIZE,
+    HISTORY_UNITS,
+    format_history_page,
+    load_history_page,
+    page_window,
+    parse_range,
+    truncate,
+)
+from leader import LeaderLock
+from notify import SnapshotListener
+from offload import shutdown_executor
+from partitions import PARTITION_RETENTION_MONTHS, maintain_partitions
+from recent import get_latest_usage, recent_usage
+from reports import format_usage_from_db
+from sender import get_sender
+from shards import SHARD_HANDOFF_SECONDS, shard_coordinator
+from spool import SPOOL_FLUSH_INTERVAL, SPOOL_MAX_BACKOFF
+from subscriptions import add_subscription, get_chat_accounts, get_subscribers, may_read, remove_subscription
+from supervisor import SHUTDOWN_TIMEOUT, InFlight, format_health, supervisor
+from webhook import BOT_MODE, WEBHOOK_WORKERS, run_workers, serve_webhook, set_webhook
 
 load_dotenv()
 
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-CHAT_ID = os.getenv("CHAT_ID")
-
-bot = Bot(token=TELEGRAM_BOT_TOKEN) if TELEGRAM_BOT_TOKEN else None
-dp = Dispatcher()
-
-
-def format_usage_from_db(model, tool, quotas):
-    """Format usage data from database models."""
-    lines = ["<b>📊 Usage Report (from database)</b>\n"]
-
-    if model:
-        lines.append("<b>Model Usage:</b>")
-        lines.append(f"• Total Calls: {model.total_model_call_count}")
-        lines.append(f"• Total Tokens: {model.total_tokens_usage:,}")
-
-        # Show time series data (last 5 entries from relationship)
-        if model.time_series:
-            lines.append(f"\n<b>Recent Activity:</b>")
-            # Sort by time and get last 5
-            sorted_series = sorted(model.time_series, key=lambda x: x.time, reverse=True)[:5]
-            for ts in sorted_series:
-                # Format datetime: "2026-01-05 20:00"
-                time_str = ts.time.strftime("%m-%d %H:%M")
-                call_count = ts.call_count if ts.call_count is not None else "N/A"
-                lines.append(f"  • {time_str}: {call_count} calls")
-        lines.append("")
-
-    if tool:
-        lines.append("<b>Tool Usage:</b>")
-        lines.append(f"• Total Search: {tool.total_search_mcp_count}")
-        tool_details = json.loads(tool.tool_details_json) if tool.tool_details_json else []
-        for detail in tool_details:
-            lines.append(f"  - {detail.get('modelName', 'N/A')}: {detail.get('totalUsageCount', 0)}")
-        lines.append("")
-
-    if quotas:
-        lines.append("<b>Quota Limits:</b>")
-        for quota in quotas:
-            lines.append(f"• {quota.type}: {quota.percentage}%")
-            if quota.current_usage is not None:
-                lines.append(f"  - Current: {quota.current_usage}/{quota.total}")
+# Command handlers; attached to a Dispatcher by create_dispatcher()
+router = Router()
 
-    return "\n".join(lines)
+_bot: Optional[Bot] = None
+# Updates being handled, waited for on shutdown
+in_flight = InFlight()
 
 
-async def get_latest_usage_from_db():
-    """Get the latest usage data from database."""
-    async with async_session() as session:
-        # Get latest model usage with time series
-        model_result = await session.execute(
-            select(ModelUsage)
-            .options(selectinload(ModelUsage.time_series))
-            .order_by(ModelUsage.created_at.desc())
-            .limit(1)
-        )
-        latest_model = model_result.scalar_one_or_none()
+def get_bot() -> Optional[Bot]:
+    """The Telegram bot, created on first use; None without TELEGRAM_BOT_TOKEN."""
+    global _bot
+    if _bot is None:
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        if token:
+            _bot = Bot(token=token)
+    return _bot
 
-        # Get latest tool usage
-        tool_result = await session.execute(
-            select(ToolUsage)
-            .order_by(ToolUsage.created_at.desc())
-            .limit(1)
-        )
-        latest_tool = tool_result.scalar_one_or_none()
-
-        # Get latest quota limits (group by type and get latest of each)
-        from sqlalchemy import func
-        subq = (
-            select(QuotaLimit.type, func.max(QuotaLimit.id).label("max_id"))
-            .group_by(QuotaLimit.type)
-            .subquery()
-        )
-        quota_result = await session.execute(
-            select(QuotaLimit).join(
-                subq, (QuotaLimit.id == subq.c.max_id) & (QuotaLimit.type == subq.c.type)
-            )
-        )
-        latest_quotas = quota_result.scalars().all()
 
-        return latest_model, latest_tool, latest_quotas
+def create_dispatcher() -> Dispatcher:
+    """Build a Dispatcher with the bot's command handlers."""
+    dp = Dispatcher()
+    # Shutdown waits for the updates being handled
+    dp.update.outer_middleware(in_flight)
+    dp.include_router(router)
+    return dp
+
+
+async def resolve_chat_account(chat_id, requested: str = None) -> str:
+    """Pick the account a command refers to: explicit argument, first subscription, or first configured.
+
+    Raises PermissionError unless the chat may read it (see may_read()).
+    """
+    if requested:
+        if not may_read(chat_id, requested):
+            raise PermissionError(f"this chat may not read {requested}")
+        return requested
+    configured = [a.name for a in load_accounts()] or [DEFAULT_ACCOUNT]
+    for account in await get_chat_accounts(chat_id) + configured:
+        if may_read(chat_id, account):
+            return account
+    raise PermissionError("no account is available to this chat")
 
 
-@dp.message(Command("usage"))
-async def send_usage_command(message: types.Message):
+@router.message(Command("usage"))
+async def send_usage_command(message: types.Message, command: CommandObject):
+    with traces.trace("send_usage_command"):
+        try:
+            with stage("resolve_account"):
+                account = await resolve_chat_account(message.chat.id, command.args)
+            with stage("read"):
+                model, tool, quotas = await get_latest_usage(account)
+
+            if not model and not tool and not quotas:
+                await message.answer("No usage data available in database yet.")
+                return
+
+            with stage("format"):
+                text = format_usage_from_db(model, tool, quotas)
+            with stage("send"):
+                await message.answer(text, parse_mode="HTML")
+        except Exception as e:
+            await message.answer(f"Error: {e}")
+
+
+@router.message(Command("chart"))
+async def send_chart_command(message: types.Message, command: CommandObject):
+    """Send a PNG chart: /chart [range] [account], range one of 6h, 12h, 24h, 3d, 7d."""
+    range_label, requested_account = DEFAULT_CHART_RANGE, None
+    for arg in (command.args or "").split():
+        if arg in CHART_RANGES:
+            range_label = arg
+        else:
+            requested_account = arg
+
     try:
-        model, tool, quotas = await get_latest_usage_from_db()
+        account = await resolve_chat_account(message.chat.id, requested_account)
+        key = (account, range_label, await get_data_version(account))
+
+        file_id = chart_cache.get(key)
+        if file_id:
+            await message.answer_photo(file_id)
+            return
 
-        if not model and not tool and not quotas:
+        data = await load_chart_data(account, range_label)
+        if not data.times and not data.quotas:
             await message.answer("No usage data available in database yet.")
             return
 
-        text = format_usage_from_db(model, tool, quotas)
+        png = await render_chart(data)
+        sent = await message.answer_photo(types.BufferedInputFile(png, filename="usage.png"))
+        chart_cache.put(key, sent.photo[-1].file_id)
+    except ImportError:
+        await message.answer("Charts need matplotlib: install the 'charts' extra.")
+    except Exception as e:
+        await message.answer(f"Error: {e}")
+
+
+class HistoryPage(CallbackData, prefix="hist"):
+    account: str
+    unit: str
+    since: int
+    before: int
+
+
+def history_keyboard(account: str, unit: str, since: datetime, before: datetime) -> Optional[types.InlineKeyboardMarkup]:
+    """Older/Newer buttons carrying the keyset cursor of the neighbouring pages."""
+    start, _ = page_window(since, before, unit)
+    latest = truncate(datetime.now(timezone.utc), unit) + HISTORY_UNITS[unit]
+    newer = min(before + HISTORY_UNITS[unit] * HISTORY_PAGE_SIZE, latest)
+    builder = InlineKeyboardBuilder()
+    try:
+        if start > truncate(since, unit):
+            builder.button(text="◀ Older", callback_data=HistoryPage(
+                account=account, unit=unit, since=int(since.timestamp()), before=int(start.timestamp())))
+        if before < latest:
+            builder.button(text="Newer ▶", callback_data=HistoryPage(
+                account=account, unit=unit, since=int(since.timestamp()), before=int(newer.timestamp())))
+    except ValueError:
+        # Account names with ':' or too long for callback data cannot be paged
+        return None
+    return builder.as_markup() if list(builder.buttons) else None
+
+
+@router.message(Command("history"))
+async def history_command(message: types.Message, command: CommandObject):
+    """Aggregated usage: /history [range] [hour|day|week] [account], range like 48h, 30d, 12w."""
+    span, unit, requested_account = parse_range(DEFAULT_HISTORY_RANGE), DEFAULT_HISTORY_UNIT, None
+    for arg in (command.args or "").split():
+        if arg in HISTORY_UNITS:
+            unit = arg
+        elif parse_range(arg):
+            span = parse_range(arg)
+        else:
+            requested_account = arg
+
+    try:
+        account = await resolve_chat_account(message.chat.id, requested_account)
+        now = datetime.now(timezone.utc)
+        since = now - span
+        before = truncate(now, unit) + HISTORY_UNITS[unit]
+        rows = await load_history_page(account, unit, since, before)
+        await message.answer(
+            format_history_page(account, unit, since, before, rows),
+            parse_mode="HTML",
+            reply_markup=history_keyboard(account, unit, since, before),
+        )
+    except Exception as e:
+        await message.answer(f"Error: {e}")
+
+
+@router.callback_query(HistoryPage.filter())
+async def history_page_callback(callback: types.CallbackQuery, callback_data: HistoryPage):
+    """Turn a /history message to another page in place."""
+    # Callback data comes from the client and can name any account
+    if callback.message is None or not may_read(callback.message.chat.id, callback_data.account):
+        await callback.answer("This chat may not read that account.", show_alert=True)
+        return
+    since = datetime.fromtimestamp(callback_data.since, timezone.utc)
+    before = datetime.fromtimestamp(callback_data.before, timezone.utc)
+    try:
+        rows = await load_history_page(callback_data.account, callback_data.unit, since, before)
+        await callback.message.edit_text(
+            format_history_page(callback_data.account, callback_data.unit, since, before, rows),
+            parse_mode="HTML",
+            reply_markup=history_keyboard(callback_data.account, callback_data.unit, since, before),
+        )
+        await callback.answer()
+    except Exception as e:
+        await callback.answer(f"Error: {e}", show_alert=True)
+
+
+@router.message(Command("at"))
+async def usage_at_command(message: types.Message, command: CommandObject):
+    """Counters at a past moment: /at <YYYY-MM-DD[THH:MM]> [account], times in UTC."""
+    args = (command.args or "").split()
+    try:
+        at = datetime.fromisoformat(args[0]) if args else None
+    except ValueError:
+        at = None
+    if at is None:
+        await message.answer("Usage: /at <YYYY-MM-DD[THH:MM]> [account] (UTC)")
+        return
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    if len(args[0]) == 10:
+        # A bare date means the end of that day
+        at += timedelta(days=1) - timedelta(microseconds=1)
+
+    try:
+        account = await resolve_chat_account(message.chat.id, args[1] if len(args) > 1 else None)
+        frame = await usage_at(account, at)
+        if frame is None:
+            await message.answer(f"No usage recorded for {html.escape(account)} before then.")
+            return
+        await message.answer(format_frame(account, frame), parse_mode="HTML")
+    except Exception as e:
+        await message.answer(f"Error: {e}")
+
+
+@router.message(Command("fleet"))
+async def fleet_command(message: types.Message, command: CommandObject):
+    """Cross-account views (admins only): /fleet (headroom and top burners), /fleet models [source], /fleet top [n]."""
+    if not is_admin(message):
+        return
+    args = (command.args or "").split()
+    try:
+        if args and args[0] == "models":
+            text = format_model_totals(await model_code_totals(args[1] if len(args) > 1 else None))
+        elif args and args[0] == "top":
+            limit = int(args[1]) if len(args) > 1 and args[1].isdigit() else TOP_ACCOUNTS
+            text = format_burn_ranking(await token_burn_ranking(min(limit, 50)))
+        else:
+            headroom, ranking = await asyncio.gather(quota_headroom(), token_burn_ranking())
+            text = format_headroom(headroom) + "\n\n" + format_burn_ranking(ranking)
         await message.answer(text, parse_mode="HTML")
     except Exception as e:
         await message.answer(f"Error: {e}")
 
 
-async def send_periodic_report():
-    """Fetch usage data, save to database, and send report to CHAT_ID."""
-    if not bot or not CHAT_ID:
-        print("Bot token or Chat ID not configured")
+@router.message(Command("subscribe"))
+async def subscribe_command(message: types.Message, command: CommandObject):
+    account = (command.args or "").strip()
+    names = [a.name for a in load_accounts() if may_read(message.chat.id, a.name)]
+    if account not in names:
+        await message.answer(f"Usage: /subscribe <account>\nAccounts: {', '.join(names) or 'none'}")
         return
 
+    if await add_subscription(message.chat.id, account):
+        await message.answer(f"Subscribed to {account} reports.")
+    else:
+        await message.answer(f"Already subscribed to {account}.")
+
+
+@router.message(Command("unsubscribe"))
+async def unsubscribe_command(message: types.Message, command: CommandObject):
+    account = (command.args or "").strip()
+    if not account:
+        await message.answer("Usage: /unsubscribe <account>")
+        return
+
+    if await remove_subscription(message.chat.id, account):
+        await message.answer(f"Unsubscribed from {account}.")
+    else:
+        await message.answer(f"Not subscribed to {account}.")
+
+
+def is_admin(message: types.Message) -> bool:
+    return str(message.chat.id) in config.current.admin_chat_ids
+
+
+@router.message(Command("pool"))
+async def pool_command(message: types.Message):
+    """Database connection pool statistics (admins only)."""
+    if not is_admin(message):
+        return
+    from db_metrics import pool_metrics
+
+    stats = pool_metrics.snapshot()
+    lines = ["<b>DB pool</b>"]
+    lines.extend(
+        f"• {name}: {value:.1f}" if isinstance(value, float) else f"• {name}: {value}"
+        for name, value in stats.items()
+    )
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@router.message(Command("lag"))
+async def lag_command(message: types.Message):
+    """Event-loop lag over the last few minutes (admins only)."""
+    if not is_admin(message):
+        return
+    lines = ["<b>Event loop lag</b>"]
+    lines.extend(
+        f"• {name}: {value:.1f}" if isinstance(value, float) else f"• {name}: {value}"
+        for name, value in loop_lag.snapshot().items()
+    )
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@router.message(Command("jobs"))
+async def jobs_command(message: types.Message):
+    """Background job health and last-run latency (admins only)."""
+    if not is_admin(message):
+        return
+    await message.answer(format_health(supervisor.health()), parse_mode="HTML")
+
+
+@router.message(Command("reload"))
+async def reload_command(message: types.Message):
+    """Re-read the settings and CONFIG_FILE and apply them (admins only)."""
+    if not is_admin(message):
+        return
     try:
-        # Fetch and save usage data to database
-        await save_usage_to_db()
+        changed = config.reload()
+    except Exception as e:
+        await message.answer(f"Configuration not reloaded, keeping the current one: {e}")
+        return
+    await message.answer(f"Reloaded: {', '.join(changed)} changed." if changed else "Reloaded: nothing changed.")
+
+
+def format_debug_summary() -> str:
+    lines = ["<b>Event loop lag</b>"]
+    lines.extend(
+        f"• {name}: {value:.1f}" if isinstance(value, float) else f"• {name}: {value}"
+        for name, value in loop_lag.snapshot().items()
+    )
+
+    state = f"on (&gt;{slow_callbacks.threshold_ms:.0f}ms)" if slow_callbacks.enabled else "off"
+    lines.append(f"\n<b>Slow callbacks</b>: {state}")
+    for at, name, ms in list(slow_callbacks.samples)[-5:]:
+        lines.append(f"• {at.strftime('%H:%M:%S')} {html.escape(name)}: {ms:.0f}ms")
+
+    for name in ("send_periodic_report", "send_usage_command"):
+        recent = traces.recent(name)[-3:]
+        if recent:
+            lines.append(f"\n<b>{name}</b>")
+            lines.append("<pre>" + html.escape("\n".join(t.format() for t in recent)) + "</pre>")
+    return "\n".join(lines)
+
+
+@router.message(Command("debug"))
+async def debug_command(message: types.Message, command: CommandObject):
+    """Runtime diagnostics (admins only).
+
+    /debug                      lag, slow callbacks and recent stage timings
+    /debug slow on [ms] | off   sample event-loop callbacks slower than ms
+    /debug lag <ms>             log loop stalls above ms
+    /debug profile              cProfile the next poll cycle
+    """
+    if not is_admin(message):
+        return
+    args = (command.args or "").split()
+
+    try:
+        if not args:
+            await message.answer(format_debug_summary(), parse_mode="HTML")
+        elif args[0] == "slow" and args[1:2] == ["off"]:
+            slow_callbacks.disable()
+            await message.answer("Slow callback sampling off.")
+        elif args[0] == "slow" and args[1:2] == ["on"]:
+            slow_callbacks.enable(float(args[2]) if len(args) > 2 else None)
+            await message.answer(f"Sampling callbacks slower than {slow_callbacks.threshold_ms:.0f}ms.")
+        elif args[0] == "lag" and len(args) == 2:
+            loop_lag.warn_ms = float(args[1])
+            await message.answer(f"Logging loop stalls above {loop_lag.warn_ms:.0f}ms.")
+        elif args[0] == "profile":
+            await message.answer("Profiling the next poll cycle...")
+            report = await asyncio.wait_for(asyncio.shield(cycle_profiler.request()), timeout=300)
+            await message.answer_document(types.BufferedInputFile(report.encode(), filename="poll-profile.txt"))
+        else:
+            await message.answer("Usage: /debug [slow on [ms] | slow off | lag <ms> | profile]")
+    except Exception as e:
+        await message.answer(f"Error: {e}")
 
-        # Get latest data and send report
-        model, tool, quotas = await get_latest_usage_from_db()
 
-        if not model and not tool and not quotas:
-            print("No usage data available")
+async def send_periodic_report(
+    accounts: List[Account] = None, claim: Callable[[str], Awaitable[bool]] = None
+):
+    """Fetch usage data for the accounts (default: all), save it, and fan reports out to subscribers.
+
+    With `claim`, each account is only polled if claim(name) still grants it.
+    """
+    bot = get_bot()
+    if not bot:
+        print("Bot token not configured")
+        return
+
+    if accounts is None:
+        accounts = load_accounts()
+        if not accounts:
+            print("No accounts configured")
             return
+    if not accounts:
+        return
+
+    with traces.trace("send_periodic_report"):
+        with stage("subscribers"):
+            subscribers = await get_subscribers(a.name for a in accounts)
+        messages = []
+
+        for account in accounts:
+            if claim is not None and not await claim_account(claim, account.name):
+                continue
+            try:
+                # Fetch and save usage data to database
+                data = await save_usage_to_db(account)
+                chats = subscribers.get(account.name, [])
+
+                # Update the spike baselines with the fresh series and alert subscribers
+                try:
+                    with stage(f"{account.name}.anomaly"):
+                        alerts = await detector.observe(account.name, data["model"].parsed_time_series)
+                except Exception as e:
+                    print(f"Anomaly detection failed for {account.name}: {e}")
+                    alerts = []
+                for alert in alerts:
+                    print(f"Anomaly on {account.name}: {alert.metric}={alert.value} (z={alert.z_score:.1f})")
+                    messages.extend((chat_id, alert.format()) for chat_id in chats)
+
+                if not chats:
+                    continue
+
+                # Get latest data and render the report once for all subscribers
+                with stage(f"{account.name}.read"):
+                    model, tool, quotas = await get_latest_usage(account.name)
+
+                if not model and not tool and not quotas:
+                    print(f"No usage data available for {account.name}")
+                    continue
+
+                text = format_usage_from_db(model, tool, quotas)
+                messages.extend((chat_id, text) for chat_id in chats)
+            except Exception as e:
+                print(f"Failed to prepare report for {account.name}: {e}")
+
+        if messages:
+            with stage("send"):
+                results = await get_sender(bot).send_many(messages, parse_mode="HTML")
+            print(f"Periodic report sent to {sum(results)}/{len(results)} chats")
+
+
+async def claim_account(claim: Callable[[str], Awaitable[bool]], name: str) -> bool:
+    try:
+        if await claim(name):
+            return True
+    except Exception as e:
+        # Without the database nobody else can take the lease either
+        print(f"Could not renew the lease on {name}, polling anyway: {e}")
+        return True
+    print(f"Lease on {name} moved to another worker, skipping")
+    return False
+
 
-        text = format_usage_from_db(model, tool, quotas)
-        await bot.send_message(chat_id=CHAT_ID, text=text, parse_mode="HTML")
-        print(f"Periodic report sent to {CHAT_ID}")
+async def assign_shard() -> List[Account]:
+    """This process's share of the configured accounts for the next cycle."""
+    configured = load_accounts()
+    previous = set(shard_coordinator.accounts)
+    try:
+        names = await shard_coordinator.assign(a.name for a in configured)
+    except Exception as e:
+        # Without the database nobody can rebalance; keep polling into the spool
+        print(f"Shard assignment failed, keeping {len(previous)} accounts: {e}")
+        names = list(previous)
+
+    # Accounts polled elsewhere go stale in memory unless announcements keep them current
+    if not snapshot_listener.connected:
+        recent_usage.retain(names)
+    gained = [name for name in names if name not in previous]
+    if gained:
+        try:
+            await recent_usage.warm(gained)
+        except Exception as e:
+            print(f"Could not warm recent usage from database: {e}")
+    return [a for a in configured if a.name in names]
+
+
+async def poll_cycle():
+    """Poll this process's shard of accounts once."""
+    async with poll_lock:
+        accounts = await assign_shard()
+        # Profiled when an admin asked for it with /debug profile
+        await cycle_profiler.run(lambda: send_periodic_report(accounts, claim=shard_coordinator.claim))
+
+
+async def handoff_cycle():
+    """Poll accounts that moved here as soon as their previous owner lets go of them."""
+    if not shard_coordinator.pending or poll_lock.locked():
+        return
+    async with poll_lock:
+        names = await shard_coordinator.claim_pending()
+        if not names:
+            return
+        try:
+            await recent_usage.warm(names)
+        except Exception as e:
+            print(f"Could not warm recent usage from database: {e}")
+        accounts = [a for a in load_accounts() if a.name in names]
+        await send_periodic_report(accounts, claim=shard_coordinator.claim)
+
+
+async def maintenance_cycle():
+    """Archive finished days, thin the raw rows of old ones, keep monthly partitions ahead and apply retention."""
+    try:
+        days, pending = await archive_completed_days()
+    except Exception:
+        # Partitions must stay ahead; retention may only drop rows whose days are archived
+        await maintain_partitions(apply_retention=False)
+        raise
+    if days:
+        print(f"Archived {days} account-days of snapshots")
+    await maintain_partitions(keep_from=pending)
+    await compact_archived_days()
+
+
+async def flush_spool():
+    """Drain snapshots spooled while the database was unreachable."""
+    written = await usage_spool.flush()
+    if written:
+        print(f"Spool flushed {written} records")
+
+
+async def warm_recent_usage():
+    # Serve recent reads and charts from memory; SQL remains the fallback
+    try:
+        await recent_usage.warm(a.name for a in load_accounts())
     except Exception as e:
-        print(f"Failed to send periodic report: {e}")
+        print(f"Could not warm recent usage from database: {e}")
 
 
-async def scheduler_task(interval_seconds: int = 60):
-    """Background task that runs the periodic report every interval."""
+async def apply_remote_snapshot(account: str, created_at: datetime):
+    """Bring the buffer up to date with a snapshot another process stored."""
+    buffer = recent_usage.get(account)
+    if buffer is not None and buffer.model is not None and buffer.model.created_at >= created_at:
+        return
+    await recent_usage.refresh(account)
+
+
+def reset_recent_usage():
+    # Without announcements only this process's own polls keep the buffer current
+    recent_usage.retain(shard_coordinator.accounts)
+
+
+leader_lock = LeaderLock()
+# Keeps the poll and handoff cycles from polling the same account at once
+poll_lock = asyncio.Lock()
+snapshot_listener = SnapshotListener(
+    on_snapshot=apply_remote_snapshot, on_connect=warm_recent_usage, on_reset=reset_recent_usage
+)
+
+
+async def hold_leadership():
+    """Hold the leader lock, taking it again after a loss; leader-only jobs skip their cycles without it."""
     while True:
+        await leader_lock.acquire()
+        print(f"Elected leader (pid {os.getpid()})")
+        # Run the leader-only jobs now instead of after their interval
+        supervisor.wake("maintenance", "spool")
         try:
-            await send_periodic_report()
+            await leader_lock.hold()
         except Exception as e:
-            print(f"Scheduler error: {e}")
+            print(f"Lost leader lock: {e}")
+        finally:
+            await leader_lock.release()
+
+
+def apply_settings(settings: Settings, changed: List[str]):
+    """Bring the live objects in line with the settings, keeping their caches and baselines."""
+    if {"anomaly_z_threshold", "anomaly_min_samples", "anomaly_span_hours"} & set(changed):
+        detector.z_threshold = settings.anomaly_z_threshold
+        detector.min_samples = settings.anomaly_min_samples
+        detector.span_hours = settings.anomaly_span_hours
+    if "chart_cache_size" in changed:
+        chart_cache.resize(settings.chart_cache_size)
+    if "recent_hours" in changed:
+        recent_usage.set_window(settings.recent_hours)
+    if "loop_lag_warn_ms" in changed:
+        loop_lag.warn_ms = settings.loop_lag_warn_ms
+    if "poll_interval" in changed or "accounts" in changed:
+        # Poll the new accounts, or start the new schedule, without waiting out the old interval
+        supervisor.wake("poller")
+
+
+config.on_change(apply_settings)
+
+
+def reload_config():
+    try:
+        config.reload()
+    except Exception as e:
+        print(f"Configuration not reloaded, keeping the current one: {e}")
+
+
+def start_jobs(services: Dict[str, Callable[[], Awaitable]]):
+    apply_settings(config.current, [f.name for f in fields(Settings)])
+    # Every process polls its shard of the accounts
+    supervisor.periodic("poller", poll_cycle, lambda: config.current.poll_interval)
+    supervisor.periodic("handoff", handoff_cycle, SHARD_HANDOFF_SECONDS)
+    print(f"Scheduler started: sending reports every {config.current.poll_interval:g} seconds")
+    if CONFIG_WATCH_SECONDS > 0:
+        supervisor.periodic("config", config.watch, CONFIG_WATCH_SECONDS, max_backoff=CONFIG_WATCH_SECONDS)
+    supervisor.periodic("maintenance", maintenance_cycle, 6 * 3600, when=lambda: leader_lock.is_leader)
+    supervisor.periodic(
+        "spool", flush_spool, SPOOL_FLUSH_INTERVAL, when=lambda: leader_lock.is_leader, max_backoff=SPOOL_MAX_BACKOFF
+    )
+    supervisor.service("leader", hold_leadership)
+    # Keeps this process's caches current with snapshots stored elsewhere (Postgres only)
+    supervisor.service("listener", snapshot_listener.run)
+    supervisor.service("loop_lag", loop_lag.run)
+    for name, service in services.items():
+        supervisor.service(name, service)
+
+
+async def drain(timeout: float = SHUTDOWN_TIMEOUT):
+    """Finish in-flight work before exit: updates being handled, running cycles, then the spool."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    def remaining() -> float:
+        return max(deadline - loop.time(), 0.0)
+
+    idle, _ = await asyncio.gather(in_flight.wait_idle(remaining()), supervisor.stop(remaining()))
+    if not idle:
+        print(f"{in_flight.count} updates still being handled at shutdown")
+    # Let the remaining workers take over this shard without waiting for leases to expire
+    try:
+        await asyncio.wait_for(shard_coordinator.leave(), remaining())
+    except Exception as e:
+        print(f"Could not release account leases: {e}")
+    try:
+        written = await asyncio.wait_for(usage_spool.flush(), remaining())
+        if written:
+            print(f"Spool flushed {written} records")
+    except Exception as e:
+        print(f"Spool not flushed at shutdown, kept for the next start: {e!r}")
+    shutdown_executor()
+    bot = get_bot()
+    if bot:
+        await bot.session.close()
+    await dispose_engine()
+
+
+async def serve(
+    updates: Awaitable,
+    stop_updates: Callable[[], Awaitable] = None,
+    services: Dict[str, Callable[[], Awaitable]] = None,
+):
+    """Run the background jobs and `services` until `updates` (polling or the webhook server) stops.
+
+    SIGTERM or SIGINT stops `updates` (with `stop_updates`, else by
+    cancelling it) and drains everything within SHUTDOWN_TIMEOUT. SIGHUP
+    reloads the configuration.
+    """
+    loop = asyncio.get_running_loop()
+    shutdown = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, shutdown.set)
+    loop.add_signal_handler(signal.SIGHUP, reload_config)
+    start_jobs(services or {})
+    receiving = asyncio.ensure_future(updates)
+    stop_signal = asyncio.ensure_future(shutdown.wait())
+    try:
+        await asyncio.wait({receiving, stop_signal}, return_when=asyncio.FIRST_COMPLETED)
+        if not receiving.done():
+            print("Shutting down: no new updates, draining in-flight work...")
+            if stop_updates is not None:
+                await stop_updates()
+            else:
+                receiving.cancel()
+        await asyncio.wait({receiving})
+    finally:
+        stop_signal.cancel()
+        receiving.cancel()
+        await drain()
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            loop.remove_signal_handler(sig)
+    if not receiving.cancelled():
+        receiving.result()
+
+
+async def webhook_worker_main():
+    bot = get_bot()
+    await serve(serve_webhook(bot, create_dispatcher()))
+
 
-        # Wait for the next interval
-        await asyncio.sleep(interval_seconds)
+def webhook_worker():
+    """Entry point of a spawned webhook worker process."""
+    try:
+        asyncio.run(webhook_worker_main())
+    except KeyboardInterrupt:
+        pass
 
 
 async def main():
-    if not TELEGRAM_BOT_TOKEN:
+    bot = get_bot()
+    if not bot:
         print("TELEGRAM_BOT_TOKEN not set in .env")
         return
+    dp = create_dispatcher()
+    if PARTITION_RETENTION_MONTHS <= 0:
+        print("PARTITION_RETENTION_MONTHS is 0: archived days keep one raw snapshot per hour forever")
+
+    if BOT_MODE == "webhook":
+        await set_webhook(bot, dp)
+        if WEBHOOK_WORKERS > 1:
+            await bot.session.close()
+            print(f"Starting {WEBHOOK_WORKERS} webhook workers...")
+            await run_workers(webhook_worker, WEBHOOK_WORKERS)
+            return
+        await serve(serve_webhook(bot, dp))
+        return
 
-    # Start the scheduler in the background
-    scheduler = asyncio.create_task(scheduler_task(60))
-    print("Scheduler started: sending reports every 60 seconds")
-
+    # Telegram refuses getUpdates while a webhook is set
+    await bot.delete_webhook()
     # Start bot polling (this blocks)
     print("Starting bot polling...")
-    try:
-        await dp.start_polling(bot)
-    finally:
-        # Cancel scheduler when bot stops
-        scheduler.cancel()
-        try:
-            await scheduler
-        except asyncio.CancelledError:
-            pass
+    await serve(
+        dp.start_polling(bot, handle_signals=False, close_bot_session=False),
+        stop_updates=dp.stop_polling,
+        services={"api": serve_api},
+    )
 
 
 if __name__ == "__main__":
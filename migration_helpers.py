@@ -0,0 +1,183 @@
+"""Batched, resumable data backfills for Alembic migrations.
+
+Data-moving migrations walk a table in integer key ranges, committing each
+range on its own so a large table never sits in one long transaction. The
+last finished range is recorded in the migration_checkpoint table; if the
+migration is interrupted, running it again resumes after that range.
+
+Each batch statement must be idempotent for its key range (e.g. an UPDATE
+that overwrites, or an INSERT guarded by NOT EXISTS): a crash between a
+batch and its checkpoint means that range runs again. Schema changes made
+before the backfill are committed with it, so guard them with has_table /
+has_column to let the rerun get past them.
+
+    from migration_helpers import batched_backfill
+
+    def upgrade():
+        batched_backfill(
+            "my_revision_fill_foo",
+            "model_usage",
+            "UPDATE model_usage SET foo = bar WHERE id > :lo AND id <= :hi",
+        )
+"""
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import sqlalchemy as sa
+from alembic import op
+
+CHECKPOINT_TABLE = "migration_checkpoint"
+BATCH_SIZE = 10_000
+
+
+def has_table(table: str) -> bool:
+    """For DDL that an interrupted, resumed migration has already applied."""
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def has_column(table: str, column: str) -> bool:
+    return any(c["name"] == column for c in sa.inspect(op.get_bind()).get_columns(table))
+
+
+# Parses text as a jsonb array; NULL, '', malformed JSON and non-arrays give '[]'
+JSONB_ARRAY_FUNCTION = "pg_temp.jsonb_array_or_empty"
+
+
+def create_jsonb_array_function() -> None:
+    """Define JSONB_ARRAY_FUNCTION for this session (Postgres).
+
+    A plain ::jsonb cast aborts the whole statement, and with it the
+    migration, on the first malformed row.
+    """
+    op.get_bind().execute(sa.text(f"""
+        CREATE OR REPLACE FUNCTION {JSONB_ARRAY_FUNCTION}(value text) RETURNS jsonb
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        DECLARE
+            parsed jsonb;
+        BEGIN
+            IF value IS NULL OR value !~ '^\\s*\\[' THEN
+                RETURN '[]';
+            END IF;
+            parsed := value::jsonb;
+            RETURN CASE WHEN jsonb_typeof(parsed) = 'array' THEN parsed ELSE '[]' END;
+        EXCEPTION WHEN invalid_text_representation THEN
+            RETURN '[]';
+        END
+        $$
+    """))
+
+
+def _ensure_checkpoint_table(conn) -> None:
+    conn.execute(sa.text(
+        f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} ("
+        "name VARCHAR(255) PRIMARY KEY, "
+        "last_key BIGINT NOT NULL, "
+        "updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+
+def get_checkpoint(conn, name: str) -> Optional[int]:
+    return conn.execute(
+        sa.text(f"SELECT last_key FROM {CHECKPOINT_TABLE} WHERE name = :name"),
+        {"name": name},
+    ).scalar()
+
+
+def _save_checkpoint(conn, name: str, last_key: int) -> None:
+    params = {"name": name, "last_key": last_key}
+    updated = conn.execute(
+        sa.text(
+            f"UPDATE {CHECKPOINT_TABLE} SET last_key = :last_key, updated_at = CURRENT_TIMESTAMP "
+            "WHERE name = :name"
+        ),
+        params,
+    )
+    if updated.rowcount == 0:
+        conn.execute(
+            sa.text(f"INSERT INTO {CHECKPOINT_TABLE} (name, last_key) VALUES (:name, :last_key)"),
+            params,
+        )
+
+
+def _clear_checkpoint(conn, name: str) -> None:
+    conn.execute(sa.text(f"DELETE FROM {CHECKPOINT_TABLE} WHERE name = :name"), {"name": name})
+
+
+def _run_batches(name: str, table: str, key: str, batch_size: int, run_batch: Callable[..., int]) -> int:
+    conn = op.get_bind()
+    total = 0
+    # Each statement commits on its own, outside the migration transaction
+    with op.get_context().autocommit_block():
+        _ensure_checkpoint_table(conn)
+        last_key = get_checkpoint(conn, name)
+        if last_key is None:
+            last_key = conn.execute(sa.text(f"SELECT COALESCE(MIN({key}), 1) - 1 FROM {table}")).scalar()
+        else:
+            print(f"  {name}: resuming after {key} {last_key}")
+        max_key = conn.execute(sa.text(f"SELECT COALESCE(MAX({key}), 0) FROM {table}")).scalar()
+
+        started = time.monotonic()
+        first_key = last_key
+        while last_key < max_key:
+            upper = min(last_key + batch_size, max_key)
+            total += run_batch(conn, last_key, upper)
+            _save_checkpoint(conn, name, upper)
+            last_key = upper
+
+            elapsed = time.monotonic() - started
+            done = (last_key - first_key) / max(max_key - first_key, 1)
+            eta = elapsed / done - elapsed if done else 0
+            print(f"  {name}: {key} {last_key}/{max_key} ({done:.0%}), {total} rows, eta {eta:.0f}s")
+
+        _clear_checkpoint(conn, name)
+    return total
+
+
+def batched_backfill(
+    name: str,
+    table: str,
+    statement: str,
+    *,
+    key: str = "id",
+    batch_size: int = BATCH_SIZE,
+    params: Optional[dict] = None,
+) -> int:
+    """Run a set-based `statement` over `table` one key range at a time.
+
+    The statement receives :lo and :hi and should cover `key > :lo AND key <= :hi`.
+    `name` identifies the checkpoint and must be unique per backfill.
+    Returns the total rowcount reported by the batches.
+    """
+    sql = sa.text(statement)
+
+    def run_batch(conn, lo: int, hi: int) -> int:
+        return max(conn.execute(sql, {**(params or {}), "lo": lo, "hi": hi}).rowcount, 0)
+
+    return _run_batches(name, table, key, batch_size, run_batch)
+
+
+def batched_rewrite(
+    name: str,
+    table: str,
+    select: str,
+    transform: Callable[[List[sa.Row]], Iterable[Dict]],
+    write: str,
+    *,
+    key: str = "id",
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Backfill that needs Python per row, written back with one executemany per batch.
+
+    `select` receives :lo and :hi like in batched_backfill; `transform` turns the
+    rows selected for one range into parameter dicts for the `write` statement.
+    Prefer batched_backfill where the transformation can be expressed in SQL.
+    """
+    select_sql, write_sql = sa.text(select), sa.text(write)
+
+    def run_batch(conn, lo: int, hi: int) -> int:
+        rows = list(transform(conn.execute(select_sql, {"lo": lo, "hi": hi}).all()))
+        if rows:
+            conn.execute(write_sql, rows)
+        return len(rows)
+
+    return _run_batches(name, table, key, batch_size, run_batch)
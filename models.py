@@ -3,30 +3,14 @@ from typing import List, Optional, Union
 from pydantic import BaseModel, Field, ConfigDict, field_validator
 
 
-# Cached API timezone (detected lazily)
-_API_TZ_CACHE: Optional[timezone] = None
+def detect_timezone_from_latest_hour(latest_time_str: str, now: Optional[datetime] = None) -> timezone:
+    """Detect timezone from the latest API time string.
 
-
-async def detect_api_timezone_async() -> timezone:
-    """Detect API timezone by finding which timezone has matching hour with latest API time.
-
-    The API returns times where the latest timestamp has the same hour as current time
-    in the API's timezone. We test common timezones to find the match.
+    The API returns times where the latest timestamp has the same hour as the
+    time of the request in the API's timezone. `now` should be that time.
     """
-    # Import here to avoid circular dependency
-    from fetch_usage import UsageFetcher
-
-    # Get latest API time hour
-    fetcher = UsageFetcher()
-    data = await fetcher.fetch_all()
-    latest_time_str = data['model'].x_time[-1]
-    return detect_timezone_from_latest_hour(latest_time_str)
-
-
-def detect_timezone_from_latest_hour(latest_time_str: str) -> timezone:
-    """Detect timezone from the latest API time string."""
     latest_api_hour = int(latest_time_str.split(' ')[1].split(':')[0])
-    now_utc = datetime.now(timezone.utc)
+    now_utc = now or datetime.now(timezone.utc)
 
     # Check UTC-11 to UTC+12 for matching hour
     for offset in range(-11, 13):
@@ -38,35 +22,10 @@ def detect_timezone_from_latest_hour(latest_time_str: str) -> timezone:
     return timezone.utc
 
 
-def get_api_timezone() -> timezone:
-    """Get the API timezone, detecting it once and caching the result.
-
-    This synchronous version will be called during parsing, and if not yet cached,
-    it defaults to UTC. The actual detection happens in fetch_usage where we have
-    an event loop available.
-    """
-    global _API_TZ_CACHE
-    if _API_TZ_CACHE is None:
-        # Default to UTC if not yet detected
-        # The actual detection happens in fetch_usage.py
-        return timezone.utc
-    return _API_TZ_CACHE
-
-
-def set_api_timezone(tz: timezone) -> None:
-    """Set the API timezone cache (called by fetch_usage after detection)."""
-    global _API_TZ_CACHE
-    _API_TZ_CACHE = tz
-
-
-def parse_api_time(time_str: str) -> datetime:
-    """Parse time string to datetime with detected API timezone.
-
-    The API returns times like "2026-01-05 20:00" in a dynamic timezone
-    that matches the current hour. We auto-detect this timezone.
-    """
+def parse_api_time(time_str: str, tz: timezone) -> datetime:
+    """Parse an API time string like "2026-01-05 20:00" in the API's timezone."""
     dt = datetime.strptime(time_str, "%Y-%m-%d %H:%M")
-    return dt.replace(tzinfo=get_api_timezone())
+    return dt.replace(tzinfo=tz)
 
 
 class ModelTotalUsage(BaseModel):
@@ -91,16 +50,23 @@ class ModelUsageResponse(BaseModel):
     tokens_usage: List[Optional[int]] = Field(alias="tokensUsage")
     total_usage: ModelTotalUsage = Field(alias="totalUsage")
 
-    # Parsed time series data
-    time_series: List[ModelUsagePoint] = Field(default_factory=list, exclude=True)
+    # Parsed time series data, built during validation
+    time_series: List[ModelUsagePoint] = Field(default_factory=list, exclude=True, validate_default=True)
 
     @field_validator("time_series", mode="before")
     @classmethod
     def parse_time_series(cls, v: List[ModelUsagePoint], info) -> List[ModelUsagePoint]:
-        """Parse x_time and model_call_count into time series with API timezone (UTC+3)."""
+        """Parse x_time and model_call_count into a time series.
+
+        The API timezone comes from the validation context, e.g.
+        ModelUsageResponse.model_validate(data, context={"api_tz": tz}); UTC without it.
+        """
+        if v:
+            return v
         if not info.data:
             return []
 
+        api_tz = (info.context or {}).get("api_tz", timezone.utc)
         x_time = info.data.get("x_time", [])
         model_call_count = info.data.get("model_call_count", [])
         tokens_usage = info.data.get("tokens_usage", [])
@@ -108,7 +74,7 @@ class ModelUsageResponse(BaseModel):
         result = []
         for i, time_str in enumerate(x_time):
             result.append(ModelUsagePoint(
-                time=parse_api_time(time_str),
+                time=parse_api_time(time_str, api_tz),
                 call_count=model_call_count[i] if i < len(model_call_count) else None,
                 tokens_usage=tokens_usage[i] if i < len(tokens_usage) else None,
             ))
@@ -117,16 +83,6 @@ class ModelUsageResponse(BaseModel):
     @property
     def parsed_time_series(self) -> List[ModelUsagePoint]:
         """Get parsed time series data."""
-        if not self.time_series:
-            # Build on demand
-            result = []
-            for i, time_str in enumerate(self.x_time):
-                result.append(ModelUsagePoint(
-                    time=parse_api_time(time_str),
-                    call_count=self.model_call_count[i] if i < len(self.model_call_count) else None,
-                    tokens_usage=self.tokens_usage[i] if i < len(self.tokens_usage) else None,
-                ))
-            return result
         return self.time_series
 
 
@@ -0,0 +1,133 @@
+"""Cross-process cache invalidation with Postgres LISTEN/NOTIFY.
+
+persist_snapshots() sends a NOTIFY for every snapshot it stores, inside the
+write transaction, so listeners hear about it only once it is committed.
+Every process keeps one LISTEN connection and hands each announcement to a
+callback, which refreshes that process's caches. A process that loses its
+listener can no longer trust its caches; on_reset lets it drop them, and
+they are rebuilt when the connection comes back.
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+load_dotenv()
+
+USAGE_NOTIFY_CHANNEL = os.getenv("USAGE_NOTIFY_CHANNEL", "usage_snapshot")
+# Seconds between liveness checks of the LISTEN connection, and the reconnect backoff ceiling
+LISTEN_CHECK_SECONDS = float(os.getenv("LISTEN_CHECK_SECONDS", "30"))
+LISTEN_MAX_BACKOFF = float(os.getenv("LISTEN_MAX_BACKOFF", "300"))
+
+# Identifies this process in announcements so it can skip its own
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+NOTIFY_SNAPSHOT = text("SELECT pg_notify(:channel, :payload)")
+
+
+def snapshot_payload(account: str, created_at: datetime) -> str:
+    return json.dumps({"account": account, "created_at": created_at.isoformat(), "origin": INSTANCE_ID})
+
+
+async def notify_snapshot(session, account: str, created_at: datetime) -> None:
+    """Announce a stored snapshot; delivered when the session's transaction commits."""
+    await session.execute(
+        NOTIFY_SNAPSHOT, {"channel": USAGE_NOTIFY_CHANNEL, "payload": snapshot_payload(account, created_at)}
+    )
+
+
+OnSnapshot = Callable[[str, datetime], Awaitable[None]]
+
+
+class SnapshotListener:
+    """Keeps a LISTEN connection open and passes other processes' snapshots to on_snapshot.
+
+    on_connect runs after every (re)connect, since announcements sent while
+    disconnected are lost; on_reset runs when the connection drops.
+    """
+
+    def __init__(
+        self,
+        on_snapshot: OnSnapshot,
+        on_connect: Optional[Callable[[], Awaitable[None]]] = None,
+        on_reset: Optional[Callable[[], None]] = None,
+        channel: str = USAGE_NOTIFY_CHANNEL,
+    ):
+        self.on_snapshot = on_snapshot
+        self.on_connect = on_connect
+        self.on_reset = on_reset
+        self.channel = channel
+        self.connected = False
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        # Called synchronously by asyncpg; the work happens in run()
+        self._queue.put_nowait(payload)
+
+    async def _handle(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            print(f"Ignoring malformed {self.channel} notification: {payload!r}")
+            return
+        if message.get("origin") == INSTANCE_ID:
+            return
+        try:
+            await self.on_snapshot(message["account"], datetime.fromisoformat(message["created_at"]))
+        except Exception as e:
+            print(f"Could not apply snapshot of {message.get('account')}: {e}")
+
+    async def _listen(self, dsn: str) -> None:
+        import asyncpg
+
+        conn = await asyncpg.connect(dsn)
+        try:
+            await conn.add_listener(self.channel, self._on_notification)
+            self.connected = True
+            print(f"Listening for {self.channel} notifications")
+            if self.on_connect is not None:
+                await self.on_connect()
+            while True:
+                try:
+                    payload = await asyncio.wait_for(self._queue.get(), timeout=LISTEN_CHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    # Raises if the connection is gone
+                    await conn.execute("SELECT 1")
+                    continue
+                await self._handle(payload)
+        finally:
+            self.connected = False
+            if self.on_reset is not None:
+                self.on_reset()
+            try:
+                await conn.close(timeout=5)
+            except Exception:
+                conn.terminate()
+
+    async def run(self) -> None:
+        """Listen until cancelled, reconnecting with backoff; returns at once off Postgres."""
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url or not make_url(database_url).drivername.startswith("postgresql"):
+            return
+        dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while True:
+            started = loop.time()
+            try:
+                await self._listen(dsn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A connection that stayed up for a while starts the backoff over
+                if loop.time() - started > LISTEN_CHECK_SECONDS:
+                    delay = 1.0
+                print(f"LISTEN connection lost, reconnecting in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LISTEN_MAX_BACKOFF)
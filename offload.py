@@ -0,0 +1,70 @@
+"""Executor layer for CPU-bound stages.
+
+Pydantic validation of large payloads and chart rendering would otherwise
+run on the event loop that also serves the bot. run_cpu() sends such work to
+a process pool (OFFLOAD_MODE=process), a thread pool (thread) or runs it
+inline (inline). Worker functions live in light modules (models, chart_render)
+and take plain, compact arguments: the API's columnar payloads rather than
+per-point objects.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timezone
+from typing import Callable, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+from models import ModelUsageResponse
+
+load_dotenv()
+
+OFFLOAD_MODE = os.getenv("OFFLOAD_MODE", "process")
+OFFLOAD_WORKERS = int(os.getenv("OFFLOAD_WORKERS", os.getenv("CHART_WORKERS", "2")))
+# Smaller payloads are parsed inline: the handoff would cost more than the parse
+OFFLOAD_MIN_POINTS = int(os.getenv("OFFLOAD_MIN_POINTS", "2000"))
+
+T = TypeVar("T")
+
+_executor: Optional[Executor] = None
+
+
+def get_executor() -> Optional[Executor]:
+    """Pool for OFFLOAD_MODE, created on first use; None when running inline."""
+    global _executor
+    if _executor is None and OFFLOAD_MODE != "inline":
+        if OFFLOAD_MODE == "thread":
+            _executor = ThreadPoolExecutor(max_workers=OFFLOAD_WORKERS, thread_name_prefix="offload")
+        else:
+            _executor = ProcessPoolExecutor(
+                max_workers=OFFLOAD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+async def run_cpu(fn: Callable[..., T], *args) -> T:
+    """Run a CPU-bound, picklable function off the event loop."""
+    executor = get_executor()
+    if executor is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def parse_model_usage(raw: dict, api_tz: timezone) -> ModelUsageResponse:
+    return ModelUsageResponse.model_validate(raw, context={"api_tz": api_tz})
+
+
+async def validate_model_usage(raw: dict, api_tz: timezone) -> ModelUsageResponse:
+    """Validate a model usage payload, in the pool when it is large."""
+    if len(raw.get("x_time", [])) < OFFLOAD_MIN_POINTS:
+        return parse_model_usage(raw, api_tz)
+    return await run_cpu(parse_model_usage, raw, api_tz)
@@ -0,0 +1,122 @@
+"""Monthly partition maintenance for the snapshot and series tables (Postgres).
+
+The usage tables are declaratively partitioned by RANGE (created_at), one
+partition per month named <table>_pYYYYMM (see migration c7d2e49f1a68).
+Partitions are created ahead of time, and retention drops whole partitions
+instead of deleting rows.
+"""
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import List, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from db_models import get_engine
+
+load_dotenv()
+
+PARTITIONED_TABLES = ("model_usage", "model_usage_time_series", "tool_usage", "quota_limit")
+# Tables whose old months retention drops. The series is kept: /history and
+# /chart read it, and archive.py compacts it to a row or two per hour.
+RETENTION_TABLES = ("model_usage", "tool_usage", "quota_limit")
+
+# Months of partitions kept ready beyond the current one
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Months of history kept; 0 keeps everything
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year}{month.month:02d}"
+
+
+def partition_ddl(table: str, month: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} "
+        f"PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def is_postgres() -> bool:
+    return get_engine().dialect.name == "postgresql"
+
+
+async def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD, now: datetime = None) -> int:
+    """Create partitions for the current month and `months_ahead` following ones."""
+    now = now or datetime.now(timezone.utc)
+    current = date(now.year, now.month, 1)
+    statements = [
+        partition_ddl(table, add_months(current, offset))
+        for table in PARTITIONED_TABLES
+        for offset in range(months_ahead + 1)
+    ]
+    async with get_engine().begin() as conn:
+        for statement in statements:
+            await conn.execute(text(statement))
+    return len(statements)
+
+
+async def list_partitions(conn, table: str) -> List[Tuple[str, date]]:
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ),
+        {"table": table},
+    )
+    partitions = []
+    for (name,) in result:
+        match = _PARTITION_NAME.match(name)
+        if match and match.group("table") == table:
+            partitions.append((name, date(int(match.group("year")), int(match.group("month")), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+async def drop_old_partitions(
+    retention_months: int = PARTITION_RETENTION_MONTHS, now: datetime = None, keep_from: date = None
+) -> List[str]:
+    """Detach and drop partitions entirely older than the retention window.
+
+    Partitions holding `keep_from` or later days are kept whatever their age.
+    """
+    if retention_months <= 0:
+        return []
+
+    now = now or datetime.now(timezone.utc)
+    cutoff = add_months(date(now.year, now.month, 1), -retention_months)
+    if keep_from is not None:
+        cutoff = min(cutoff, date(keep_from.year, keep_from.month, 1))
+    dropped = []
+
+    for table in RETENTION_TABLES:
+        async with get_engine().begin() as conn:
+            for name, month in await list_partitions(conn, table):
+                if month >= cutoff:
+                    continue
+                # Detaching first keeps the lock on the parent short; the drop
+                # then only touches the standalone table.
+                await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                await conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+    return dropped
+
+
+async def maintain_partitions(apply_retention: bool = True, keep_from: date = None) -> None:
+    """Create upcoming partitions and apply retention, keeping months from `keep_from` on; no-op outside Postgres."""
+    if not is_postgres():
+        return
+    created = await ensure_partitions()
+    dropped = await drop_old_partitions(keep_from=keep_from) if apply_retention else []
+    print(f"Partition maintenance: ensured {created} partitions, dropped {len(dropped)}")
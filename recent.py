@@ -0,0 +1,245 @@
+"""In-memory buffer of recent usage per account.
+
+Every ingested snapshot updates the buffer, so the latest report, and charts
+within RECENT_HOURS, are served without a database round trip. At startup the
+buffer is warmed from the database; reads it cannot cover fall back to SQL.
+Snapshots stored by other processes arrive through refresh() (see notify.py).
+"""
+import os
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from reports import get_latest_usage_from_db, load_hourly_quotas_from_db, load_hourly_series_from_db
+
+load_dotenv()
+
+# Hours of series points and hourly quota values kept per account
+RECENT_HOURS = int(os.getenv("RECENT_HOURS", "48"))
+
+
+# Slotted records shaped like the ORM rows that format_usage_from_db reads
+
+
+@dataclass(slots=True)
+class SeriesPoint:
+    time: datetime
+    call_count: Optional[int]
+    tokens_usage: Optional[int]
+
+
+@dataclass(slots=True)
+class ModelSnapshot:
+    created_at: datetime
+    total_model_call_count: int
+    total_tokens_usage: int
+    time_series: List[SeriesPoint]
+
+
+@dataclass(slots=True)
+class ToolSnapshot:
+    created_at: datetime
+    total_network_search_count: int
+    total_web_read_mcp_count: int
+    total_zread_mcp_count: int
+    total_search_mcp_count: int
+    tool_details_json: str
+    x_time_json: str
+
+
+@dataclass(slots=True)
+class QuotaState:
+    type: str
+    percentage: float
+    current_usage: Optional[int]
+    total: Optional[int]
+
+
+def _max(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+class AccountBuffer:
+    """Hourly series, hourly quota values and the latest snapshot of one account."""
+
+    __slots__ = ("hours", "points", "quota_hours", "model", "tool", "quotas", "floor")
+
+    def __init__(self, hours: int = RECENT_HOURS):
+        self.hours = hours
+        # Sorted by time, one point per hour
+        self.points: List[SeriesPoint] = []
+        # Quota type -> [(hour, percentage)], sorted by hour
+        self.quota_hours: Dict[str, List[Tuple[datetime, float]]] = {}
+        self.model: Optional[ModelSnapshot] = None
+        self.tool: Optional[ToolSnapshot] = None
+        self.quotas: List[QuotaState] = []
+        # Ranges starting at or after this are complete in memory; None until warmed
+        self.floor: Optional[datetime] = None
+
+    def add_point(self, point: SeriesPoint) -> None:
+        # Snapshots repeat the trailing hours; keep the highest value seen per hour
+        points = self.points
+        if not points or point.time > points[-1].time:
+            points.append(point)
+            return
+        i = bisect_left(points, point.time, key=lambda p: p.time)
+        if i < len(points) and points[i].time == point.time:
+            points[i].call_count = _max(points[i].call_count, point.call_count)
+            points[i].tokens_usage = _max(points[i].tokens_usage, point.tokens_usage)
+        else:
+            points.insert(i, point)
+
+    def add_quota(self, quota_type: str, created_at: datetime, percentage: float) -> None:
+        hour = created_at.replace(minute=0, second=0, microsecond=0)
+        values = self.quota_hours.setdefault(quota_type, [])
+        if values and values[-1][0] == hour:
+            values[-1] = (hour, percentage)
+        elif not values or hour > values[-1][0]:
+            values.append((hour, percentage))
+
+    def trim(self, now: datetime) -> None:
+        cutoff = now - timedelta(hours=self.hours)
+        del self.points[:bisect_left(self.points, cutoff, key=lambda p: p.time)]
+        for values in self.quota_hours.values():
+            del values[:bisect_left(values, cutoff, key=lambda v: v[0])]
+        if self.floor is not None:
+            self.floor = max(self.floor, cutoff)
+
+    def covers(self, since: datetime) -> bool:
+        return self.floor is not None and since >= self.floor
+
+    def series_since(self, since: datetime) -> List[Tuple[datetime, Optional[int], Optional[int]]]:
+        start = bisect_left(self.points, since, key=lambda p: p.time)
+        return [(p.time, p.call_count, p.tokens_usage) for p in self.points[start:]]
+
+    def quotas_since(self, since: datetime) -> Dict[str, List[Tuple[datetime, float]]]:
+        return {
+            quota_type: values[bisect_left(values, since, key=lambda v: v[0]):]
+            for quota_type, values in self.quota_hours.items()
+        }
+
+    def latest(self):
+        """(model, tool, quotas) like get_latest_usage_from_db."""
+        return self.model, self.tool, self.quotas
+
+
+class RecentUsage:
+    """Per-account buffers, filled on ingest and warmed from the database."""
+
+    def __init__(self, hours: int = RECENT_HOURS):
+        self.hours = hours
+        self._accounts: Dict[str, AccountBuffer] = {}
+
+    def get(self, account: str) -> Optional[AccountBuffer]:
+        return self._accounts.get(account)
+
+    def set_window(self, hours: int) -> None:
+        """Change how many hours are kept; a longer window fills up with new polls."""
+        self.hours = hours
+        for buffer in self._accounts.values():
+            buffer.hours = hours
+            if buffer.model is not None:
+                buffer.trim(buffer.model.created_at)
+
+    def retain(self, accounts: Iterable[str]) -> None:
+        """Forget every other account; its reads fall back to the database until warmed again."""
+        keep = set(accounts)
+        for account in [a for a in self._accounts if a not in keep]:
+            del self._accounts[account]
+
+    def _buffer(self, account: str) -> AccountBuffer:
+        if account not in self._accounts:
+            self._accounts[account] = AccountBuffer(self.hours)
+        return self._accounts[account]
+
+    def ingest(self, snapshot: dict) -> None:
+        """Add a build_snapshot() record."""
+        buffer = self._buffer(snapshot["account"])
+        created_at = datetime.fromisoformat(snapshot["created_at"])
+        if buffer.model is not None and created_at <= buffer.model.created_at:
+            return
+
+        series = [
+            SeriesPoint(datetime.fromisoformat(p["time"]), p["call_count"], p["tokens_usage"])
+            for p in snapshot["series"]
+        ]
+        for point in series:
+            buffer.add_point(SeriesPoint(point.time, point.call_count, point.tokens_usage))
+        buffer.model = ModelSnapshot(created_at=created_at, time_series=series, **snapshot["model"])
+        buffer.tool = ToolSnapshot(created_at=created_at, **snapshot["tool"])
+        buffer.quotas = [
+            QuotaState(q["type"], q["percentage"], q["current_usage"], q["total"])
+            for q in snapshot["quotas"]
+        ]
+        for quota in buffer.quotas:
+            buffer.add_quota(quota.type, created_at, quota.percentage)
+        buffer.trim(created_at)
+
+    @staticmethod
+    def _apply_latest(buffer: AccountBuffer, model, tool, quotas) -> None:
+        """Make ORM rows from the database the buffer's latest snapshot, if newer."""
+        if model is None or (buffer.model is not None and model.created_at <= buffer.model.created_at):
+            return
+        series = [SeriesPoint(p.time, p.call_count, p.tokens_usage) for p in model.time_series]
+        for point in series:
+            buffer.add_point(SeriesPoint(point.time, point.call_count, point.tokens_usage))
+        buffer.model = ModelSnapshot(
+            created_at=model.created_at,
+            total_model_call_count=model.total_model_call_count,
+            total_tokens_usage=model.total_tokens_usage,
+            time_series=series,
+        )
+        if tool is not None:
+            buffer.tool = ToolSnapshot(
+                created_at=tool.created_at,
+                total_network_search_count=tool.total_network_search_count,
+                total_web_read_mcp_count=tool.total_web_read_mcp_count,
+                total_zread_mcp_count=tool.total_zread_mcp_count,
+                total_search_mcp_count=tool.total_search_mcp_count,
+                tool_details_json=tool.tool_details_json,
+                x_time_json=tool.x_time_json,
+            )
+        buffer.quotas = [QuotaState(q.type, q.percentage, q.current_usage, q.total) for q in quotas]
+        for quota in buffer.quotas:
+            buffer.add_quota(quota.type, model.created_at, quota.percentage)
+
+    async def refresh(self, account: str) -> None:
+        """Pull in the latest snapshot of an account stored by another process."""
+        buffer = self._buffer(account)
+        self._apply_latest(buffer, *await get_latest_usage_from_db(account))
+        buffer.trim(datetime.now(timezone.utc))
+
+    async def warm(self, accounts: Iterable[str]) -> None:
+        """Load the last `hours` of every account from the database."""
+        for account in accounts:
+            now = datetime.now(timezone.utc)
+            since = now - timedelta(hours=self.hours)
+            buffer = self._buffer(account)
+
+            for time, calls, tokens in await load_hourly_series_from_db(account, since):
+                buffer.add_point(SeriesPoint(time, calls, tokens))
+            for quota_type, values in (await load_hourly_quotas_from_db(account, since)).items():
+                for hour, percentage in values:
+                    buffer.add_quota(quota_type, hour, percentage)
+
+            self._apply_latest(buffer, *await get_latest_usage_from_db(account))
+            buffer.floor = since
+            buffer.trim(now)
+
+
+recent_usage = RecentUsage()
+
+
+async def get_latest_usage(account: str):
+    """Latest (model, tool, quotas) of an account, from memory when available."""
+    buffer = recent_usage.get(account)
+    if buffer is not None and buffer.model is not None:
+        return buffer.latest()
+    return await get_latest_usage_from_db(account)
@@ -0,0 +1,138 @@
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import selectinload
+
+from accounts import DEFAULT_ACCOUNT
+from db_models import ModelUsage, ModelUsageTimeSeries, ToolUsage, QuotaLimit, async_session
+
+
+def format_usage_from_db(model, tool, quotas):
+    """Format usage data from database models."""
+    lines = ["<b>📊 Usage Report (from database)</b>\n"]
+
+    if model:
+        lines.append("<b>Model Usage:</b>")
+        lines.append(f"• Total Calls: {model.total_model_call_count}")
+        lines.append(f"• Total Tokens: {model.total_tokens_usage:,}")
+
+        # Show time series data (last 5 entries from relationship)
+        if model.time_series:
+            lines.append(f"\n<b>Recent Activity:</b>")
+            # Sort by time and get last 5
+            sorted_series = sorted(model.time_series, key=lambda x: x.time, reverse=True)[:5]
+            for ts in sorted_series:
+                # Format datetime: "2026-01-05 20:00"
+                time_str = ts.time.strftime("%m-%d %H:%M")
+                call_count = ts.call_count if ts.call_count is not None else "N/A"
+                lines.append(f"  • {time_str}: {call_count} calls")
+        lines.append("")
+
+    if tool:
+        lines.append("<b>Tool Usage:</b>")
+        lines.append(f"• Total Search: {tool.total_search_mcp_count}")
+        tool_details = json.loads(tool.tool_details_json) if tool.tool_details_json else []
+        for detail in tool_details:
+            lines.append(f"  - {detail.get('modelName', 'N/A')}: {detail.get('totalUsageCount', 0)}")
+        lines.append("")
+
+    if quotas:
+        lines.append("<b>Quota Limits:</b>")
+        for quota in quotas:
+            lines.append(f"• {quota.type}: {quota.percentage}%")
+            if quota.current_usage is not None:
+                lines.append(f"  - Current: {quota.current_usage}/{quota.total}")
+
+    return "\n".join(lines)
+
+
+# Hot read statements, built once with bound parameters so SQLAlchemy reuses
+# their compiled form (and asyncpg its prepared statements) on every call.
+LATEST_MODEL_STMT = (
+    select(ModelUsage)
+    .options(selectinload(ModelUsage.time_series))
+    .where(ModelUsage.account == bindparam("account"))
+    .order_by(ModelUsage.created_at.desc())
+    .limit(1)
+)
+
+LATEST_TOOL_STMT = (
+    select(ToolUsage)
+    .where(ToolUsage.account == bindparam("account"))
+    .order_by(ToolUsage.created_at.desc())
+    .limit(1)
+)
+
+# Latest quota limits (group by type and get latest of each)
+_latest_quota_ids = (
+    select(QuotaLimit.type, func.max(QuotaLimit.id).label("max_id"))
+    .where(QuotaLimit.account == bindparam("account"))
+    .group_by(QuotaLimit.type)
+    .subquery()
+)
+LATEST_QUOTAS_STMT = select(QuotaLimit).join(
+    _latest_quota_ids,
+    (QuotaLimit.id == _latest_quota_ids.c.max_id) & (QuotaLimit.type == _latest_quota_ids.c.type),
+)
+
+
+async def get_latest_usage_from_db(account: str = DEFAULT_ACCOUNT):
+    """Get the latest usage data of an account from database."""
+    params = {"account": account}
+    async with async_session() as session:
+        # Get latest model usage with time series
+        latest_model = (await session.execute(LATEST_MODEL_STMT, params)).scalar_one_or_none()
+
+        # Get latest tool usage
+        latest_tool = (await session.execute(LATEST_TOOL_STMT, params)).scalar_one_or_none()
+
+        latest_quotas = (await session.execute(LATEST_QUOTAS_STMT, params)).scalars().all()
+
+        return latest_model, latest_tool, latest_quotas
+
+
+async def load_hourly_series_from_db(
+    account: str, since: datetime
+) -> List[Tuple[datetime, Optional[int], Optional[int]]]:
+    """(hour, calls, tokens) of an account from `since` on, one row per hour."""
+    async with async_session() as session:
+        # Each snapshot repeats the trailing 24 hours; keep one value per hour
+        result = await session.execute(
+            select(
+                ModelUsageTimeSeries.time,
+                func.max(ModelUsageTimeSeries.call_count),
+                func.max(ModelUsageTimeSeries.tokens_usage),
+            )
+            .where(
+                ModelUsageTimeSeries.account == account,
+                ModelUsageTimeSeries.time >= since,
+                # A point is never recorded before its hour, so this lets
+                # Postgres prune created_at partitions outside the range
+                ModelUsageTimeSeries.created_at >= since,
+            )
+            .group_by(ModelUsageTimeSeries.time)
+            .order_by(ModelUsageTimeSeries.time)
+        )
+        return [tuple(row) for row in result]
+
+
+async def load_hourly_quotas_from_db(account: str, since: datetime) -> Dict[str, List[Tuple[datetime, float]]]:
+    """Quota type -> [(hour, percentage)] from `since` on, last value of each hour."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(QuotaLimit.type, QuotaLimit.created_at, QuotaLimit.percentage)
+            .where(QuotaLimit.account == account, QuotaLimit.created_at >= since)
+            .order_by(QuotaLimit.created_at)
+        )
+        # Downsample per-minute snapshots to the last value of each hour
+        hourly = {}
+        for quota_type, created_at, percentage in result:
+            hour = created_at.replace(minute=0, second=0, microsecond=0)
+            hourly[(quota_type, hour)] = percentage
+
+    quotas: Dict[str, List[Tuple[datetime, float]]] = {}
+    for (quota_type, hour), percentage in hourly.items():
+        quotas.setdefault(quota_type, []).append((hour, percentage))
+    return quotas
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Telegram Bot API limits: ~30 messages/second overall, 1 message/second per
+# private chat and 20 messages/minute per group.
+GLOBAL_RATE_PER_SECOND = 30
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 60 / 20
+
+
+class SlidingWindowLimiter:
+    """Allow at most `rate` acquisitions in any `period`-second window."""
+
+    def __init__(self, rate: int, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self._stamps: deque = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._stamps and now - self._stamps[0] >= self.period:
+                    self._stamps.popleft()
+                if len(self._stamps) < self.rate:
+                    self._stamps.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._stamps[0]))
+
+
+class TelegramSender:
+    """Send queue honouring Telegram's global and per-chat rate limits.
+
+    Messages to different chats go out concurrently; messages to the same chat
+    are spaced by the per-chat interval. TelegramRetryAfter is retried after the
+    delay Telegram asks for.
+    """
+
+    def __init__(
+        self,
+        bot,
+        global_rate: int = GLOBAL_RATE_PER_SECOND,
+        private_interval: float = PRIVATE_CHAT_INTERVAL,
+        group_interval: float = GROUP_CHAT_INTERVAL,
+        concurrency: int = GLOBAL_RATE_PER_SECOND,
+        max_retries: int = 3,
+    ):
+        self.bot = bot
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self._global = SlidingWindowLimiter(global_rate)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chat_locks: Dict[str, asyncio.Lock] = {}
+        self._chat_next_at: Dict[str, float] = {}
+
+    def _chat_interval(self, chat_id: str) -> float:
+        # Group and channel chat IDs are negative
+        return self.group_interval if str(chat_id).startswith("-") else self.private_interval
+
+    async def _wait_for_chat(self, chat_id: str) -> None:
+        delay = self._chat_next_at.get(chat_id, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send(self, chat_id: str, text: str, **kwargs) -> bool:
+        """Send one message, returning False if it could not be delivered."""
+        from aiogram.exceptions import TelegramRetryAfter
+
+        chat_id = str(chat_id)
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            for attempt in range(self.max_retries + 1):
+                await self._wait_for_chat(chat_id)
+                async with self._semaphore:
+                    await self._global.acquire()
+                    try:
+                        await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    except TelegramRetryAfter as e:
+                        print(f"Rate limited in chat {chat_id}, retrying after {e.retry_after}s")
+                        self._chat_next_at[chat_id] = time.monotonic() + e.retry_after
+                        continue
+                    except Exception as e:
+                        print(f"Failed to send message to {chat_id}: {e}")
+                        return False
+                self._chat_next_at[chat_id] = time.monotonic() + self._chat_interval(chat_id)
+                return True
+
+        print(f"Giving up on chat {chat_id} after {self.max_retries} retries")
+        return False
+
+    async def send_many(
+        self, messages: Iterable[Tuple[str, str]], **kwargs
+    ) -> List[bool]:
+        """Send (chat_id, text) pairs concurrently within the rate limits."""
+        return await asyncio.gather(
+            *(self.send(chat_id, text, **kwargs) for chat_id, text in messages)
+        )
+
+
+_sender: Optional[TelegramSender] = None
+
+
+def get_sender(bot) -> TelegramSender:
+    """Get the process-wide sender for a bot, creating it on first use."""
+    global _sender
+    if _sender is None or _sender.bot is not bot:
+        _sender = TelegramSender(bot)
+    return _sender
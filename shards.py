@@ -0,0 +1,150 @@
+"""Sharding of account polling across live worker processes and replicas.
+
+Every polling process heartbeats in poller_worker. Each cycle it ranks the
+live workers per account by rendezvous hashing, so all workers agree on an
+owner and only the accounts of a joining or leaving worker move. Hashing
+alone can disagree while membership changes, so polling an account also
+needs its row in account_lease: a worker takes a lease only if it is free,
+expired or already its own, and hands back leases of accounts that now
+hash elsewhere. An account is therefore never polled by two workers, and
+a dead worker's accounts move once its heartbeat and leases expire.
+
+A lease is renewed with claim() right before each poll, so a cycle longer
+than the lease cannot let another worker take an account mid-cycle; an
+account whose lease has moved is skipped. Accounts that hash here but are
+still leased by their previous owner are retried with claim_pending()
+between cycles, so they are picked up as soon as that owner lets go.
+"""
+import hashlib
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, or_, select
+
+from db_models import AccountLease, PollerWorker, async_session, dialect_insert, write_session
+
+load_dotenv()
+
+# Heartbeats and leases older than this belong to workers presumed dead;
+# keep it a few poll intervals long, leases are renewed before every poll
+SHARD_LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", "180"))
+# How often accounts still held by their previous owner are retried
+SHARD_HANDOFF_SECONDS = float(os.getenv("SHARD_HANDOFF_SECONDS", "5"))
+
+
+def default_worker_id() -> str:
+    return os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def rendezvous_owner(account: str, workers: Iterable[str]) -> Optional[str]:
+    """The worker with the highest hash for the account (highest random weight)."""
+    def weight(worker: str) -> int:
+        digest = hashlib.blake2b(f"{worker}\0{account}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    return max(workers, key=weight, default=None)
+
+
+class ShardCoordinator:
+    """Decides which accounts this process polls."""
+
+    def __init__(self, worker_id: Optional[str] = None, lease_seconds: float = SHARD_LEASE_SECONDS):
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        # Accounts granted by the last successful assign() or claim_pending()
+        self.accounts: List[str] = []
+        # Accounts that hash here but are still leased by another worker
+        self.pending: List[str] = []
+
+    def _heartbeat(self, now: datetime):
+        heartbeat = dialect_insert(PollerWorker).values(worker_id=self.worker_id, heartbeat_at=now)
+        return heartbeat.on_conflict_do_update(index_elements=["worker_id"], set_={"heartbeat_at": now})
+
+    def _claim(self, account: str, now: datetime):
+        """Upsert taking or extending the lease if free, expired or ours; returns the account if granted."""
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        claim = dialect_insert(AccountLease).values(account=account, owner=self.worker_id, expires_at=expires_at)
+        return claim.on_conflict_do_update(
+            index_elements=["account"],
+            set_={"owner": self.worker_id, "expires_at": expires_at},
+            where=or_(AccountLease.owner == self.worker_id, AccountLease.expires_at < now),
+        ).returning(AccountLease.account)
+
+    async def live_workers(self, now: datetime) -> List[str]:
+        cutoff = now - timedelta(seconds=self.lease_seconds)
+        async with async_session() as session:
+            result = await session.execute(
+                select(PollerWorker.worker_id).where(PollerWorker.heartbeat_at > cutoff)
+            )
+            return list(result.scalars())
+
+    async def assign(self, accounts: Iterable[str], now: datetime = None) -> List[str]:
+        """Heartbeat, rebalance and return the accounts to poll this cycle."""
+        now = now or datetime.now(timezone.utc)
+        accounts = list(accounts)
+
+        async with write_session() as session:
+            await session.execute(self._heartbeat(now))
+            # Forget workers that stopped long ago; worker ids change on restart
+            await session.execute(
+                delete(PollerWorker).where(PollerWorker.heartbeat_at < now - 10 * timedelta(seconds=self.lease_seconds))
+            )
+            await session.commit()
+
+        workers = set(await self.live_workers(now)) | {self.worker_id}
+        preferred = [a for a in accounts if rendezvous_owner(a, workers) == self.worker_id]
+
+        async with write_session() as session:
+            # Hand back accounts that moved to another worker (or were removed)
+            await session.execute(
+                delete(AccountLease).where(
+                    AccountLease.owner == self.worker_id, AccountLease.account.not_in(preferred)
+                )
+            )
+            granted = []
+            for account in preferred:
+                result = await session.execute(self._claim(account, now))
+                if result.scalar_one_or_none() is not None:
+                    granted.append(account)
+            await session.commit()
+
+        moved = set(granted) ^ set(self.accounts)
+        if moved:
+            print(f"Worker {self.worker_id} polls {len(granted)}/{len(accounts)} accounts ({len(workers)} live workers)")
+        self.accounts = granted
+        self.pending = [a for a in preferred if a not in granted]
+        return granted
+
+    async def claim(self, account: str, now: datetime = None) -> bool:
+        """Renew the account's lease (and the heartbeat) before polling it; False once another worker holds it."""
+        now = now or datetime.now(timezone.utc)
+        async with write_session() as session:
+            await session.execute(self._heartbeat(now))
+            result = await session.execute(self._claim(account, now))
+            granted = result.scalar_one_or_none() is not None
+            await session.commit()
+        return granted
+
+    async def claim_pending(self, now: datetime = None) -> List[str]:
+        """Take over the pending accounts whose previous owner has let go; returns them."""
+        gained = [account for account in list(self.pending) if await self.claim(account, now)]
+        if gained:
+            self.pending = [a for a in self.pending if a not in gained]
+            self.accounts = self.accounts + gained
+            print(f"Worker {self.worker_id} took over {len(gained)} accounts")
+        return gained
+
+    async def leave(self) -> None:
+        """Give up every lease and the heartbeat so others take over at once."""
+        async with write_session() as session:
+            await session.execute(delete(AccountLease).where(AccountLease.owner == self.worker_id))
+            await session.execute(delete(PollerWorker).where(PollerWorker.worker_id == self.worker_id))
+            await session.commit()
+        self.accounts = []
+        self.pending = []
+
+
+shard_coordinator = ShardCoordinator()
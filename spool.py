@@ -0,0 +1,224 @@
+"""Write-ahead spool for fetched snapshots.
+
+Polls append each snapshot to a local NDJSON file before anything touches
+the database. A flusher drains the spool into the database in batches, so a
+database outage delays writes instead of losing them. Records must carry
+their own upsert key: a crash after a batch is committed but before its
+segment is removed replays that batch, and the writer has to skip it.
+
+Layout: <dir>/active.ndjson receives appends; a flush seals it into
+<dir>/segment-<ns>.ndjson and removes each segment once it is written.
+Several processes may share a directory: appends and sealing lock the
+active file, and flushes take turns on <dir>/flush.lock.
+
+A batch the writer rejects with anything but a transient error (see
+is_transient) SPOOL_MAX_ATTEMPTS times is retried one record at a time, and
+the records that still fail go to <dir>/dead-letter.ndjson, so one bad
+record cannot hold up everything behind it. Renaming that file to a
+segment-*.ndjson name replays it.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+# Snapshots written per database transaction when draining
+SPOOL_BATCH_SIZE = int(os.getenv("SPOOL_BATCH_SIZE", "500"))
+# Seconds between background flushes, and the ceiling of the retry backoff
+SPOOL_FLUSH_INTERVAL = float(os.getenv("SPOOL_FLUSH_INTERVAL", "30"))
+SPOOL_MAX_BACKOFF = float(os.getenv("SPOOL_MAX_BACKOFF", "600"))
+# Failed writes of the same batch before its records are tried one by one
+SPOOL_MAX_ATTEMPTS = int(os.getenv("SPOOL_MAX_ATTEMPTS", "3"))
+
+Writer = Callable[[List[dict]], Awaitable[None]]
+
+
+def is_transient(error: Exception) -> bool:
+    """Errors that say nothing about the records, like a database outage."""
+    return isinstance(error, (OSError, TimeoutError, asyncio.TimeoutError))
+
+
+class Spool:
+    """Append-only NDJSON spool drained by `writer` in batches."""
+
+    def __init__(
+        self,
+        writer: Writer,
+        directory: str = SPOOL_DIR,
+        batch_size: int = SPOOL_BATCH_SIZE,
+        fsync: bool = True,
+        max_attempts: int = SPOOL_MAX_ATTEMPTS,
+        transient: Callable[[Exception], bool] = is_transient,
+    ):
+        self.writer = writer
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.transient = transient
+        self._file_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        # (segment name, batch start) -> failed writes so far
+        self._attempts: Dict[Tuple[str, int], int] = {}
+
+    @property
+    def active_path(self) -> Path:
+        return self.directory / "active.ndjson"
+
+    @property
+    def dead_letter_path(self) -> Path:
+        return self.directory / "dead-letter.ndjson"
+
+    def _append_sync(self, line: str) -> None:
+        with self._file_lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            while True:
+                with open(self.active_path, "a+", encoding="utf-8") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    # Another process may have sealed the file while we waited
+                    try:
+                        stat = os.fstat(f.fileno())
+                        sealed = stat.st_ino != os.stat(self.active_path).st_ino
+                    except FileNotFoundError:
+                        sealed = True
+                    if sealed:
+                        continue
+                    # End a line torn by a crash, so this record is not glued onto it
+                    if stat.st_size and os.pread(f.fileno(), 1, stat.st_size - 1) != b"\n":
+                        line = "\n" + line
+                    f.write(line)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                    return
+
+    async def append(self, record: dict) -> None:
+        """Durably append one record; file I/O runs off the event loop."""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        await asyncio.to_thread(self._append_sync, line)
+
+    def _seal_sync(self) -> List[Path]:
+        with self._file_lock:
+            if self.active_path.exists() and self.active_path.stat().st_size > 0:
+                with open(self.active_path, "a", encoding="utf-8") as f:
+                    # Waits for appends in flight in other processes
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    self.active_path.rename(self.directory / f"segment-{time.time_ns()}.ndjson")
+            return sorted(self.directory.glob("segment-*.ndjson"))
+
+    async def _lock_flushes(self) -> int:
+        """Take the cross-process flush lock; returns the fd to pass to os.close()."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.directory / "flush.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    await asyncio.sleep(0.05)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    @staticmethod
+    def _read_segment(path: Path) -> List[dict]:
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-append; earlier lines are intact
+                    print(f"Skipping unreadable spool record {path.name}:{number}")
+        return records
+
+    def pending_segments(self) -> List[Path]:
+        segments = sorted(self.directory.glob("segment-*.ndjson")) if self.directory.exists() else []
+        if self.active_path.exists() and self.active_path.stat().st_size > 0:
+            segments.append(self.active_path)
+        return segments
+
+    async def flush(self) -> int:
+        """Write everything spooled so far; returns the number of records written.
+
+        Raises if the writer fails. Records not yet written stay in the spool.
+        """
+        async with self._flush_lock:
+            lock = await self._lock_flushes()
+            try:
+                segments = await asyncio.to_thread(self._seal_sync)
+                written = 0
+                for segment in segments:
+                    records = await asyncio.to_thread(self._read_segment, segment)
+                    for start in range(0, len(records), self.batch_size):
+                        written += await self._write_batch(segment, start, records[start:start + self.batch_size])
+                    segment.unlink()
+                return written
+            finally:
+                # Closing the descriptor releases the lock
+                os.close(lock)
+
+    async def _write_batch(self, segment: Path, start: int, batch: List[dict]) -> int:
+        key = (segment.name, start)
+        if self._attempts.get(key, 0) < self.max_attempts:
+            try:
+                await self.writer(batch)
+                self._attempts.pop(key, None)
+                return len(batch)
+            except Exception as e:
+                if self.transient(e):
+                    raise
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                if self._attempts[key] < self.max_attempts:
+                    raise
+                print(f"Spool batch {segment.name}:{start} failed {self.max_attempts} times, writing it record by record")
+
+        written, dead = 0, []
+        for record in batch:
+            try:
+                await self.writer([record])
+                written += 1
+            except Exception as e:
+                if self.transient(e):
+                    # Retried record by record on the next flush
+                    raise
+                print(f"Moving spool record to {self.dead_letter_path.name}: {e!r}")
+                dead.append(record)
+        if dead:
+            await asyncio.to_thread(self._dead_letter_sync, dead)
+        self._attempts.pop(key, None)
+        return written
+
+    def _dead_letter_sync(self, records: List[dict]) -> None:
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    async def run(self, interval: float = SPOOL_FLUSH_INTERVAL, max_backoff: float = SPOOL_MAX_BACKOFF) -> None:
+        """Background flusher; backs off exponentially while the writer keeps failing."""
+        delay = interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                written = await self.flush()
+                if written:
+                    print(f"Spool flushed {written} records")
+                delay = interval
+            except Exception as e:
+                delay = min(delay * 2, max_backoff)
+                print(f"Spool flush failed, retrying in {delay:.0f}s: {e}")
@@ -0,0 +1,210 @@
+"""Local stand-in for the Z.ai monitor API.
+
+Serves the model-usage, tool-usage and quota/limit endpoints with synthetic
+data (deterministic per auth token, so every fake account gets its own
+stable series) or replays responses recorded by UsageFetcher with
+ZQUOTA_RECORD_DIR. Latency and error rate are configurable for load tests.
+
+    python stub_api.py --port 8090 --latency-ms 50 --error-rate 0.01
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8090/api/anthropic python fetch_usage.py
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+ENDPOINTS = {
+    "model": "/api/monitor/usage/model-usage",
+    "tool": "/api/monitor/usage/tool-usage",
+    "quota": "/api/monitor/usage/quota/limit",
+}
+
+# Request and injected-error counters, for load-test reporting
+STATS_KEY = web.AppKey("stats", dict)
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    series_points: int = 25
+    # Hour offset the stub pretends to live in; the fetcher detects it from x_time
+    tz_offset_hours: int = 8
+    replay_dir: Optional[str] = None
+    seed: int = 0
+
+
+def _account_rng(config: StubConfig, auth: str, salt: str = "") -> random.Random:
+    return random.Random(zlib.crc32(f"{config.seed}:{auth}:{salt}".encode()))
+
+
+def _hours(config: StubConfig) -> List[str]:
+    tz = timezone(timedelta(hours=config.tz_offset_hours))
+    latest = datetime.now(tz).replace(minute=0, second=0, microsecond=0)
+    return [
+        (latest - timedelta(hours=i)).strftime("%Y-%m-%d %H:%M")
+        for i in reversed(range(config.series_points))
+    ]
+
+
+def synthetic_model_usage(config: StubConfig, auth: str) -> dict:
+    x_time = _hours(config)
+    calls, tokens = [], []
+    for time_str in x_time:
+        # Seed per hour so repeated polls see the same history
+        rng = _account_rng(config, auth, time_str)
+        count = rng.randint(0, 120)
+        calls.append(count)
+        tokens.append(count * rng.randint(800, 4000))
+    return {
+        "x_time": x_time,
+        "modelCallCount": calls,
+        "tokensUsage": tokens,
+        "totalUsage": {
+            "totalModelCallCount": sum(calls),
+            "totalTokensUsage": sum(tokens),
+        },
+    }
+
+
+def synthetic_tool_usage(config: StubConfig, auth: str) -> dict:
+    x_time = _hours(config)
+    rng = _account_rng(config, auth, "tool")
+    network = [rng.randint(0, 10) for _ in x_time]
+    web_read = [rng.randint(0, 5) for _ in x_time]
+    zread = [rng.randint(0, 3) for _ in x_time]
+    return {
+        "x_time": x_time,
+        "networkSearchCount": network,
+        "webReadMcpCount": web_read,
+        "zreadMcpCount": zread,
+        "totalUsage": {
+            "totalNetworkSearchCount": sum(network),
+            "totalWebReadMcpCount": sum(web_read),
+            "totalZreadMcpCount": sum(zread),
+            "totalSearchMcpCount": sum(network) + sum(web_read) + sum(zread),
+            "toolDetails": [
+                {"modelName": "search-prime", "totalUsageCount": sum(network)},
+                {"modelName": "web-reader", "totalUsageCount": sum(web_read)},
+            ],
+        },
+    }
+
+
+def synthetic_quota_limit(config: StubConfig, auth: str) -> dict:
+    rng = _account_rng(config, auth, "quota")
+    total = 1000
+    current = rng.randint(0, total)
+    return {
+        "limits": [
+            {"type": "TOKENS_LIMIT", "percentage": rng.randint(0, 100)},
+            {
+                "type": "TIME_LIMIT",
+                "percentage": round(current * 100 / total),
+                "currentValue": current,
+                "usage": total,
+                "usageDetails": [
+                    {"modelCode": "search-prime", "usage": current // 2},
+                    {"modelCode": "web-reader", "usage": current - current // 2},
+                ],
+            },
+        ]
+    }
+
+
+SYNTHETIC = {
+    "model": synthetic_model_usage,
+    "tool": synthetic_tool_usage,
+    "quota": synthetic_quota_limit,
+}
+
+
+class Replay:
+    """Cycle through recorded <name>-<timestamp>.json responses per endpoint."""
+
+    def __init__(self, replay_dir: str):
+        self.files: Dict[str, List[str]] = {
+            name: sorted(glob.glob(os.path.join(replay_dir, f"{name}-*.json")))
+            for name in ENDPOINTS
+        }
+        self.positions = {name: 0 for name in ENDPOINTS}
+
+    def next(self, name: str) -> Optional[dict]:
+        files = self.files[name]
+        if not files:
+            return None
+        path = files[self.positions[name] % len(files)]
+        self.positions[name] += 1
+        with open(path) as f:
+            return json.load(f)
+
+
+def create_app(config: StubConfig) -> web.Application:
+    app = web.Application()
+    rng = random.Random(config.seed)
+    replay = Replay(config.replay_dir) if config.replay_dir else None
+    app[STATS_KEY] = {"requests": 0, "errors": 0}
+
+    def make_handler(name):
+        async def handler(request: web.Request) -> web.Response:
+            app[STATS_KEY]["requests"] += 1
+            delay = config.latency_ms + rng.uniform(0, config.jitter_ms)
+            if delay:
+                await asyncio.sleep(delay / 1000)
+
+            if rng.random() < config.error_rate:
+                app[STATS_KEY]["errors"] += 1
+                return web.json_response({"code": 500, "msg": "injected error"}, status=500)
+
+            if replay:
+                recorded = replay.next(name)
+                if recorded is not None:
+                    return web.json_response(recorded)
+
+            auth = request.headers.get("Authorization", "")
+            data = SYNTHETIC[name](config, auth)
+            return web.json_response({"code": 200, "msg": "success", "data": data, "success": True})
+
+        return handler
+
+    for name, path in ENDPOINTS.items():
+        app.router.add_get(path, make_handler(name))
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--series-points", type=int, default=25)
+    parser.add_argument("--tz-offset-hours", type=int, default=8)
+    parser.add_argument("--replay-dir")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        series_points=args.series_points,
+        tz_offset_hours=args.tz_offset_hours,
+        replay_dir=args.replay_dir,
+        seed=args.seed,
+    )
+    web.run_app(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
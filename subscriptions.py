@@ -0,0 +1,83 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+from sqlalchemy import delete, select
+
+from config import config
+from db_models import Subscription, async_session, dialect_insert, write_session
+
+
+def may_read(chat_id, account: str) -> bool:
+    """Whether a chat may subscribe to and read an account.
+
+    Admins and the legacy CHAT_ID may read every account, other chats only
+    the accounts whose `chat_ids` list them.
+    """
+    settings = config.current
+    chat_id = str(chat_id)
+    if chat_id in settings.admin_chat_ids or chat_id == settings.chat_id:
+        return True
+    return any(a.name == account and chat_id in a.chat_ids for a in settings.accounts)
+
+
+async def get_subscribers(accounts: Iterable[str]) -> Dict[str, List[str]]:
+    """Map each account name to the chat IDs subscribed to it and still allowed to read it.
+
+    The legacy CHAT_ID setting is treated as subscribed to every account.
+    """
+    accounts = list(accounts)
+    subscribers: Dict[str, List[str]] = defaultdict(list)
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(Subscription.account, Subscription.chat_id)
+            .where(Subscription.account.in_(accounts))
+            .order_by(Subscription.id)
+        )
+        for account, chat_id in result:
+            if may_read(chat_id, account):
+                subscribers[account].append(chat_id)
+
+    chat_id = config.current.chat_id
+    if chat_id:
+        for account in accounts:
+            if chat_id not in subscribers[account]:
+                subscribers[account].append(chat_id)
+
+    return subscribers
+
+
+async def add_subscription(chat_id: str, account: str) -> bool:
+    """Subscribe a chat to an account. Returns False if already subscribed."""
+    async with write_session() as session:
+        result = await session.execute(
+            dialect_insert(Subscription)
+            .values(chat_id=str(chat_id), account=account, created_at=datetime.now(timezone.utc))
+            .on_conflict_do_nothing(index_elements=["chat_id", "account"])
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+
+async def remove_subscription(chat_id: str, account: str) -> bool:
+    """Unsubscribe a chat from an account. Returns False if it was not subscribed."""
+    async with write_session() as session:
+        result = await session.execute(
+            delete(Subscription).where(
+                Subscription.chat_id == str(chat_id), Subscription.account == account
+            )
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+
+async def get_chat_accounts(chat_id: str) -> List[str]:
+    """Account names a chat is subscribed to (whether or not it may still read them)."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Subscription.account)
+            .where(Subscription.chat_id == str(chat_id))
+            .order_by(Subscription.id)
+        )
+        return list(result.scalars().all())
@@ -0,0 +1,243 @@
+"""Supervised background jobs with restart backoff and a graceful drain.
+
+Periodic jobs (the poller, the spool flusher, maintenance) run one cycle at
+a time. A cycle that raises is logged, and the next one waits twice as long
+as the last wait, up to the job's max_backoff; one success returns it to
+its interval. Services (the leader lock, the snapshot listener, servers)
+run until they return, and are restarted with backoff when they crash.
+
+stop() lets the cycle in flight finish, so a snapshot is never cut off in
+the middle of its transaction, and starts no new one. Whatever is still
+running at the deadline is cancelled. Services are cancelled after the
+periodic jobs, so leadership outlives the leader-only cycles.
+
+Every job keeps a JobHealth: its state, run and failure counts, the
+duration of its last cycle and its last error.
+"""
+import asyncio
+import html
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds the graceful drain may take before the remaining work is cancelled;
+# keep it below the container's stop grace period
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+# First restart delay of a crashed service, and the ceiling of every backoff
+JOB_RESTART_DELAY = float(os.getenv("JOB_RESTART_DELAY", "1"))
+JOB_MAX_BACKOFF = float(os.getenv("JOB_MAX_BACKOFF", "600"))
+
+
+@dataclass
+class JobHealth:
+    name: str
+    kind: str
+    state: str = "starting"
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_started_at: Optional[datetime] = None
+    last_finished_at: Optional[datetime] = None
+    # Seconds the last cycle (or service run) took
+    last_duration: Optional[float] = None
+    last_error: Optional[str] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.state != "cancelled" and not self.consecutive_failures
+
+
+class Supervisor:
+    """Runs and watches the background jobs of one process."""
+
+    def __init__(self, max_backoff: float = JOB_MAX_BACKOFF, restart_delay: float = JOB_RESTART_DELAY):
+        self.max_backoff = max_backoff
+        self.restart_delay = restart_delay
+        self.jobs: Dict[str, JobHealth] = {}
+        self._periodic: Dict[str, asyncio.Task] = {}
+        self._services: Dict[str, asyncio.Task] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._stopping = asyncio.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def periodic(
+        self,
+        name: str,
+        cycle: Callable[[], Awaitable],
+        interval: Union[float, Callable[[], float]],
+        when: Callable[[], bool] = None,
+        max_backoff: float = None,
+    ) -> None:
+        """Run `cycle` every `interval` seconds, first at once; cycles are skipped while `when()` is false.
+
+        `interval` may be a callable, read again before every wait.
+        """
+        health = self.jobs[name] = JobHealth(name, "periodic")
+        self._wake[name] = asyncio.Event()
+        self._periodic[name] = asyncio.create_task(
+            self._run_periodic(health, cycle, interval, when, max_backoff or self.max_backoff), name=name
+        )
+
+    def service(self, name: str, run: Callable[[], Awaitable]) -> None:
+        """Run `run()` until it returns, restarting it with backoff when it raises."""
+        health = self.jobs[name] = JobHealth(name, "service")
+        self._services[name] = asyncio.create_task(self._run_service(health, run), name=name)
+
+    def wake(self, *names: str) -> None:
+        """Start the next cycle of the named periodic jobs now instead of after their wait."""
+        for name in names:
+            if name in self._wake:
+                self._wake[name].set()
+
+    async def _wait(self, name: str, seconds: float) -> bool:
+        """Sleep up to `seconds`, less if woken or stopping; True when stopping."""
+        wake = self._wake.get(name)
+        waiters = [asyncio.ensure_future(self._stopping.wait())]
+        if wake is not None:
+            waiters.append(asyncio.ensure_future(wake.wait()))
+        try:
+            await asyncio.wait(waiters, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        if wake is not None:
+            wake.clear()
+        return self.stopping
+
+    async def _run_periodic(self, health, cycle, interval, when, max_backoff) -> None:
+        delay = 0.0
+        while not await self._wait(health.name, delay):
+            period = interval() if callable(interval) else interval
+            if when is not None and not when():
+                health.state = "standby"
+                delay = period
+                continue
+            health.state = "running"
+            health.last_started_at = datetime.now(timezone.utc)
+            start = time.monotonic()
+            try:
+                await cycle()
+            except Exception as e:
+                health.failures += 1
+                health.consecutive_failures += 1
+                health.last_error = f"{type(e).__name__}: {e}"
+                delay = min(period * 2 ** health.consecutive_failures, max(max_backoff, period))
+                print(f"Job {health.name} failed, retrying in {delay:.0f}s: {e}")
+            else:
+                health.consecutive_failures = 0
+                delay = period
+            finally:
+                health.runs += 1
+                health.last_duration = time.monotonic() - start
+                health.last_finished_at = datetime.now(timezone.utc)
+            health.state = "waiting" if not health.consecutive_failures else "backoff"
+        health.state = "stopped"
+
+    async def _run_service(self, health, run) -> None:
+        while not self.stopping:
+            health.state = "running"
+            health.runs += 1
+            health.last_started_at = datetime.now(timezone.utc)
+            start = time.monotonic()
+            try:
+                await run()
+                return
+            except Exception as e:
+                health.failures += 1
+                # A service that ran for a while before crashing starts its backoff over
+                if time.monotonic() - start > self.max_backoff:
+                    health.consecutive_failures = 0
+                health.consecutive_failures += 1
+                health.last_error = f"{type(e).__name__}: {e}"
+                delay = min(self.restart_delay * 2 ** (health.consecutive_failures - 1), self.max_backoff)
+                print(f"Service {health.name} crashed, restarting in {delay:.0f}s: {e}")
+                health.state = "backoff"
+            finally:
+                health.last_duration = time.monotonic() - start
+                health.last_finished_at = datetime.now(timezone.utc)
+                if health.state == "running":
+                    health.state = "stopped"
+            if await self._wait(health.name, delay):
+                break
+        health.state = "stopped"
+
+    async def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> bool:
+        """Drain periodic jobs, then cancel services; False if something had to be cancelled mid-cycle."""
+        self._stopping.set()
+        drained = True
+        periodic = list(self._periodic.values())
+        if periodic:
+            _, pending = await asyncio.wait(periodic, timeout=timeout)
+            for task in pending:
+                print(f"Job {task.get_name()} did not finish within {timeout:.0f}s, cancelling")
+                self.jobs[task.get_name()].state = "cancelled"
+                drained = False
+                task.cancel()
+        for task in self._services.values():
+            task.cancel()
+        await asyncio.gather(*periodic, *self._services.values(), return_exceptions=True)
+        return drained
+
+    def health(self) -> List[JobHealth]:
+        return list(self.jobs.values())
+
+
+class InFlight:
+    """Counts work in progress so shutdown can wait for it.
+
+    Usable as an aiogram outer middleware: dp.update.outer_middleware(in_flight).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self, handler, event, data):
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if not self.count:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """True once nothing is in flight, False if `timeout` passed first."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def format_health(jobs: List[JobHealth]) -> str:
+    lines = ["<b>Background jobs</b>"]
+    if not jobs:
+        lines.append("No jobs running.")
+    for job in jobs:
+        mark = "✅" if job.healthy else "⚠️"
+        line = f"{mark} {job.name}: {job.state}, {job.runs} runs"
+        if job.last_duration is not None:
+            line += f", last {job.last_duration * 1000:.0f}ms"
+        if job.last_finished_at is not None:
+            line += f" at {job.last_finished_at.strftime('%H:%M:%S')}"
+        if job.failures:
+            line += f", {job.failures} failures"
+        lines.append(line)
+        if job.last_error and not job.healthy:
+            lines.append(f"  - {html.escape(job.last_error[:200])}")
+    return "\n".join(lines)
+
+
+supervisor = Supervisor()
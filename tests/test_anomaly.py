@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from anomaly import AnomalyDetector, EwmaBaseline
+from db_models import AnomalyState
+from models import ModelUsagePoint
+
+
+def make_series(values, start=datetime(2026, 1, 5, tzinfo=timezone.utc)):
+    return [
+        ModelUsagePoint(time=start + timedelta(hours=i), call_count=v, tokens_usage=v * 1000)
+        for i, v in enumerate(values)
+    ]
+
+
+def make_detector(account="acc"):
+    detector = AnomalyDetector(z_threshold=4, min_samples=6)
+    for metric in ("call_count", "tokens_usage"):
+        detector._states[(account, metric)] = AnomalyState(account=account, metric=metric)
+    return detector
+
+
+def test_ewma_baseline_tracks_mean():
+    baseline = EwmaBaseline(AnomalyState(account="acc", metric="call_count"), span_hours=3)
+    for value in [10, 10, 10, 10]:
+        baseline.update(value)
+    assert baseline.state.mean == 10
+    assert baseline.state.variance == 0
+    assert baseline.z_score(10) == 0
+
+
+def test_spike_in_latest_hour_raises_alert():
+    detector = make_detector()
+    series = make_series([10, 12, 9, 11, 10, 10, 11, 9, 200])
+    alert = detector._observe("acc", "call_count", series)
+    assert alert is not None
+    assert alert.value == 200
+    assert alert.time == series[-1].time
+
+
+def test_normal_hour_and_repeat_do_not_alert():
+    detector = make_detector()
+    assert detector._observe("acc", "call_count", make_series([10, 12, 9, 11, 10, 10, 11, 9, 12])) is None
+
+    spike = make_series([10, 12, 9, 11, 10, 10, 11, 9, 200])
+    assert detector._observe("acc", "tokens_usage", spike) is not None
+    # Same hour on the next poll is not reported again
+    assert detector._observe("acc", "tokens_usage", spike) is None
+
+
+def test_completed_hours_are_folded_in_once():
+    detector = make_detector()
+    series = make_series([10, 10, 10, 10])
+    detector._observe("acc", "call_count", series)
+    detector._observe("acc", "call_count", series)
+    state = detector._states[("acc", "call_count")]
+    assert state.samples == 3
+    assert state.last_time == series[-2].time
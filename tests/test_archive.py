@@ -0,0 +1,42 @@
+from datetime import date, datetime, timedelta, timezone
+
+from archive import Frame, decode_day, encode_day
+
+DAY = date(2026, 1, 15)
+MIDNIGHT = datetime(2026, 1, 15, tzinfo=timezone.utc)
+
+
+def make_frames(count=200):
+    frames = []
+    for i in range(count):
+        quotas = {"TOKENS_LIMIT": (round(12.5 + i / 100, 2), 1000 + i, 50000)}
+        if i >= 150:
+            # A new quota type appears mid-day
+            quotas["TIME_LIMIT"] = (3.0, None, None)
+        tools = (i, 2 * i, 0, 3 * i) if i % 70 else (None, None, None, None)
+        frames.append(Frame(MIDNIGHT + timedelta(minutes=5 * i, milliseconds=i), 10 * i, 12345 * i, tools, quotas))
+    return frames
+
+
+def test_round_trip_keeps_every_frame():
+    frames = make_frames()
+    assert decode_day(DAY, encode_day(DAY, frames, keyframe_interval=60)) == frames
+
+
+def test_deltas_are_much_smaller_than_keyframes():
+    frames = make_frames()
+    sparse = encode_day(DAY, frames, keyframe_interval=1000)
+    dense = encode_day(DAY, frames, keyframe_interval=1)
+    assert len(sparse) * 2 < len(dense)
+    assert len(sparse) < 20 * len(frames)
+
+
+def test_decode_until_seeks_from_the_nearest_keyframe():
+    frames = make_frames()
+    data = encode_day(DAY, frames, keyframe_interval=60)
+    until = frames[130].created_at + timedelta(minutes=1)
+    decoded = decode_day(DAY, data, until=until)
+    assert decoded[-1] == frames[130]
+    # Started at a keyframe rather than at midnight
+    assert len(decoded) < 131
+    assert decode_day(DAY, data, until=MIDNIGHT - timedelta(seconds=1)) == []
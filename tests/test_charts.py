@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from chart_render import ChartData, render_chart_png
+from charts import ChartCache
+
+
+def test_chart_cache_evicts_least_recently_used():
+    cache = ChartCache(max_size=2)
+    cache.put(("a", "24h", 1), "f1")
+    cache.put(("a", "24h", 2), "f2")
+    assert cache.get(("a", "24h", 1)) == "f1"
+    cache.put(("b", "24h", 1), "f3")
+    assert cache.get(("a", "24h", 2)) is None
+    assert cache.get(("a", "24h", 1)) == "f1"
+
+
+def test_chart_cache_invalidate_account():
+    cache = ChartCache()
+    cache.put(("a", "24h", 1), "f1")
+    cache.put(("b", "24h", 1), "f2")
+    cache.invalidate_account("a")
+    assert cache.get(("a", "24h", 1)) is None
+    assert cache.get(("b", "24h", 1)) == "f2"
+
+
+def test_chart_cache_resize_keeps_recent_entries():
+    cache = ChartCache(max_size=3)
+    for i in range(3):
+        cache.put(("a", "24h", i), f"f{i}")
+    cache.get(("a", "24h", 0))
+    cache.resize(2)
+    assert cache.get(("a", "24h", 1)) is None
+    assert cache.get(("a", "24h", 0)) == "f0"
+    assert cache.get(("a", "24h", 2)) == "f2"
+
+
+def test_render_chart_png():
+    pytest.importorskip("matplotlib")
+    start = datetime(2026, 1, 5, tzinfo=timezone.utc)
+    times = [start + timedelta(hours=i) for i in range(6)]
+    data = ChartData(
+        account="default",
+        range_label="6h",
+        times=times,
+        calls=[1, 2, None, 4, 5, 6],
+        tokens=[100, 200, 300, None, 500, 600],
+        quotas={"Token usage(5 Hour)": [(t, 10.0 * i) for i, t in enumerate(times)]},
+    )
+    png = render_chart_png(data)
+    assert png.startswith(b"\x89PNG")
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from config import Config, Settings
+
+ENV = {
+    "ANTHROPIC_BASE_URL": "https://api.example.com/api/anthropic",
+    "ANTHROPIC_AUTH_TOKEN": "token",
+    "POLL_INTERVAL": "120",
+    "ADMIN_CHAT_IDS": "1, 2",
+}
+
+
+def test_file_overrides_environment():
+    settings = Settings.load(ENV, {})
+    assert [a.name for a in settings.accounts] == ["default"]
+    assert settings.poll_interval == 120
+    assert settings.admin_chat_ids == {"1", "2"}
+
+    settings = Settings.load(ENV, {
+        "poll_interval": 30,
+        "admin_chat_ids": [3],
+        "accounts": [{"name": "team", "base_url": "https://x", "auth_token": "t", "chat_ids": [42]}],
+    })
+    assert settings.poll_interval == 30
+    assert settings.admin_chat_ids == {"3"}
+    assert [a.name for a in settings.accounts] == ["team"]
+    assert settings.accounts[0].chat_ids == {"42"}
+
+
+@pytest.mark.parametrize("overrides", [{"poll_interval": 0}, {"chart_cache_size": -1}, {"pol_interval": 5}])
+def test_invalid_settings_are_rejected(overrides):
+    with pytest.raises(ValueError):
+        Settings.load(ENV, overrides)
+
+
+@pytest.mark.asyncio
+async def test_reload_applies_only_changes_and_keeps_settings_on_error(tmp_path, monkeypatch):
+    for name, value in ENV.items():
+        monkeypatch.setenv(name, value)
+    path = tmp_path / "config.toml"
+    config = Config(str(path))
+    calls = []
+    config.on_change(lambda settings, changed: calls.append(changed))
+    assert config.current.poll_interval == 120
+
+    path.write_text("poll_interval = 15\nanomaly_z_threshold = 5\n")
+    await config.watch()
+    assert calls == [["poll_interval", "anomaly_z_threshold"]]
+    assert config.current.poll_interval == 15
+
+    # Unchanged file: nothing to do
+    await config.watch()
+    assert len(calls) == 1
+
+    path.write_text("poll_interval = 'soon'\n")
+    os.utime(path, (0, 0))
+    with pytest.raises(ValueError):
+        await config.watch()
+    assert config.current.poll_interval == 15
+
+    path.unlink()
+    assert config.reload() == ["poll_interval", "anomaly_z_threshold"]
+    assert config.current.poll_interval == 120
@@ -0,0 +1,424 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy import delete, func, select
+
+from accounts import Account
+from anomaly import AnomalyDetector
+from api_timezone import ApiTimezones
+from config import Settings
+from db_models import (
+    AnomalyState,
+    ModelUsage,
+    ModelUsageTimeSeries,
+    QuotaLimit,
+    ToolUsage,
+    async_session,
+    dispose_engine,
+    init_db,
+    write_session,
+)
+from db_usage import build_snapshot, persist_snapshots, persist_usage
+from fetch_usage import UsageFetcher
+from history import load_history_page, page_window
+from models import ModelUsagePoint
+from recent import RecentUsage
+from reports import get_latest_usage_from_db, load_hourly_series_from_db
+from shards import ShardCoordinator
+from stub_api import StubConfig, create_app
+from subscriptions import add_subscription, get_subscribers, remove_subscription
+
+
+@pytest_asyncio.fixture
+async def sqlite_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'zquota.db'}")
+    await dispose_engine()
+    await init_db()
+    yield
+    await dispose_engine()
+
+
+async def fetch_from_stub(auth_token="acc-1"):
+    server = TestServer(create_app(StubConfig(series_points=24)), host="127.0.0.1")
+    await server.start_server()
+    try:
+        fetcher = UsageFetcher(
+            base_url=f"http://127.0.0.1:{server.port}/api/anthropic", auth_token=auth_token
+        )
+        return await fetcher.fetch_all()
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_persist_and_read_latest_usage(sqlite_db):
+    data = await fetch_from_stub()
+    await persist_usage("acc-1", data)
+
+    model, tool, quotas = await get_latest_usage_from_db("acc-1")
+    assert model.total_model_call_count == data["model"].total_usage.total_model_call_count
+    assert tool is not None
+    assert len(quotas) == len(data["quota"].limits)
+    assert model.created_at.tzinfo is not None
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(ModelUsageTimeSeries.time).order_by(ModelUsageTimeSeries.time)
+        )
+        times = list(result.scalars())
+    # Stored as UTC, read back as the same instant
+    assert times == sorted(p.time for p in data["model"].parsed_time_series)
+
+
+@pytest.fixture
+def chat_access(monkeypatch):
+    import subscriptions
+
+    settings = Settings(
+        accounts=(
+            Account("acc-1", "https://x", "t", chat_ids=frozenset({"42"})),
+            Account("acc-2", "https://x", "t"),
+        ),
+        admin_chat_ids=frozenset({"1"}),
+    )
+    monkeypatch.setattr(subscriptions.config, "_current", settings)
+
+
+@pytest.mark.asyncio
+async def test_subscriptions_are_idempotent(sqlite_db, chat_access):
+    assert await add_subscription("42", "acc-1") is True
+    assert await add_subscription("42", "acc-1") is False
+    subscribers = await get_subscribers(["acc-1", "acc-2"])
+    assert "42" in subscribers["acc-1"]
+    assert "42" not in subscribers["acc-2"]
+    assert await remove_subscription("42", "acc-1") is True
+    assert await remove_subscription("42", "acc-1") is False
+
+
+@pytest.mark.asyncio
+async def test_chats_only_read_the_accounts_they_are_allowed(sqlite_db, chat_access):
+    from subscriptions import may_read
+
+    assert may_read(42, "acc-1") and not may_read(42, "acc-2")
+    assert may_read("1", "acc-2") and not may_read("7", "acc-1")
+
+    # Subscriptions made before the allow-list stop receiving reports
+    await add_subscription("7", "acc-1")
+    await add_subscription("1", "acc-2")
+    subscribers = await get_subscribers(["acc-1", "acc-2"])
+    assert subscribers["acc-1"] == [] and subscribers["acc-2"] == ["1"]
+
+
+@pytest.mark.asyncio
+async def test_anomaly_state_upsert(sqlite_db):
+    start = datetime(2026, 1, 5, tzinfo=timezone(timedelta(hours=8)))
+    series = [
+        ModelUsagePoint(time=start + timedelta(hours=i), call_count=10, tokens_usage=1000)
+        for i in range(8)
+    ]
+    await AnomalyDetector().observe("acc-1", series)
+    await AnomalyDetector().observe("acc-1", series + [
+        ModelUsagePoint(time=start + timedelta(hours=8), call_count=10, tokens_usage=1000)
+    ])
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(AnomalyState).where(AnomalyState.metric == "call_count")
+        )
+        states = list(result.scalars())
+    assert len(states) == 1
+    assert states[0].samples == 8
+    assert states[0].last_time == start + timedelta(hours=7)
+
+
+@pytest.mark.asyncio
+async def test_replayed_snapshots_are_stored_once(sqlite_db):
+    snapshot = build_snapshot("acc-1", await fetch_from_stub())
+    await persist_snapshots([snapshot])
+    await persist_snapshots([snapshot, snapshot])
+
+    async with async_session() as session:
+        result = await session.execute(select(func.count()).select_from(ModelUsage))
+        assert result.scalar() == 1
+        result = await session.execute(select(func.count()).select_from(ModelUsageTimeSeries))
+        assert result.scalar() == len(snapshot["series"])
+
+
+@pytest.mark.asyncio
+async def test_recent_usage_warms_from_database(sqlite_db):
+    data = await fetch_from_stub()
+    await persist_usage("acc-1", data)
+
+    recent = RecentUsage(hours=48)
+    await recent.warm(["acc-1"])
+    buffer = recent.get("acc-1")
+    model, _, quotas = await get_latest_usage_from_db("acc-1")
+    assert buffer.model.total_model_call_count == model.total_model_call_count
+    assert len(buffer.quotas) == len(quotas)
+    since = datetime.now(timezone.utc) - timedelta(hours=24)
+    assert buffer.covers(since)
+    assert buffer.series_since(since) == await load_hourly_series_from_db("acc-1", since)
+
+
+@pytest.mark.asyncio
+async def test_recent_usage_refreshes_snapshots_stored_elsewhere(sqlite_db):
+    data = await fetch_from_stub()
+    recent = RecentUsage(hours=48)
+    first = build_snapshot("acc-1", data, created_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+    recent.ingest(first)
+
+    # Another process stores a newer snapshot
+    second = build_snapshot("acc-1", data)
+    second["model"]["total_model_call_count"] += 5
+    await persist_snapshots([first, second])
+
+    await recent.refresh("acc-1")
+    model, _, _ = recent.get("acc-1").latest()
+    assert model.created_at == datetime.fromisoformat(second["created_at"])
+    assert model.total_model_call_count == first["model"]["total_model_call_count"] + 5
+
+
+@pytest.mark.asyncio
+async def test_api_timezone_is_cached_and_persisted(sqlite_db):
+    requested_at = datetime(2026, 1, 5, 12, 30, tzinfo=timezone.utc)
+    timezones = ApiTimezones(revalidate_seconds=3600)
+    tz = await timezones.resolve("ZAI", ["2026-01-05 19:00", "2026-01-05 20:00"], requested_at)
+    assert tz == timezone(timedelta(hours=8))
+
+    # A fresh process reuses the stored offset without looking at the response
+    restarted = ApiTimezones(revalidate_seconds=3600)
+    assert await restarted.resolve("ZAI", ["2026-01-05 12:00"], requested_at + timedelta(minutes=5)) == tz
+    # Once stale, the offset is checked against the response again
+    later = requested_at + timedelta(hours=2)
+    assert await restarted.resolve("ZAI", ["2026-01-05 14:00"], later) == timezone.utc
+
+
+@pytest.mark.asyncio
+async def test_history_aggregates_and_pages_in_database(sqlite_db):
+    data = await fetch_from_stub()
+    day = datetime(2026, 1, 5, tzinfo=timezone.utc)
+
+    def snapshot(created_at, first_hour, bumped_hour=None):
+        record = build_snapshot("acc-1", data, created_at=created_at)
+        record["series"] = [
+            {
+                "time": (day + timedelta(hours=h)).isoformat(),
+                "call_count": 3 if h == bumped_hour else 1,
+                "tokens_usage": 10,
+            }
+            for h in range(first_hour, first_hour + 24)
+        ]
+        return record
+
+    # The second snapshot repeats 23 hours and reports more calls for one of them
+    await persist_snapshots([
+        snapshot(day + timedelta(hours=24, minutes=30), 0),
+        snapshot(day + timedelta(hours=25, minutes=30), 1, bumped_hour=23),
+    ])
+
+    since = day - timedelta(days=7)
+    before = day + timedelta(days=2)
+    days = await load_history_page("acc-1", "day", since, before)
+    assert [(r.bucket, r.calls, r.tokens, r.hours) for r in days] == [
+        (day + timedelta(days=1), 1, 10, 1),
+        (day, 26, 240, 24),
+    ]
+    weeks = await load_history_page("acc-1", "week", since, before)
+    assert [(r.bucket, r.calls) for r in weeks] == [(day, 27)]
+
+    # Keyset pages: each starts where the previous one ended
+    first = await load_history_page("acc-1", "hour", since, day + timedelta(hours=25), page_size=6)
+    assert [r.bucket.hour for r in first] == [0, 23, 22, 21, 20, 19]
+    cursor, _ = page_window(since, day + timedelta(hours=25), "hour", page_size=6)
+    older = await load_history_page("acc-1", "hour", since, cursor, page_size=6)
+    assert [r.bucket.hour for r in older] == [18, 17, 16, 15, 14, 13]
+
+
+@pytest.mark.asyncio
+async def test_accounts_are_sharded_without_double_polling(sqlite_db):
+    accounts = [f"acc-{i}" for i in range(20)]
+    now = datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)
+    first, second = ShardCoordinator("worker-a", lease_seconds=180), ShardCoordinator("worker-b", lease_seconds=180)
+
+    assert await first.assign(accounts, now) == accounts
+
+    # A joining worker waits for the accounts that hash to it to be handed back
+    assert await second.assign(accounts, now) == []
+    kept = await first.assign(accounts, now + timedelta(seconds=60))
+    taken = await second.assign(accounts, now + timedelta(seconds=60))
+    assert kept and taken
+    assert set(kept).isdisjoint(taken)
+    assert sorted(kept + taken) == sorted(accounts)
+
+    # A worker that stops heartbeating loses its accounts once its leases expire
+    assert await first.assign(accounts, now + timedelta(seconds=120)) == kept
+    assert await first.assign(accounts, now + timedelta(seconds=400)) == accounts
+    assert await second.assign(accounts, now + timedelta(seconds=400)) == []
+
+    await first.leave()
+    assert await second.assign(accounts, now + timedelta(seconds=460)) == accounts
+
+
+@pytest.mark.asyncio
+async def test_leases_are_renewed_per_account_and_handed_over(sqlite_db):
+    accounts = [f"acc-{i}" for i in range(8)]
+    now = datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)
+    first, second = ShardCoordinator("worker-a", lease_seconds=180), ShardCoordinator("worker-b", lease_seconds=180)
+    assert await first.assign(accounts, now) == accounts
+
+    # A cycle longer than the lease keeps what it renewed before polling
+    assert await first.claim("acc-0", now + timedelta(seconds=170))
+    late = await second.assign(accounts, now + timedelta(seconds=200))
+    assert "acc-0" not in late
+    assert late
+    for account in late:
+        assert not await first.claim(account, now + timedelta(seconds=210))
+
+    await second.leave()
+    now += timedelta(seconds=600)
+    assert await first.assign(accounts, now) == accounts
+
+    # The new owner takes moved accounts as soon as the old owner hands them back
+    await second.assign(accounts, now + timedelta(seconds=10))
+    assert second.pending and not await second.claim_pending(now + timedelta(seconds=15))
+    kept = await first.assign(accounts, now + timedelta(seconds=20))
+    taken = await second.claim_pending(now + timedelta(seconds=25))
+    assert taken and set(taken) == set(accounts) - set(kept)
+    assert second.pending == [] and sorted(second.accounts) == sorted(taken)
+
+    # The old owner skips an account once its lease is gone
+    assert not await first.claim(taken[0], now + timedelta(seconds=30))
+
+
+@pytest.mark.asyncio
+async def test_aggregates_follow_the_latest_snapshot(sqlite_db):
+    from aggregates import model_code_totals, quota_headroom, token_burn_ranking
+
+    data = await fetch_from_stub()
+    now = datetime.now(timezone.utc)
+    older = build_snapshot("acc-1", data, created_at=now - timedelta(minutes=1))
+    latest = build_snapshot("acc-1", data, created_at=now)
+    latest["series"][-1]["tokens_usage"] = (latest["series"][-1]["tokens_usage"] or 0) + 1000
+    other = build_snapshot("acc-2", data, created_at=now)
+
+    # Out of order, as a spool replay may deliver them
+    await persist_snapshots([latest, other])
+    await persist_snapshots([older])
+
+    ranking = await token_burn_ranking()
+    assert [r.account for r in ranking] == ["acc-1", "acc-2"]
+    assert ranking[0].tokens_24h == ranking[1].tokens_24h + 1000
+
+    totals = {(t.source, t.model_code): t for t in await model_code_totals()}
+    tool_details = json.loads(other["tool"]["tool_details_json"])
+    for detail in tool_details:
+        total = totals[("tool", detail["model_name"])]
+        assert total.usage == 2 * detail["total_usage_count"]
+        assert total.accounts == 2
+
+    headroom = {h.type: h for h in await quota_headroom()}
+    for quota in other["quotas"]:
+        assert headroom[quota["type"]].accounts == 2
+        assert headroom[quota["type"]].max_percentage == quota["percentage"]
+
+
+@pytest.mark.asyncio
+async def test_fleet_api_requires_token(sqlite_db, monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, "API_TOKEN", "t0ken")
+    await persist_usage("acc-1", await fetch_from_stub())
+
+    async with TestClient(TestServer(api.create_api_app())) as client:
+        response = await client.get("/api/fleet/ranking")
+        assert response.status == 401
+        response = await client.get("/api/fleet/ranking", headers={"Authorization": "Bearer t0ken"})
+        assert response.status == 200
+        assert [row["account"] for row in await response.json()] == ["acc-1"]
+
+    monkeypatch.setattr(api, "API_TOKEN", "")
+    async with TestClient(TestServer(api.create_api_app())) as client:
+        assert (await client.get("/api/fleet/ranking")).status == 404
+
+
+@pytest.mark.asyncio
+async def test_completed_days_are_archived_and_answer_after_retention(sqlite_db):
+    from archive import archive_completed_days, usage_at
+
+    data = await fetch_from_stub()
+    start = datetime(2026, 1, 1, 22, tzinfo=timezone.utc)
+    for i in range(6):
+        data["model"].total_usage.total_model_call_count += 1
+        await persist_snapshots([build_snapshot("acc-1", data, created_at=start + timedelta(hours=i))])
+
+    # Only 2026-01-01 is complete
+    assert await archive_completed_days(now=datetime(2026, 1, 2, 12, tzinfo=timezone.utc)) == (1, date(2026, 1, 2))
+    assert await archive_completed_days(now=datetime(2026, 1, 2, 12, tzinfo=timezone.utc)) == (0, date(2026, 1, 2))
+    at = start + timedelta(hours=1, minutes=30)
+    before = await usage_at("acc-1", at)
+
+    async with write_session() as session:
+        for table in (ModelUsageTimeSeries, ModelUsage, ToolUsage, QuotaLimit):
+            await session.execute(delete(table).where(table.created_at < datetime(2026, 1, 2, tzinfo=timezone.utc)))
+        await session.commit()
+
+    after = await usage_at("acc-1", at)
+    assert after == before
+    assert after.created_at == start + timedelta(hours=1)
+    assert after.quotas and after.tools[3] is not None
+    assert await usage_at("acc-1", start - timedelta(minutes=1)) is None
+
+
+@pytest.mark.asyncio
+async def test_late_rows_are_merged_and_archived_days_compacted(sqlite_db):
+    from archive import archive_completed_days, compact_archived_days, usage_at
+
+    data = await fetch_from_stub()
+    start = datetime(2026, 1, 1, 10, tzinfo=timezone.utc)
+    times = [start + timedelta(minutes=20 * i) for i in range(9)]
+    late = times.pop(4)
+    for created_at in times:
+        data["model"].total_usage.total_model_call_count += 1
+        await persist_snapshots([build_snapshot("acc-1", data, created_at=created_at)])
+
+    since, until = datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 1, 3, tzinfo=timezone.utc)
+    history = await load_history_page("acc-1", "hour", since, until, page_size=48)
+    assert await archive_completed_days(now=datetime(2026, 1, 2, 12, tzinfo=timezone.utc)) == (1, date(2026, 1, 2))
+
+    # A spooled snapshot of the archived day is replayed later
+    await persist_snapshots([build_snapshot("acc-1", data, created_at=late)])
+    assert await archive_completed_days(now=datetime(2026, 1, 2, 18, tzinfo=timezone.utc)) == (1, date(2026, 1, 2))
+    assert (await usage_at("acc-1", late + timedelta(minutes=1))).created_at == late
+
+    async with async_session() as session:
+        series_before = (await session.execute(select(func.count()).select_from(ModelUsageTimeSeries))).scalar()
+    assert await compact_archived_days(now=datetime(2026, 1, 20, tzinfo=timezone.utc)) == 1
+    assert await compact_archived_days(now=datetime(2026, 1, 20, tzinfo=timezone.utc)) == 0
+
+    async with async_session() as session:
+        kept = (await session.execute(select(ModelUsage.created_at).order_by(ModelUsage.created_at))).scalars().all()
+        series_after = (await session.execute(select(func.count()).select_from(ModelUsageTimeSeries))).scalar()
+    # The last snapshot of each hour stays; the archive still answers for the others
+    assert kept == [times[2], times[4], times[7]]
+    assert series_after * 5 < series_before
+    assert await load_history_page("acc-1", "hour", since, until, page_size=48) == history
+    assert (await usage_at("acc-1", times[1] + timedelta(minutes=1))).created_at == times[1]
+
+
+@pytest.mark.asyncio
+async def test_capped_archive_run_reports_the_oldest_pending_day(sqlite_db):
+    from archive import archive_completed_days
+
+    data = await fetch_from_stub()
+    for account, start in (("acc-1", datetime(2026, 1, 1, 12)), ("acc-2", datetime(2026, 1, 3, 12))):
+        for day in range(3):
+            created_at = start.replace(tzinfo=timezone.utc) + timedelta(days=day)
+            await persist_snapshots([build_snapshot(account, data, created_at=created_at)])
+
+    now = datetime(2026, 2, 1, tzinfo=timezone.utc)
+    # One day per account per run: retention has to keep everything from acc-1's second day
+    assert await archive_completed_days(now=now, days_per_run=1) == (2, date(2026, 1, 2))
+    assert await archive_completed_days(now=now, days_per_run=31) == (4, date(2026, 2, 1))
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from diagnostics import CycleProfiler, LoopLagMonitor, SlowCallbackSampler, Traces, stage
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_sees_blocking_call():
+    monitor = LoopLagMonitor(interval=0.01, warn_ms=10_000)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    time.sleep(0.1)  # block the loop
+    await asyncio.sleep(0.05)
+    task.cancel()
+    assert monitor.snapshot()["max_ms"] >= 50
+
+
+def test_loop_lag_p95_never_exceeds_max():
+    monitor = LoopLagMonitor(warn_ms=10_000)
+    for lag_ms in (0.1, 0.2, 0.3, 2.0):
+        monitor.record(lag_ms)
+    snapshot = monitor.snapshot()
+    assert snapshot["p95_ms"] <= snapshot["max_ms"] == 2.0
+
+
+@pytest.mark.asyncio
+async def test_stages_are_recorded_on_the_current_trace():
+    traces = Traces(history=2)
+    with stage("outside"):
+        pass
+
+    for _ in range(3):
+        with traces.trace("op"):
+            with stage("fetch"):
+                await asyncio.sleep(0.01)
+            with stage("format"):
+                pass
+
+    recent = traces.recent("op")
+    assert len(recent) == 2
+    assert [name for name, _ in recent[-1].stages] == ["fetch", "format"]
+    assert recent[-1].stages[0][1] >= 5
+    assert recent[-1].total_ms >= recent[-1].stages[0][1]
+
+
+@pytest.mark.asyncio
+async def test_slow_callback_sampler_names_the_coroutine():
+    sampler = SlowCallbackSampler(threshold_ms=20)
+
+    async def blocking_step():
+        time.sleep(0.05)
+
+    sampler.enable()
+    try:
+        await asyncio.create_task(blocking_step())
+    finally:
+        sampler.disable()
+    assert any("blocking_step" in name for _, name, _ in sampler.samples)
+
+    # Disabled again: nothing more is recorded
+    count = len(sampler.samples)
+    await asyncio.create_task(blocking_step())
+    assert len(sampler.samples) == count
+
+
+@pytest.mark.asyncio
+async def test_cycle_profiler_profiles_only_requested_cycle():
+    profiler = CycleProfiler(top=5)
+    calls = []
+
+    async def cycle():
+        calls.append(1)
+        await asyncio.sleep(0)
+
+    await profiler.run(cycle)
+    report = profiler.request()
+    await profiler.run(cycle)
+    assert "function calls" in await report
+    assert len(calls) == 2
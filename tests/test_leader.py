@@ -0,0 +1,37 @@
+import pytest
+
+import leader
+from leader import LeaderLock, lock_file_path
+
+
+@pytest.mark.asyncio
+async def test_only_one_process_holds_the_sqlite_leader_lock(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'zquota.db'}")
+    monkeypatch.setattr(leader, "LEADER_LOCK_FILE", str(tmp_path / "leader.lock"))
+    from db_models import dispose_engine
+
+    await dispose_engine()
+    first, second = LeaderLock(), LeaderLock()
+    try:
+        assert await first.try_acquire() is True
+        assert await second.try_acquire() is False
+        await first.release()
+        assert first.is_leader is False
+        assert await second.try_acquire() is True
+    finally:
+        await first.release()
+        await second.release()
+        await dispose_engine()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_lock_file_sits_next_to_the_database(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'zquota.db'}")
+    monkeypatch.setattr(leader, "LEADER_LOCK_FILE", "")
+    from db_models import dispose_engine
+
+    await dispose_engine()
+    try:
+        assert lock_file_path() == str(tmp_path / "zquota.db.leader.lock")
+    finally:
+        await dispose_engine()
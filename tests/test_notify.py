@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from notify import INSTANCE_ID, SnapshotListener, snapshot_payload
+
+
+@pytest.mark.asyncio
+async def test_listener_applies_other_processes_snapshots_only():
+    seen = []
+
+    async def on_snapshot(account, created_at):
+        seen.append((account, created_at))
+
+    listener = SnapshotListener(on_snapshot)
+    created_at = datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)
+    await listener._handle(snapshot_payload("acc-1", created_at))
+    await listener._handle(snapshot_payload("acc-1", created_at).replace(INSTANCE_ID, "elsewhere"))
+    await listener._handle("not json")
+    assert seen == [("acc-1", created_at)]
+
+
+@pytest.mark.asyncio
+async def test_listener_is_idle_without_postgres(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///zquota.db")
+
+    async def on_snapshot(account, created_at):
+        pass
+
+    listener = SnapshotListener(on_snapshot)
+    await listener.run()
+    assert listener.connected is False
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import offload
+
+
+def make_raw_model(points):
+    start = datetime(2026, 1, 1)
+    return {
+        "x_time": [(start + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M") for i in range(points)],
+        "modelCallCount": list(range(points)),
+        "tokensUsage": [i * 10 for i in range(points)],
+        "totalUsage": {"totalModelCallCount": 1, "totalTokensUsage": 1},
+    }
+
+
+@pytest.mark.asyncio
+async def test_large_payload_is_parsed_in_process_pool(monkeypatch):
+    monkeypatch.setattr(offload, "OFFLOAD_MIN_POINTS", 100)
+    tz = timezone(timedelta(hours=8))
+    try:
+        model = await offload.validate_model_usage(make_raw_model(500), tz)
+    finally:
+        offload.shutdown_executor()
+    assert len(model.parsed_time_series) == 500
+    assert model.parsed_time_series[-1].call_count == 499
+    assert model.parsed_time_series[0].time.utcoffset() == timedelta(hours=8)
+
+
+@pytest.mark.asyncio
+async def test_inline_mode_runs_on_the_loop(monkeypatch):
+    monkeypatch.setattr(offload, "OFFLOAD_MODE", "inline")
+    assert offload.get_executor() is None
+    assert await offload.run_cpu(sum, [1, 2, 3]) == 6
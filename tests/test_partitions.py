@@ -0,0 +1,17 @@
+from datetime import date
+
+from partitions import add_months, partition_ddl, partition_name
+
+
+def test_add_months_wraps_years():
+    assert add_months(date(2026, 11, 1), 1) == date(2026, 12, 1)
+    assert add_months(date(2026, 12, 1), 1) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+
+def test_partition_ddl_covers_one_month():
+    assert partition_name("quota_limit", date(2026, 3, 1)) == "quota_limit_p202603"
+    assert partition_ddl("quota_limit", date(2026, 12, 1)) == (
+        "CREATE TABLE IF NOT EXISTS quota_limit_p202612 PARTITION OF quota_limit "
+        "FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')"
+    )
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+from recent import RecentUsage
+from reports import format_usage_from_db
+
+START = datetime(2026, 1, 5, tzinfo=timezone.utc)
+
+
+def make_snapshot(created_at, points, percentage=10.0, account="acc"):
+    return {
+        "account": account,
+        "created_at": created_at.isoformat(),
+        "model": {"total_model_call_count": sum(c for _, c in points), "total_tokens_usage": 1000},
+        "series": [
+            {"time": t.isoformat(), "call_count": c, "tokens_usage": c * 100} for t, c in points
+        ],
+        "tool": {
+            "total_network_search_count": 1,
+            "total_web_read_mcp_count": 2,
+            "total_zread_mcp_count": 3,
+            "total_search_mcp_count": 4,
+            "tool_details_json": "[]",
+            "x_time_json": "[]",
+        },
+        "quotas": [
+            {"type": "Token usage(5 Hour)", "percentage": percentage, "current_usage": None, "total": None, "usage_details_json": None}
+        ],
+    }
+
+
+def hours(*values, start=START):
+    return [(start + timedelta(hours=i), v) for i, v in enumerate(values)]
+
+
+def test_ingest_serves_latest_snapshot():
+    recent = RecentUsage(hours=48)
+    recent.ingest(make_snapshot(START + timedelta(hours=2, minutes=5), hours(1, 2, 3)))
+
+    model, tool, quotas = recent.get("acc").latest()
+    assert model.total_model_call_count == 6
+    assert tool.total_search_mcp_count == 4
+    assert quotas[0].percentage == 10.0
+    assert "3 calls" in format_usage_from_db(model, tool, quotas)
+
+
+def test_overlapping_snapshots_keep_one_point_per_hour():
+    recent = RecentUsage(hours=48)
+    recent.ingest(make_snapshot(START + timedelta(hours=2, minutes=1), hours(1, 2, 3)))
+    recent.ingest(make_snapshot(START + timedelta(hours=3, minutes=1), hours(2, 5, 4, start=START + timedelta(hours=1))))
+    # An older snapshot arriving late does not replace the latest one
+    recent.ingest(make_snapshot(START + timedelta(hours=1), hours(9)))
+
+    buffer = recent.get("acc")
+    assert [calls for _, calls, _ in buffer.series_since(START)] == [1, 2, 5, 4]
+    assert buffer.model.created_at == START + timedelta(hours=3, minutes=1)
+
+
+def test_trim_drops_points_outside_window():
+    recent = RecentUsage(hours=2)
+    recent.ingest(make_snapshot(START + timedelta(hours=4), hours(1, 2, 3, 4, 5)))
+    buffer = recent.get("acc")
+    assert [t for t, _, _ in buffer.series_since(START)] == [START + timedelta(hours=h) for h in (2, 3, 4)]
+    # Not warmed from the database, so ranges are not claimed as complete
+    assert not buffer.covers(START + timedelta(hours=3))
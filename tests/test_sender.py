@@ -0,0 +1,57 @@
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from sender import TelegramSender
+
+
+class FakeBot:
+    def __init__(self, fail_times=0):
+        self.sent = []
+        self.fail_times = fail_times
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=chat_id, text=text),
+                message="Flood control exceeded",
+                retry_after=0,
+            )
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+@pytest.mark.asyncio
+async def test_send_many_delivers_to_every_chat():
+    bot = FakeBot()
+    sender = TelegramSender(bot, private_interval=0)
+    results = await sender.send_many([("1", "a"), ("2", "a"), ("3", "b")])
+    assert results == [True, True, True]
+    assert sorted(chat for chat, _, _ in bot.sent) == ["1", "2", "3"]
+
+
+@pytest.mark.asyncio
+async def test_same_chat_messages_are_spaced():
+    bot = FakeBot()
+    sender = TelegramSender(bot, private_interval=0.05)
+    await sender.send_many([("1", "a"), ("1", "b")])
+    first, second = bot.sent
+    assert second[2] - first[2] >= 0.045
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_retried():
+    bot = FakeBot(fail_times=2)
+    sender = TelegramSender(bot, private_interval=0, max_retries=3)
+    assert await sender.send("1", "hello") is True
+    assert len(bot.sent) == 1
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    bot = FakeBot(fail_times=5)
+    sender = TelegramSender(bot, private_interval=0, max_retries=1)
+    assert await sender.send("1", "hello") is False
+    assert bot.sent == []
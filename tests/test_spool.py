@@ -0,0 +1,111 @@
+import pytest
+
+from spool import Spool
+
+
+class FlakyWriter:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def __call__(self, records):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.batches.append(records)
+
+
+@pytest.mark.asyncio
+async def test_records_survive_failed_flush(tmp_path):
+    writer = FlakyWriter(failures=1)
+    spool = Spool(writer, directory=tmp_path, batch_size=2, fsync=False)
+    for i in range(3):
+        await spool.append({"n": i})
+
+    with pytest.raises(ConnectionError):
+        await spool.flush()
+    assert spool.pending_segments()
+
+    await spool.append({"n": 3})
+    assert await spool.flush() == 4
+    assert [[r["n"] for r in batch] for batch in writer.batches] == [[0, 1], [2], [3]]
+    assert spool.pending_segments() == []
+
+
+@pytest.mark.asyncio
+async def test_torn_last_line_is_skipped(tmp_path):
+    writer = FlakyWriter()
+    spool = Spool(writer, directory=tmp_path, fsync=False)
+    await spool.append({"n": 0})
+    with open(spool.active_path, "a") as f:
+        f.write('{"n": 1')
+
+    assert await spool.flush() == 1
+    assert writer.batches == [[{"n": 0}]]
+
+
+@pytest.mark.asyncio
+async def test_append_after_torn_line_keeps_the_new_record(tmp_path):
+    writer = FlakyWriter()
+    spool = Spool(writer, directory=tmp_path, fsync=False)
+    await spool.append({"a": 1})
+    with open(spool.active_path, "a") as f:
+        f.write('{"a": 2, "tor')
+    await spool.append({"a": 3})
+
+    assert await spool.flush() == 2
+    assert writer.batches == [[{"a": 1}, {"a": 3}]]
+
+
+@pytest.mark.asyncio
+async def test_poison_record_goes_to_dead_letter(tmp_path):
+    batches = []
+
+    async def writer(records):
+        if any(r["n"] == 1 for r in records):
+            raise KeyError("quotas")
+        batches.append(records)
+
+    spool = Spool(writer, directory=tmp_path, batch_size=10, fsync=False, max_attempts=2)
+    for i in range(3):
+        await spool.append({"n": i})
+
+    with pytest.raises(KeyError):
+        await spool.flush()
+    assert await spool.flush() == 2
+    assert batches == [[{"n": 0}], [{"n": 2}]]
+    assert spool.dead_letter_path.read_text() == '{"n":1}\n'
+    assert spool.pending_segments() == []
+
+
+@pytest.mark.asyncio
+async def test_outage_never_dead_letters(tmp_path):
+    writer = FlakyWriter(failures=5)
+    spool = Spool(writer, directory=tmp_path, fsync=False, max_attempts=2)
+    await spool.append({"n": 0})
+
+    for _ in range(5):
+        with pytest.raises(ConnectionError):
+            await spool.flush()
+    assert await spool.flush() == 1
+    assert not spool.dead_letter_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_spools_sharing_a_directory_lose_nothing(tmp_path):
+    import asyncio
+
+    writer = FlakyWriter()
+    # Separate instances stand in for separate processes
+    spools = [Spool(writer, directory=tmp_path, batch_size=7, fsync=False) for _ in range(3)]
+
+    async def produce(index, spool):
+        for i in range(30):
+            await spool.append({"n": index * 100 + i})
+            if i % 10 == 9:
+                await spool.flush()
+
+    await asyncio.gather(*(produce(i, spool) for i, spool in enumerate(spools)))
+    await spools[0].flush()
+    written = sorted(r["n"] for batch in writer.batches for r in batch)
+    assert written == sorted(i * 100 + n for i in range(3) for n in range(30))
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ("aiogram", "asyncpg", "aiohttp", "sqlalchemy.ext.asyncio")
+
+
+def imported_modules(module):
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+    proc = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print('\\n'.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return set(proc.stdout.split())
+
+
+@pytest.mark.parametrize("module", ["models", "fetch_usage", "db_models", "db_usage", "reports", "sender"])
+def test_import_is_light_and_needs_no_database_url(module):
+    loaded = imported_modules(module)
+    assert not [m for m in HEAVY_MODULES if m in loaded]
+
+
+def test_engine_is_created_on_first_use(monkeypatch):
+    import db_models
+
+    monkeypatch.setattr(db_models, "_engine", None)
+    monkeypatch.setattr(db_models, "_session_factory", None)
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    with pytest.raises(RuntimeError, match="DATABASE_URL"):
+        db_models.get_engine()
+
+    monkeypatch.setenv("DATABASE_URL", "postgresql://localhost/zquota")
+    assert db_models.get_async_database_url() == "postgresql+asyncpg://localhost/zquota"
+    assert db_models.get_engine() is db_models.get_engine()
+
+
+def test_engine_options_for_asyncpg(monkeypatch):
+    import db_models
+    from db_metrics import MeteredQueuePool
+
+    monkeypatch.setenv("DB_POOL_SIZE", "12")
+    monkeypatch.setenv("DB_STATEMENT_CACHE_SIZE", "0")
+    options = db_models.get_engine_options("postgresql+asyncpg://localhost/zquota")
+    assert options["poolclass"] is MeteredQueuePool
+    assert options["pool_size"] == 12
+    assert options["connect_args"] == {"prepared_statement_cache_size": 0}
+
+    sqlite_options = db_models.get_engine_options("sqlite+aiosqlite:///:memory:")
+    assert "pool_size" not in sqlite_options
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from supervisor import InFlight, Supervisor
+
+
+@pytest.mark.asyncio
+async def test_failing_cycles_back_off_and_recover():
+    supervisor = Supervisor(max_backoff=0.08)
+    calls = []
+
+    async def cycle():
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) <= 2:
+            raise RuntimeError("database down")
+
+    supervisor.periodic("flaky", cycle, 0.02)
+    await asyncio.sleep(0.3)
+    await supervisor.stop()
+
+    health = supervisor.jobs["flaky"]
+    assert health.failures == 2
+    assert health.consecutive_failures == 0
+    assert health.last_error == "RuntimeError: database down"
+    assert health.state == "stopped" and health.healthy
+    # 0.04s after the first failure, 0.08s after the second
+    assert calls[1] - calls[0] >= 0.035
+    assert calls[2] - calls[1] >= 0.075
+
+
+@pytest.mark.asyncio
+async def test_stop_lets_the_running_cycle_finish():
+    supervisor = Supervisor()
+    finished = []
+
+    async def cycle():
+        await asyncio.sleep(0.1)
+        finished.append(True)
+
+    supervisor.periodic("poller", cycle, 60)
+    await asyncio.sleep(0.02)
+    assert await supervisor.stop(timeout=5) is True
+    assert finished == [True]
+    assert supervisor.jobs["poller"].runs == 1
+    assert supervisor.jobs["poller"].last_duration >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_cycles_past_the_deadline():
+    supervisor = Supervisor()
+
+    async def cycle():
+        await asyncio.sleep(10)
+
+    supervisor.periodic("stuck", cycle, 60)
+    await asyncio.sleep(0.01)
+    assert await supervisor.stop(timeout=0.05) is False
+    assert supervisor.jobs["stuck"].state == "cancelled"
+
+
+@pytest.mark.asyncio
+async def test_crashed_service_is_restarted():
+    supervisor = Supervisor(restart_delay=0.01)
+    starts = []
+
+    async def service():
+        starts.append(True)
+        if len(starts) < 3:
+            raise ConnectionError("lost")
+        await asyncio.Event().wait()
+
+    supervisor.service("listener", service)
+    await asyncio.sleep(0.1)
+    assert len(starts) == 3
+    assert supervisor.jobs["listener"].state == "running"
+    await supervisor.stop()
+    assert supervisor.jobs["listener"].state == "stopped"
+
+
+@pytest.mark.asyncio
+async def test_gated_job_waits_for_wake():
+    supervisor = Supervisor()
+    leader = False
+    runs = []
+
+    async def cycle():
+        runs.append(True)
+
+    supervisor.periodic("maintenance", cycle, 3600, when=lambda: leader)
+    await asyncio.sleep(0.01)
+    assert supervisor.jobs["maintenance"].state == "standby"
+
+    leader = True
+    supervisor.wake("maintenance")
+    await asyncio.sleep(0.01)
+    assert runs == [True]
+    await supervisor.stop()
+
+
+@pytest.mark.asyncio
+async def test_in_flight_waits_for_handlers():
+    in_flight = InFlight()
+
+    async def handler(event, data):
+        await asyncio.sleep(0.05)
+
+    task = asyncio.create_task(in_flight(handler, None, {}))
+    await asyncio.sleep(0)
+    assert in_flight.count == 1
+    assert await in_flight.wait_idle(0.01) is False
+    assert await in_flight.wait_idle(1) is True
+    await task
+
+
+@pytest.mark.asyncio
+async def test_jobs_endpoint_reports_failing_jobs(monkeypatch):
+    import api
+
+    supervisor = Supervisor(max_backoff=60)
+    monkeypatch.setattr(api, "supervisor", supervisor)
+    monkeypatch.setattr(api, "API_TOKEN", "t0ken")
+
+    async def cycle():
+        raise RuntimeError("boom")
+
+    supervisor.periodic("poller", cycle, 30)
+    await asyncio.sleep(0.01)
+    try:
+        async with TestClient(TestServer(api.create_api_app())) as client:
+            response = await client.get("/api/jobs", headers={"Authorization": "Bearer t0ken"})
+            assert response.status == 503
+            [job] = (await response.json())["jobs"]
+            assert job["name"] == "poller" and job["healthy"] is False
+            assert job["last_error"] == "RuntimeError: boom"
+    finally:
+        await supervisor.stop()
@@ -1,6 +1,12 @@
+import os
+from datetime import datetime, timedelta, timezone
+
 import pytest
+from aiohttp.test_utils import TestServer
+
 from fetch_usage import process_quota_limit, UsageFetcher
 from models import ModelUsageResponse, ToolUsageResponse, QuotaLimitResponse
+from stub_api import StubConfig, create_app
 
 
 def test_process_quota_limit():
@@ -32,4 +38,83 @@ async def test_usage_fetcher_initialization():
     assert fetcher.auth_token == "test_token"
 
 
-# More tests could be added here to mock aiohttp and verify fetch_all
+async def start_stub(config):
+    server = TestServer(create_app(config), host="127.0.0.1")
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_against_stub():
+    server = await start_stub(StubConfig(series_points=24))
+    try:
+        fetcher = UsageFetcher(
+            base_url=f"http://127.0.0.1:{server.port}/api/anthropic", auth_token="acc-1"
+        )
+        data = await fetcher.fetch_all()
+    finally:
+        await server.close()
+
+    assert isinstance(data["model"], ModelUsageResponse)
+    assert len(data["model"].parsed_time_series) == 24
+    assert data["model"].total_usage.total_model_call_count == sum(data["model"].model_call_count)
+    assert isinstance(data["tool"], ToolUsageResponse)
+    assert [limit.type for limit in data["quota"].limits] == [
+        "Token usage(5 Hour)",
+        "MCP usage(1 Month)",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_raises_on_injected_error():
+    server = await start_stub(StubConfig(error_rate=1.0))
+    try:
+        fetcher = UsageFetcher(
+            base_url=f"http://127.0.0.1:{server.port}/api/anthropic", auth_token="acc-1"
+        )
+        with pytest.raises(Exception, match="HTTP 500"):
+            await fetcher.fetch_all()
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay(tmp_path):
+    record_dir = str(tmp_path)
+    server = await start_stub(StubConfig())
+    try:
+        recorder = UsageFetcher(
+            base_url=f"http://127.0.0.1:{server.port}/api/anthropic",
+            auth_token="acc-1",
+            record_dir=record_dir,
+        )
+        recorded = await recorder.fetch_all()
+    finally:
+        await server.close()
+    assert sorted(name.split("-")[0] for name in os.listdir(record_dir)) == ["model", "quota", "tool"]
+
+    # A differently seeded stub replaying the recording serves the same data
+    server = await start_stub(StubConfig(seed=42, replay_dir=record_dir))
+    try:
+        replayer = UsageFetcher(
+            base_url=f"http://127.0.0.1:{server.port}/api/anthropic", auth_token="acc-1"
+        )
+        replayed = await replayer.fetch_all()
+    finally:
+        await server.close()
+    assert replayed["model"].model_call_count == recorded["model"].model_call_count
+
+
+def test_model_times_use_timezone_from_context():
+    raw = {
+        "x_time": ["2026-01-05 20:00", "2026-01-05 21:00"],
+        "modelCallCount": [1, 2],
+        "tokensUsage": [10, 20],
+        "totalUsage": {"totalModelCallCount": 3, "totalTokensUsage": 30},
+    }
+    beijing = timezone(timedelta(hours=8))
+    model = ModelUsageResponse.model_validate(raw, context={"api_tz": beijing})
+    assert model.parsed_time_series[0].time == datetime(2026, 1, 5, 20, tzinfo=beijing)
+    assert model.parsed_time_series[1].call_count == 2
+    # Parsing one response never changes how another one is parsed
+    assert ModelUsageResponse.model_validate(raw).parsed_time_series[0].time.tzinfo == timezone.utc
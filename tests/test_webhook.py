@@ -0,0 +1,85 @@
+import asyncio
+import socket
+
+import aiohttp
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+
+import webhook
+from webhook import ConcurrencyLimit, serve_webhook
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def command_update(update_id, text="/ping"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 42, "type": "private"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_bounds_running_handlers():
+    limit = ConcurrencyLimit(2)
+    running, peak = 0, 0
+
+    async def handler(event, data):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*(limit(handler, None, {}) for _ in range(6)))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_webhook_dispatches_updates_and_checks_secret(monkeypatch):
+    port = free_port()
+    monkeypatch.setattr(webhook, "WEBHOOK_HOST", "127.0.0.1")
+    monkeypatch.setattr(webhook, "WEBHOOK_PORT", port)
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "s3cret")
+
+    handled = asyncio.Queue()
+    router = Router()
+
+    @router.message(Command("ping"))
+    async def ping(message):
+        await handled.put(message.message_id)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token="123456:TEST")
+    server = asyncio.create_task(serve_webhook(bot, dp, reuse_port=False))
+    try:
+        url = f"http://127.0.0.1:{port}{webhook.WEBHOOK_PATH}"
+        async with aiohttp.ClientSession() as session:
+            for _ in range(50):
+                try:
+                    async with session.post(url, json=command_update(1)) as response:
+                        assert response.status == 401
+                    break
+                except aiohttp.ClientConnectionError:
+                    await asyncio.sleep(0.05)
+
+            headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+            async with session.post(url, json=command_update(2), headers=headers) as response:
+                assert response.status == 200
+        assert await asyncio.wait_for(handled.get(), timeout=5) == 2
+    finally:
+        server.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await server
+        await bot.session.close()
@@ -0,0 +1,133 @@
+"""Webhook mode: Telegram pushes updates to an aiohttp server.
+
+BOT_MODE=webhook replaces long polling. Updates are acknowledged at once
+and handled in the background, at most WEBHOOK_CONCURRENCY at a time per
+process. With WEBHOOK_WORKERS > 1 that many processes share WEBHOOK_PORT
+(SO_REUSEPORT), so a local reverse proxy can forward to one address while
+the kernel spreads connections across workers. Account polling is
+sharded across the workers (see shards.py). The same app serves the JSON
+API (api.py).
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from dotenv import load_dotenv
+
+from api import register_api
+from supervisor import SHUTDOWN_TIMEOUT
+
+load_dotenv()
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Public HTTPS base URL Telegram posts to, e.g. https://bot.example.com
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Parallel deliveries Telegram may open (1-100), and updates handled at once per process
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "32"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+
+
+class ConcurrencyLimit(BaseMiddleware):
+    """Outer update middleware bounding how many updates are handled at once."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Point Telegram at WEBHOOK_URL; done once, not by every worker."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is required in webhook mode")
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    print(f"Webhook set to {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+
+async def serve_webhook(bot: Bot, dp: Dispatcher, reuse_port: bool = WEBHOOK_WORKERS > 1) -> None:
+    """Serve updates until cancelled."""
+    dp.update.outer_middleware(ConcurrencyLimit(WEBHOOK_CONCURRENCY))
+    app = web.Application()
+    register_api(app)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, reuse_port=reuse_port)
+    await site.start()
+    print(f"Serving webhook on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH} (pid {os.getpid()})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def _join(workers: List[multiprocessing.Process], timeout: float = None) -> None:
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for worker in workers:
+        worker.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+
+async def run_workers(target: Callable[[], None], count: int = WEBHOOK_WORKERS) -> None:
+    """Run `target` in `count` spawned processes until they all exit.
+
+    SIGTERM or SIGINT is passed on to the workers, which drain within
+    SHUTDOWN_TIMEOUT; any still running a little later are killed.
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=target, name=f"webhook-{i}") for i in range(count)]
+    for worker in workers:
+        worker.start()
+
+    loop = asyncio.get_running_loop()
+    shutdown = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, shutdown.set)
+    exited = asyncio.ensure_future(asyncio.to_thread(_join, workers))
+    stop_signal = asyncio.ensure_future(shutdown.wait())
+    try:
+        await asyncio.wait({exited, stop_signal}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stop_signal.cancel()
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        await asyncio.to_thread(_join, workers, SHUTDOWN_TIMEOUT + 5)
+        for worker in workers:
+            if worker.is_alive():
+                print(f"Worker {worker.name} did not stop in time, killing it")
+                worker.kill()
+                worker.join()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)